@@ -1,609 +1,308 @@
-import numpy as np
+import time
+script_start = time.perf_counter()
+import os
+import threading
 import pandas as pd
-import matplotlib.pyplot as plt
-from pathlib import Path
-import geopandas as gpd
-import folium
-import json, requests
-from urllib.request import urlopen
 import streamlit as st
-import sys
-from io import StringIO
-from streamlit_folium import st_folium
+from streamlit.runtime.scriptrunner import add_script_run_ctx
+from bess_isc import cache, dispatch, instrument, outliers, pipeline, rt, store
+
+## The geospatial and plotting stacks (geopandas, folium, altair) are imported where they are
+## first needed, by the pre-warm thread below or by the Run button, not on every script start.
+
+## '2022-2024' for consecutive test years, '2022, 2024' otherwise
+test_years_label = (f'{pipeline.TEST_YEARS[0]}-{pipeline.TEST_YEARS[-1]}'
+                    if list(pipeline.TEST_YEARS) == list(range(pipeline.TEST_YEARS[0], pipeline.TEST_YEARS[-1] + 1))
+                    else ', '.join(map(str, pipeline.TEST_YEARS)))
 
 st.set_page_config(page_title="Reference Prices for Batteries in ERCOT",layout='wide')
 st.title("Reference Prices for Batteries in ERCOT")
 st.write("This tool calculates uses historical settlement prices from ERCOT Hub Zones to calculate the revenues that a battery of a specified capacity and duration would be expected to make from arbitrage and ancillary services. These Reference Prices would then serve as a hypothetical price used to calculate an Index Storage Credit (ISCs). ISCs, inspired by the NYSERDA Bulk Energy Storage Program, are intended to cover the gap between Reference Prices and Strike Prices bid in by battery owners to incentivize development. Thus, they serve as a proxy for what level of incentives different types of batteries may need in the ERCOT market. See https://www.nyserda.ny.gov/All-Programs/Energy-Storage-Program/Developers-and-Contractors/Bulk-Storage-Incentives for more details on this program.")
-st.write("Methodology: Using hub zone DAM settlement prices (https://www.ercot.com/mp/data-products/data-product-details?id=NP4-180-ER) for energy and capacity from 2022 to 2024, this tool calculates daily arbitrage revenues expected for batteries less than or equal to 8-hours in duration (spread between the highest and lowest 0 - 8 hours in a day based on duration). For batteries with duration greater than 8-hours (medium to long-term energy storage), the tool calculates the weekly arbitrage revenues expected (spread between the highest and lowest priced hours during the week based on duration). Ancillary service revenues are assumed to be the average DAM capacity prices (https://www.ercot.com/mp/data-products/data-product-details?id=NP4-181-ER) for an entire month across all revenue streams (NON-SPIN, REG-DOWN, REG-UP, RRS, ECRS). These assumptions are not sophisticated by design to set a baseline expected operational strategy for batteries to estimate incentives.")
+st.write(f"Methodology: Using hub zone DAM settlement prices (https://www.ercot.com/mp/data-products/data-product-details?id=NP4-180-ER) for energy and capacity from {test_years_label}, this tool calculates daily arbitrage revenues expected for batteries less than or equal to 8-hours in duration (spread between the highest and lowest 0 - 8 hours in a day based on duration). For batteries with duration greater than 8-hours (medium to long-term energy storage), the tool calculates the weekly arbitrage revenues expected (spread between the highest and lowest priced hours during the week based on duration). Ancillary service revenues are assumed to be the average DAM capacity prices (https://www.ercot.com/mp/data-products/data-product-details?id=NP4-181-ER) for an entire month across NON-SPIN, REG-DOWN, REG-UP and RRS; the Hourly AS allocation option instead gives each hour to arbitrage or to the best paying product, ECRS included. These assumptions are not sophisticated by design to set a baseline expected operational strategy for batteries to estimate incentives.")
 st.write("The strike prices are estimated as the cost of new entry (CONE) to pay back the capital cost of a battery over 15 years based on NREL's estimated battery system costs in 2024 as a function of duration: y = 240.8x + 379.16 (https://docs.nrel.gov/docs/fy25osti/93281.pdf), where x is the duration and y is the capital cost in $/kW.")
-duration = st.slider('Select a battery duration (hours):',0,20,4,1)
+duration = st.slider('Select a battery duration (hours):',1,20,4,1)
 capacity = st.slider('Select a capacity (MW): ',0,1000,100,10)
+## Real-time REAP is only offered once RTM 15-minute prices have been dropped into ercot_data/rt/.
+has_rt = bool(rt.rt_sources())
+modes = [m for m in pipeline.ARBITRAGE_MODES if has_rt or m != 'Real-time REAP']
+mode = st.radio('Arbitrage revenues:', modes, horizontal=True, help='REAP pairs the highest and lowest priced hours of each day (or week). Optimal dispatch charges before it discharges within the battery\'s state of charge and loses energy on each round trip. Real-time REAP applies REAP to 15-minute real-time prices. Hourly AS allocation gives each hour to arbitrage or to the ancillary service product paying most for it, in place of the flat monthly capacity price.')
+efficiency = st.slider('Round-trip efficiency (%):',50,100,85,1, disabled=mode != 'Optimal dispatch') / 100
+if mode != 'Optimal dispatch':
+    efficiency = dispatch.EFFICIENCY
+## How outlier months are found and replaced before the test year is averaged (bess_isc/outliers.py);
+## the default comes from BESS_ISC_OUTLIERS.
+OUTLIER_RULES = {f'Default ({outliers.DEFAULT_RULE})': outliers.DEFAULT_RULE, 'z-score above 3': 'zscore:3',
+                 'More than 3 IQRs beyond the quartiles': 'iqr:3', 'No adjustment': 'none'}
+outlier_rule = OUTLIER_RULES[st.selectbox('Outlier months:', OUTLIER_RULES, help='Flagged months are replaced by the average of the same month in the other years. z-score and IQR are taken per hub zone over all of its months.')]
+
+## the xlsx/csv drops are ingested once into ercot_data/store; later runs only memory-map them.
+## Everything below is keyed on the dataset fingerprint so a new drop is picked up without a restart.
+
+@st.cache_resource
+def load_store(fingerprint):
+    return store.ensure_store()
+
+@st.cache_resource
+def load_arbitrage_table(fingerprint, mode, efficiency, points=tuple(store.HUBS)):
+    return pipeline.arbitrage_table(load_store(fingerprint), mode, efficiency, list(points))
+
+@st.cache_resource
+def load_rcps(fingerprint):
+    return pipeline.reference_capacity_prices(load_store(fingerprint))
+
+## one result cache for all sessions; see bess_isc/cache.py for the size and disk settings.
+
+@st.cache_resource
+def result_cache():
+    return cache.from_env()
+
+## Everything that depends only on duration (reference prices and strike price) is computed once
+## per duration and shared; capacity only rescales revenues below.
+
+@st.cache_resource(max_entries=32)
+def RP_core(duration, fingerprint, mode='REAP', efficiency=dispatch.EFFICIENCY, outlier_rule=outliers.DEFAULT_RULE):
+    return pipeline.reference_prices(duration, load_store(fingerprint), load_arbitrage_table(fingerprint, mode, efficiency), load_rcps(fingerprint),
+                                     mode=mode, efficiency=efficiency, outlier_rule=outlier_rule)
+
+## Node-level reference prices for every settlement point in the store (hubs, hub averages, load zones).
+
+@st.cache_resource(max_entries=32)
+def point_prices(duration, fingerprint, mode='REAP', efficiency=dispatch.EFFICIENCY, outlier_rule=outliers.DEFAULT_RULE):
+    manifest = load_store(fingerprint)
+    points = tuple(store.settlement_points(manifest))
+    return pipeline.point_reference_prices(duration, manifest, load_arbitrage_table(fingerprint, mode, efficiency, points), load_rcps(fingerprint),
+                                           mode, efficiency, outlier_rule)
+
+@st.cache_resource(max_entries=32)
+def dam_rt_comparison(duration, capacity, fingerprint, outlier_rule=outliers.DEFAULT_RULE):
+    return pipeline.dam_rt_comparison(duration, capacity, load_store(fingerprint), load_rcps(fingerprint), outlier_rule)
+
+## Test year revenues per hub zone and use (arbitrage, each AS product) of the hourly allocation.
+
+@st.cache_resource(max_entries=32)
+def as_breakdown(duration, capacity, fingerprint, efficiency=dispatch.EFFICIENCY, outlier_rule=outliers.DEFAULT_RULE):
+    from bess_isc import ancillary
+    core = RP_core(duration, fingerprint, pipeline.ALLOCATION_MODE, efficiency, outlier_rule)
+    return ancillary.annual_revenues(ancillary.revenue_breakdown(duration, capacity, load_store(fingerprint), core))
+
+## The hub zone geometry depends on neither slider: simplified once into compact GeoJSON and kept
+## per process; each run only colours it with the current per-zone values.
+
+@st.cache_resource
+def hub_zone_features():
+    from bess_isc import geometry
+    return geometry.web_features()
+
+def RP_tables(duration, capacity, mode='REAP', efficiency=dispatch.EFFICIENCY, outlier_rule=outliers.DEFAULT_RULE):
+
+    fingerprint = store.dataset_fingerprint()
+
+    def compute():
+        core = RP_core(duration, fingerprint, mode, efficiency, outlier_rule)
+        revenues_df, total_revenues_df, max_hub_zone, hub_zone_descending, neg_hzs = pipeline.revenue_tables(core, capacity)
+        return core, revenues_df, total_revenues_df, max_hub_zone, hub_zone_descending, neg_hzs, core['strike_price']
+
+    return result_cache().get_or_compute((duration, capacity, fingerprint, mode, efficiency, outlier_rule), compute)
+
+## Startup latency of this server process: its first script run (cold start), the first Run click
+## and the background pre-warm.
+
+@st.cache_resource
+def startup_metrics():
+    return {}
+
+## Started once per server process, on the first page load: while the user is still reading and
+## moving sliders, a background thread loads the store, the tables, the default reference prices
+## and the hub zone geometry (and with them geopandas and folium) into the shared caches, so the
+## first click hits warm data. A click that arrives early simply waits on the same cache entries.
+## BESS_ISC_PREWARM=0 turns it off.
+
+@st.cache_resource
+def prewarm(duration=4, capacity=100):
+    def warm():
+        start = time.perf_counter()
+        try:
+            with instrument.span('prewarm', duration=duration, capacity=capacity):
+                RP_tables(duration, capacity)
+                point_prices(duration, store.dataset_fingerprint())
+                hub_zone_features()
+                from bess_isc import figures
+                import folium, streamlit_folium
+        except Exception as e:
+            startup_metrics()['prewarm_error'] = repr(e)
+        startup_metrics()['prewarm_ms'] = (time.perf_counter() - start) * 1000
 
-def RP_tables(duration, capacity):
-
-    DATA_DIR = Path('ercot_data')
-
-    capital_cost = 240.8 * duration + 379.16
-
-    total_cost = capital_cost * 1000 * capacity
-
-    annual_revenues_needed = total_cost/15
-
-    annual_revenues_needed_per_mw = annual_revenues_needed/capacity
-
-    if duration <= 8:
-        strike_price = (annual_revenues_needed_per_mw)/(365*duration)
-        strike_price = strike_price
-    else:
-        strike_price = (annual_revenues_needed_per_mw)/(52*duration)
-        strike_price = strike_price
-
-    ## First, extract the hub prices to calculate the REAP.
-
-    months = ['Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec']
-
-    dam_hub_2022 = []
-    dam_hub_2023 = []
-    dam_hub_2024 = []
-
-    for month in months:
-        dam_hub_2022.append(pd.read_excel(DATA_DIR/'DAM_Hub_Prices_2022.xlsx',sheet_name=month))
-        dam_hub_2023.append(pd.read_excel(DATA_DIR/'DAM_Hub_Prices_2023.xlsx',sheet_name=month))
-        dam_hub_2024.append(pd.read_excel(DATA_DIR/'DAM_Hub_Prices_2024.xlsx',sheet_name=month))
-
-    ## 2022 split out by hub zone.
-
-    dam_hub_2022_houston = []
-    dam_hub_2022_north = []
-    dam_hub_2022_pan = []
-    dam_hub_2022_south = []
-    dam_hub_2022_west = []
-
-    for i in range(0,12):
-        dam = dam_hub_2022[i]
-        dam_hub_2022_houston.append(dam[dam['Settlement Point'].isin(['HB_HOUSTON'])])
-        dam_hub_2022_north.append(dam[dam['Settlement Point'].isin(['HB_NORTH'])])
-        dam_hub_2022_pan.append(dam[dam['Settlement Point'].isin(['HB_PAN'])]) 
-        dam_hub_2022_south.append(dam[dam['Settlement Point'].isin(['HB_SOUTH'])])
-        dam_hub_2022_west.append(dam[dam['Settlement Point'].isin(['HB_WEST'])])
-
-    dam_hub_2022_houston = pd.concat(dam_hub_2022_houston).set_index('Delivery Date')
-    dam_hub_2022_north = pd.concat(dam_hub_2022_north).set_index('Delivery Date')
-    dam_hub_2022_pan = pd.concat(dam_hub_2022_pan).set_index('Delivery Date')
-    dam_hub_2022_south = pd.concat(dam_hub_2022_south).set_index('Delivery Date')
-    dam_hub_2022_west = pd.concat(dam_hub_2022_west).set_index('Delivery Date')
-
-    dam_hub_2022_houston.index = pd.to_datetime(dam_hub_2022_houston.index)
-    dam_hub_2022_north.index = pd.to_datetime(dam_hub_2022_north.index)
-    dam_hub_2022_pan.index = pd.to_datetime(dam_hub_2022_pan.index)
-    dam_hub_2022_south.index = pd.to_datetime(dam_hub_2022_south.index)
-    dam_hub_2022_west.index = pd.to_datetime(dam_hub_2022_west.index)
-
-    ## 2023 split out by hub zone.
-
-    dam_hub_2023_houston = []
-    dam_hub_2023_north = []
-    dam_hub_2023_pan = []
-    dam_hub_2023_south = []
-    dam_hub_2023_west = []
-
-    for i in range(0,12):
-        dam = dam_hub_2023[i]
-        dam_hub_2023_houston.append(dam[dam['Settlement Point'].isin(['HB_HOUSTON'])])
-        dam_hub_2023_north.append(dam[dam['Settlement Point'].isin(['HB_NORTH'])])
-        dam_hub_2023_pan.append(dam[dam['Settlement Point'].isin(['HB_PAN'])]) 
-        dam_hub_2023_south.append(dam[dam['Settlement Point'].isin(['HB_SOUTH'])])
-        dam_hub_2023_west.append(dam[dam['Settlement Point'].isin(['HB_WEST'])])
-
-    dam_hub_2023_houston = pd.concat(dam_hub_2023_houston).set_index('Delivery Date')
-    dam_hub_2023_north = pd.concat(dam_hub_2023_north).set_index('Delivery Date')
-    dam_hub_2023_pan = pd.concat(dam_hub_2023_pan).set_index('Delivery Date')
-    dam_hub_2023_south = pd.concat(dam_hub_2023_south).set_index('Delivery Date')
-    dam_hub_2023_west = pd.concat(dam_hub_2023_west).set_index('Delivery Date')
-
-    dam_hub_2023_houston.index = pd.to_datetime(dam_hub_2023_houston.index)
-    dam_hub_2023_north.index = pd.to_datetime(dam_hub_2023_north.index)
-    dam_hub_2023_pan.index = pd.to_datetime(dam_hub_2023_pan.index)
-    dam_hub_2023_south.index = pd.to_datetime(dam_hub_2023_south.index)
-    dam_hub_2023_west.index = pd.to_datetime(dam_hub_2023_west.index)
-
-    ## 2024 split out by hub zone.
-
-    dam_hub_2024_houston = []
-    dam_hub_2024_north = []
-    dam_hub_2024_pan = []
-    dam_hub_2024_south = []
-    dam_hub_2024_west = []
-
-    for i in range(0,12):
-        dam = dam_hub_2024[i]
-        dam_hub_2024_houston.append(dam[dam['Settlement Point'].isin(['HB_HOUSTON'])])
-        dam_hub_2024_north.append(dam[dam['Settlement Point'].isin(['HB_NORTH'])])
-        dam_hub_2024_pan.append(dam[dam['Settlement Point'].isin(['HB_PAN'])]) 
-        dam_hub_2024_south.append(dam[dam['Settlement Point'].isin(['HB_SOUTH'])])
-        dam_hub_2024_west.append(dam[dam['Settlement Point'].isin(['HB_WEST'])])
-
-    dam_hub_2024_houston = pd.concat(dam_hub_2024_houston).set_index('Delivery Date')
-    dam_hub_2024_north = pd.concat(dam_hub_2024_north).set_index('Delivery Date')
-    dam_hub_2024_pan = pd.concat(dam_hub_2024_pan).set_index('Delivery Date')
-    dam_hub_2024_south = pd.concat(dam_hub_2024_south).set_index('Delivery Date')
-    dam_hub_2024_west = pd.concat(dam_hub_2024_west).set_index('Delivery Date')
-
-    dam_hub_2024_houston.index = pd.to_datetime(dam_hub_2024_houston.index)
-    dam_hub_2024_north.index = pd.to_datetime(dam_hub_2024_north.index)
-    dam_hub_2024_pan.index = pd.to_datetime(dam_hub_2024_pan.index)
-    dam_hub_2024_south.index = pd.to_datetime(dam_hub_2024_south.index)
-    dam_hub_2024_west.index = pd.to_datetime(dam_hub_2024_west.index)
-
-    ## define a function that collapses each spreadsheet into the highest and lowest hours
-
-    def REAP(df, duration):
-        monthly_reap = []
-        for month in range(1,13):
-            df_month = df['Settlement Point Price'][df.index.month == month]
-            reap_list = []
-            if duration <= 8:
-                for day in df_month.index.day.unique():
-                    df_day = pd.DataFrame(df_month[df_month.index.day == day])
-                    df_day = df_day.sort_values(by='Settlement Point Price',ascending=False)
-                    df_high = df_day.iloc[0:duration]
-                    df_low = df_day.iloc[-duration:]
-                    df_low = df_low.sort_values(by='Settlement Point Price',ascending=True)
-                    df_merged = pd.DataFrame({'high':df_high['Settlement Point Price'].values,'low':df_low['Settlement Point Price'].values})
-                    df_merged['arbitrage'] = df_merged['high'] - df_merged['low']
-                    daily_reap = np.mean(df_merged['arbitrage'])
-                    reap_list.append(daily_reap)
-            else:
-                for week in df_month.index.isocalendar().week.unique():
-                    df_week = pd.DataFrame(df_month[df_month.index.isocalendar().week == week])
-                    df_week = df_week.sort_values(by='Settlement Point Price',ascending=False)
-                    df_high = df_week.iloc[0:duration]
-                    df_low = df_week.iloc[-duration:]
-                    df_low = df_low.sort_values(by='Settlement Point Price',ascending=True)
-                    df_merged = pd.DataFrame({'high':df_high['Settlement Point Price'].values,'low':df_low['Settlement Point Price'].values})
-                    df_merged['arbitrage'] = df_merged['high'] - df_merged['low']
-                    weekly_reap = np.mean(df_merged['arbitrage'])
-                    reap_list.append(weekly_reap)
-            reap_array = np.array(reap_list)
-            avg_reap = np.mean(reap_array)
-            monthly_reap.append(avg_reap)
-        return monthly_reap
-
-    reap_2022_houston = REAP(dam_hub_2022_houston,duration)
-    reap_2022_north = REAP(dam_hub_2022_north,duration)
-    reap_2022_pan = REAP(dam_hub_2022_pan,duration)
-    reap_2022_south = REAP(dam_hub_2022_south,duration)
-    reap_2022_west = REAP(dam_hub_2022_west,duration)
-
-    reap_2023_houston = REAP(dam_hub_2023_houston,duration)
-    reap_2023_north = REAP(dam_hub_2023_north,duration)
-    reap_2023_pan = REAP(dam_hub_2023_pan,duration)
-    reap_2023_south = REAP(dam_hub_2023_south,duration)
-    reap_2023_west = REAP(dam_hub_2023_west,duration)
-
-    reap_2024_houston = REAP(dam_hub_2024_houston,duration)
-    reap_2024_north = REAP(dam_hub_2024_north,duration)
-    reap_2024_pan = REAP(dam_hub_2024_pan,duration)
-    reap_2024_south = REAP(dam_hub_2024_south,duration)
-    reap_2024_west = REAP(dam_hub_2024_west,duration)
-
-    ## extract capacity prices for the Reference Cap Prices
-
-    dam_cap_2022 = pd.read_csv(DATA_DIR/'DAM_CapPrices2022.csv').set_index('Delivery Date')
-    dam_cap_2023 = pd.read_csv(DATA_DIR/'DAM_CapPrices2023.csv').set_index('Delivery Date')
-    dam_cap_2024 = pd.read_csv(DATA_DIR/'DAM_CapPrices2024.csv').set_index('Delivery Date')
-
-    dam_cap_2022.index = pd.to_datetime(dam_cap_2022.index)
-    dam_cap_2023.index = pd.to_datetime(dam_cap_2023.index)
-    dam_cap_2024.index = pd.to_datetime(dam_cap_2024.index)
-
-    def RCP(df):
-        monthly_rcp = []
-        for month in df.index.month.unique():
-            df_month = pd.DataFrame(df[df.index.month==month])
-            df_month['avg price'] = df_month[['REGDN','REGUP ','RRS','NSPIN']].mean(axis=1)
-            monthly_avg_rcp = np.mean(df_month['avg price'])
-            monthly_rcp.append(monthly_avg_rcp)
-        return monthly_rcp
-
-    rcp_2022 = RCP(dam_cap_2022)
-    rcp_2023 = RCP(dam_cap_2023)
-    rcp_2024 = RCP(dam_cap_2024)
-
-    ## 2023
-
-    RP_df_2022 = pd.DataFrame({'Reference Capacity Price':rcp_2022,
-                            'Houston Hub Zone REAP':reap_2022_houston,
-                            'North Hub Zone REAP':reap_2022_north,
-                            'Panhandle Hub Zone REAP':reap_2022_pan,
-                            'South Hub Zone REAP':reap_2022_south,
-                            'West Hub Zone REAP':reap_2022_west})
-
-    RP_df_2022.index = months
-
-    RP_df_2022['Houston Reference Price'] = RP_df_2022[['Reference Capacity Price','Houston Hub Zone REAP']].sum(axis=1)
-    RP_df_2022['North Reference Price'] = RP_df_2022[['Reference Capacity Price','North Hub Zone REAP']].sum(axis=1)
-    RP_df_2022['Panhandle Reference Price'] = RP_df_2022[['Reference Capacity Price','Panhandle Hub Zone REAP']].sum(axis=1)
-    RP_df_2022['South Reference Price'] = RP_df_2022[['Reference Capacity Price','South Hub Zone REAP']].sum(axis=1)
-    RP_df_2022['West Reference Price'] = RP_df_2022[['Reference Capacity Price','West Hub Zone REAP']].sum(axis=1)
-
-    RP_df_2022 = RP_df_2022.drop(columns=['Reference Capacity Price','Houston Hub Zone REAP','North Hub Zone REAP','Panhandle Hub Zone REAP','South Hub Zone REAP','West Hub Zone REAP'])
-
-        ## 2023
-
-    RP_df_2023 = pd.DataFrame({'Reference Capacity Price':rcp_2023,
-                                'Houston Hub Zone REAP':reap_2023_houston,
-                                'North Hub Zone REAP':reap_2023_north,
-                                'Panhandle Hub Zone REAP':reap_2023_pan,
-                                'South Hub Zone REAP':reap_2023_south,
-                                'West Hub Zone REAP':reap_2023_west})
-
-    RP_df_2023.index = months
-
-    RP_df_2023['Houston Reference Price'] = RP_df_2023[['Reference Capacity Price','Houston Hub Zone REAP']].sum(axis=1)
-    RP_df_2023['North Reference Price'] = RP_df_2023[['Reference Capacity Price','North Hub Zone REAP']].sum(axis=1)
-    RP_df_2023['Panhandle Reference Price'] = RP_df_2023[['Reference Capacity Price','Panhandle Hub Zone REAP']].sum(axis=1)
-    RP_df_2023['South Reference Price'] = RP_df_2023[['Reference Capacity Price','South Hub Zone REAP']].sum(axis=1)
-    RP_df_2023['West Reference Price'] = RP_df_2023[['Reference Capacity Price','West Hub Zone REAP']].sum(axis=1)
-
-    RP_df_2023 = RP_df_2023.drop(columns=['Reference Capacity Price','Houston Hub Zone REAP','North Hub Zone REAP','Panhandle Hub Zone REAP','South Hub Zone REAP','West Hub Zone REAP'])
-
-        ## 2024
-
-    RP_df_2024 = pd.DataFrame({'Reference Capacity Price':rcp_2024,
-                                'Houston Hub Zone REAP':reap_2024_houston,
-                                'North Hub Zone REAP':reap_2024_north,
-                                'Panhandle Hub Zone REAP':reap_2024_pan,
-                                'South Hub Zone REAP':reap_2024_south,
-                                'West Hub Zone REAP':reap_2024_west})
-
-    RP_df_2024.index = months
-
-    RP_df_2024['Houston Reference Price'] = RP_df_2024[['Reference Capacity Price','Houston Hub Zone REAP']].sum(axis=1)
-    RP_df_2024['North Reference Price'] = RP_df_2024[['Reference Capacity Price','North Hub Zone REAP']].sum(axis=1)
-    RP_df_2024['Panhandle Reference Price'] = RP_df_2024[['Reference Capacity Price','Panhandle Hub Zone REAP']].sum(axis=1)
-    RP_df_2024['South Reference Price'] = RP_df_2024[['Reference Capacity Price','South Hub Zone REAP']].sum(axis=1)
-    RP_df_2024['West Reference Price'] = RP_df_2024[['Reference Capacity Price','West Hub Zone REAP']].sum(axis=1)
-
-    RP_df_2024 = RP_df_2024.drop(columns=['Reference Capacity Price','Houston Hub Zone REAP','North Hub Zone REAP','Panhandle Hub Zone REAP','South Hub Zone REAP','West Hub Zone REAP'])
-
-        ## subplots 
-
-    fig, ax = plt.subplots(3,1,figsize=(8,8))
-    ax[0].plot(RP_df_2022)
-    ax[0].set_title(f'2022 Reference Prices by Hub Zone for {duration}-hr batteries')
-    ax[0].set_ylabel('$/MWh')
-    ax[0].legend(RP_df_2022.columns,loc='upper right')
-    ax[1].plot(RP_df_2023)
-    ax[1].set_title(f'2023 Reference Prices by Hub Zone for {duration}-hr batteries')
-    ax[1].set_ylabel('$/MWh')
-    ax[2].plot(RP_df_2024)
-    ax[2].set_title(f'2024 Reference Prices by Hub Zone for {duration}-hr batteries')
-    ax[2].set_ylabel('$/MWh')
-    plt.tight_layout()
-    fig.subplots_adjust(hspace=0.4)
-
-    ref_prices = fig
-
-        ## bar plots. Claude assisted with formatting.
-
-    fig, ax = plt.subplots(3,1,figsize=(15,10))
-    RP_df_2022.plot(kind='bar', figsize=(12, 6),ax=ax[0],legend=False)
-    ax[0].set_ylabel('Reference Price ($/MWh)')
-    ax[0].set_title(f'2022 Prices by Hub Zone Across Months {duration}-hr Batteries')
-    ax[0].set_ylim(0,1000)
-    RP_df_2023.plot(kind='bar', figsize=(12, 6),ax=ax[1],legend=False)
-    ax[1].set_ylabel('Reference Price ($/MWh)')
-    ax[1].set_title(f'2023 Prices by Hub Zone Across Months{duration}-hr Batteries')
-    ax[1].set_ylim(0,1000)
-    RP_df_2024.plot(kind='bar', figsize=(12, 6),ax=ax[2],legend=False)
-    ax[2].set_xlabel('Month')
-    ax[2].set_ylabel('Reference Price ($/MWh)')
-    ax[2].set_title(f'2024 Prices by Hub Zone Across Months {duration}-hr Batteries')
-    ax[2].set_ylim(0,1000)
-    plt.tight_layout()
-
-    handles, labels = ax[0].get_legend_handles_labels()
-    fig.legend(handles, labels, 
-                title='Hub Zones',
-                loc='upper right',
-                bbox_to_anchor=(0.98, 0.98),
-                framealpha=0.7)  # 0.7 = 70% opacity (0=transparent, 1=opaque)
-
-        ## August 2023 is dominant. Perhaps we should remove this outlier?
-
-    avg_hou_aug = ((RP_df_2022['Houston Reference Price'][RP_df_2022.index == 'Aug'].iloc[0]) + (RP_df_2024['Houston Reference Price'][RP_df_2024.index == 'Aug'].iloc[0]))/2
-    avg_north_aug = ((RP_df_2022['North Reference Price'][RP_df_2022.index == 'Aug'].iloc[0]) + (RP_df_2024['North Reference Price'][RP_df_2024.index == 'Aug'].iloc[0]))/2
-    avg_pan_aug = ((RP_df_2022['Panhandle Reference Price'][RP_df_2022.index == 'Aug'].iloc[0]) + (RP_df_2024['Panhandle Reference Price'][RP_df_2024.index == 'Aug'].iloc[0]))/2
-    avg_south_aug = ((RP_df_2022['South Reference Price'][RP_df_2022.index == 'Aug'].iloc[0]) + (RP_df_2024['South Reference Price'][RP_df_2024.index == 'Aug'].iloc[0]))/2
-    avg_west_aug = ((RP_df_2022['West Reference Price'][RP_df_2022.index == 'Aug'].iloc[0]) + (RP_df_2024['West Reference Price'][RP_df_2024.index == 'Aug'].iloc[0]))/2
-
-    RP_df_2023_aug_adjusted = RP_df_2023.copy()
-    RP_df_2023_aug_adjusted['Houston Reference Price'][RP_df_2023_aug_adjusted.index == 'Aug'] = avg_hou_aug
-    RP_df_2023_aug_adjusted['North Reference Price'][RP_df_2023_aug_adjusted.index == 'Aug'] = avg_north_aug
-    RP_df_2023_aug_adjusted['Panhandle Reference Price'][RP_df_2023_aug_adjusted.index == 'Aug'] = avg_pan_aug
-    RP_df_2023_aug_adjusted['South Reference Price'][RP_df_2023_aug_adjusted.index == 'Aug'] = avg_south_aug
-    RP_df_2023_aug_adjusted['West Reference Price'][RP_df_2023_aug_adjusted.index == 'Aug'] = avg_west_aug
-
-    fig, ax = plt.subplots(3,1,figsize=(8,8))
-    RP_df_2022.plot(kind='bar',ax=ax[0],legend=False)
-    ax[0].set_ylabel('Reference Price ($/MWh)')
-    ax[0].set_title(f'2022 Prices by Hub Zone Across Months {duration}-hr Batteries')
-    ax[0].set_ylim(0,1000)
-    RP_df_2023_aug_adjusted.plot(kind='bar',ax=ax[1],legend=False)
-    ax[1].set_ylabel('Reference Price ($/MWh)')
-    ax[1].set_title(f'2023 Prices by Hub Zone Across Months with August Adjusted {duration}-hr Batteries')
-    ax[1].set_ylim(0,1000)
-    RP_df_2024.plot(kind='bar',ax=ax[2],legend=False)
-    ax[2].set_xlabel('Month')
-    ax[2].set_ylabel('Reference Price ($/MWh)')
-    ax[2].set_title(f'2024 Prices by Hub Zone Across Months {duration}-hr Batteries')
-    ax[2].set_ylim(0,1000)
-    plt.tight_layout()
-
-    handles, labels = ax[0].get_legend_handles_labels()
-    fig.legend(handles, labels, 
-                title='Hub Zones',
-                loc='upper right',
-                bbox_to_anchor=(0.98, 0.98),
-                framealpha=0.7)  # 0.7 = 70% opacity (0=transparent, 1=opaque)
-
-    bar_ref_prices = fig
-
-        ## Test year for reference prices
-
-    RP_df_test_year = pd.DataFrame({'Houston Reference Price':np.mean([RP_df_2022['Houston Reference Price'],RP_df_2023_aug_adjusted['Houston Reference Price'],RP_df_2024['Houston Reference Price']],axis=0),
-                                            'North Reference Price':np.mean([RP_df_2022['North Reference Price'],RP_df_2023_aug_adjusted['North Reference Price'],RP_df_2024['North Reference Price']],axis=0),
-                                            'Panhandle Reference Price':np.mean([RP_df_2022['Panhandle Reference Price'],RP_df_2023_aug_adjusted['Panhandle Reference Price'],RP_df_2024['Panhandle Reference Price']],axis=0),
-                                            'South Reference Price':np.mean([RP_df_2022['South Reference Price'],RP_df_2023_aug_adjusted['South Reference Price'],RP_df_2024['South Reference Price']],axis=0),
-                                            'West Reference Price':np.mean([RP_df_2022['West Reference Price'],RP_df_2023_aug_adjusted['West Reference Price'],RP_df_2024['West Reference Price']],axis=0)})
-    RP_df_test_year.index = months
-
-    days_per_month = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-    month_number = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
-    energy = capacity * duration
-    Hou_rev_list = []
-    North_rev_list = []
-    Pan_rev_list = []
-    South_rev_list = []
-    West_rev_list = []
-    Strike_rev_list = []
-
-    if duration <= 8:
-        for i in month_number:
-            i = i - 1
-            Hou_revenue = (RP_df_test_year['Houston Reference Price'][i]) * energy * days_per_month[i]
-            Hou_rev_list.append(Hou_revenue)
-            North_revenue = (RP_df_test_year['North Reference Price'][i]) * energy * days_per_month[i]
-            North_rev_list.append(North_revenue)
-            Pan_revenue = (RP_df_test_year['Panhandle Reference Price'][i]) * energy * days_per_month[i]
-            Pan_rev_list.append(Pan_revenue)
-            South_revenue = (RP_df_test_year['South Reference Price'][i]) * energy * days_per_month[i]
-            South_rev_list.append(South_revenue)
-            West_revenue = (RP_df_test_year['West Reference Price'][i]) * energy * days_per_month[i]
-            West_rev_list.append(West_revenue)
-            Strike_revenue = strike_price * energy * days_per_month[i]
-            Strike_rev_list.append(Strike_revenue)
-    else:
-        for i in month_number:
-            weeks_per_month = 4.5
-            i = i - 1
-            Hou_revenue = (RP_df_test_year['Houston Reference Price'][i]) * energy * weeks_per_month
-            Hou_rev_list.append(Hou_revenue)
-            North_revenue = (RP_df_test_year['North Reference Price'][i]) * energy * weeks_per_month
-            North_rev_list.append(North_revenue)
-            Pan_revenue = (RP_df_test_year['Panhandle Reference Price'][i]) * energy * weeks_per_month
-            Pan_rev_list.append(Pan_revenue)
-            South_revenue = (RP_df_test_year['South Reference Price'][i]) * energy * weeks_per_month
-            South_rev_list.append(South_revenue)
-            West_revenue = (RP_df_test_year['West Reference Price'][i]) * energy * weeks_per_month
-            West_rev_list.append(West_revenue)
-            Strike_revenue = strike_price * energy * weeks_per_month
-            Strike_rev_list.append(Strike_revenue)
-
-    revenues_df = pd.DataFrame({'Houston Monthly Reference Revenue ($)':Hou_rev_list,'North Monthly Reference Revenue ($)':North_rev_list,
-                                'Panhandle Monthly Reference Revenue ($)':Pan_rev_list,'South Monthly Reference Revenue ($)':South_rev_list,
-                                'West Monthly Reference Revenue ($)':West_rev_list})
-    
-    revenues_df.index = months
-
-    total_test_year_revenues = {'Houston Hub Zone':[revenues_df['Houston Monthly Reference Revenue ($)'].sum(),sum(Strike_rev_list),sum(Strike_rev_list)-revenues_df['Houston Monthly Reference Revenue ($)'].sum()],
-                                'North Hub Zone':[revenues_df['North Monthly Reference Revenue ($)'].sum(),sum(Strike_rev_list),sum(Strike_rev_list)-revenues_df['North Monthly Reference Revenue ($)'].sum()],
-                                'Panhandle Hub Zone':[revenues_df['Panhandle Monthly Reference Revenue ($)'].sum(),sum(Strike_rev_list),sum(Strike_rev_list)-revenues_df['Panhandle Monthly Reference Revenue ($)'].sum()],
-                                'South Hub Zone':[revenues_df['South Monthly Reference Revenue ($)'].sum(),sum(Strike_rev_list),sum(Strike_rev_list)-revenues_df['South Monthly Reference Revenue ($)'].sum()],
-                                'West Hub Zone':[revenues_df['West Monthly Reference Revenue ($)'].sum(),sum(Strike_rev_list),sum(Strike_rev_list)-revenues_df['West Monthly Reference Revenue ($)'].sum()]}
-    
-    total_revenues_df = pd.DataFrame(total_test_year_revenues)
-    total_revenues_df.index = ['Annual Reference Revenues ($)','Annual Strike Price Revenues ($)','Index Storage Credits (Incentives Needed)']
-
-    hz_names = ['Houston','North','Panhandle','South','West']
-    neg_hzs = []
-
-    for i in range(len(total_revenues_df.columns)):
-        if total_revenues_df.iloc[2][i]<0:
-            hub_zone_negative = hz_names[i]
-            neg_hzs.append(hub_zone_negative)
-    
-    max_hub_zone = total_revenues_df.iloc[0].idxmax()
-
-    hub_zone_descending = total_revenues_df.iloc[2].sort_values(ascending=False).index.to_list()
-
-    fig, ax = plt.subplots(figsize=(12, 6))
-    RP_df_test_year.plot(kind='bar', figsize=(12, 6),ax=ax,legend=False)
-    ax.set_ylabel('Reference Price ($/MWh)')        
-    ax.set_title(f'Test Year (Average of 2022-2024) Prices by Hub Zone Across Months {duration}-hr Batteries')
-    plt.tight_layout()
-    ax.axhline(y=strike_price, color='red', linestyle='--', linewidth=1.5, label='Strike Price')
-
-    handles, labels = ax.get_legend_handles_labels()
-    fig.legend(handles, labels, 
-                title='Hub Zones',
-                loc='upper right',
-                bbox_to_anchor=(0.98, 0.98),
-                framealpha=0.7)  # 0.7 = 70% opacity (0=transparent, 1=opaque)
-
-    test_year = fig
-
-    ## reshape for mapping
-
-    RP_df_test_year = RP_df_test_year.T
-
-    df = RP_df_test_year
-    ## df = df.rename(columns={'Unnamed: 0': 'Hub Zone'})
-    ## df.set_index('Hub Zone', inplace=True)
-
-    hou_hub_counties = ['Montgomery','Waller','Harris','Fort Bend','Brazoria','Galveston','Chambers']
-
-    north_hub_counties = [
-        'Montague','Cooke','Grayson','Fannin','Lamar','Red River',
-        'Jack','Wise','Denton','Collin','Hunt','Hopkins','Delta','Franklin','Titus',
-        'Stephens','Palo Pinto','Parker','Tarrant','Dallas','Rockwall','Rains','Wood',
-        'Eastland','Erath','Hood','Somervell','Johnson','Ellis','Kaufman','Van Zandt','Smith',
-        'Brown','Comanche','Bosque','Hill','Navarro','Henderson','Smith','Rusk',
-        'San Saba', 'Mills','Hamilton','McLennan','Limestone','Freestone','Anderson','Cherokee',
-        'Nacogdoches','San Augustine','Angelina','Houston','Grimes','Madison','Brazos',
-        'Lampasas','Bell','Coryell','Falls','Robertson','Leon']
-
-    pan_hub_counties = [
-        "Dallam", "Hartley", "Oldham", "Deaf Smith", "Parmer", "Bailey", "Cochran",
-        "Hockley", "Sherman", "Hansford", "Ochiltree", "Lipscomb", "Roberts",
-        "Hemphill", "Wheeler", "Gray", "Carson", "Hutchinson", "Moore", "Potter",
-        "Armstrong", "Randall", "Donley", "Collingsworth", "Briscoe", "Castro",
-        "Swisher", "Floyd", "Motley", "Childress", "Hall", "Hale", "Lamb",
-        "Lubbock", "Crosby", "Dickens"
-    ]
-
-    south_hub_counties = [
-        "Maverick", "Zavala", "Frio", "Atascosa", "Karnes", "DeWitt", "Lavaca",
-        "Gonzales",'Milam', "Guadalupe",'Lee', "Comal", "Kendall", "Bandera", "Medina", "Bexar",
-        "Wilson",'Austin','Kerr','Wharton', "Goliad", 'Bastrop',"Victoria", "Calhoun", "Refugio", "Aransas",
-        "San Patricio", 'Gillespie','Jackson','Caldwell',"Bee",'Llano', 'Hays','Travis','Burnet',"Live Oak", "McMullen", "La Salle", "Dimmit", "Webb",
-        "Duval",'Fayette', "McCulloch", "Jim Wells",'Colorado','Blanco', "Nueces", "Kleberg", "Kenedy", "Brooks", "Starr",
-        "Hidalgo",'Williamson','Washington','Burleson',"Willacy", "Cameron", "Zapata", "Jim Hogg", "Matagorda", "Mason"
-    ]
-
-    west_hub_counties = [
-        "El Paso",'Wichita', "Cottle",'Hardeman','Wilbarger','Young',"Hudspeth", "Culberson", "Reeves", "Loving", "Winkler", "Ward",
-        "Crane", "Upton", "Reagan","Knox",'King', "Irion", "Jeff Davis", "Pecos", "Terrell",
-        "Crockett","Archer", "Schleicher", "Sutton", "Kimble", "Menard", "Presidio",
-        "Brewster", "Val Verde", "Edwards", "Real", "Kinney", "Uvalde", "Andrews",
-        "Martin", "Howard", "Mitchell", "Nolan", "Taylor", "Callahan",
-        "Baylor",'Tom Green',"Coleman", "Runnels", "Concho",
-        "Midland", "Glasscock", "Sterling", "Coke", "Ector", "Gaines",
-        "Dawson", "Borden", "Scurry", "Fisher", "Jones", "Shackelford", "Yoakum",
-        "Terry",'Foard','Clay', "Lynn", "Garza", "Kent", "Stonewall", "Haskell", "Throckmorton",
-    ]
-
-    ## Locate non-ercot counties: https://www.ercot.com/news/mediakit/maps
-
-    non_ercot_counties = ['Dallam','Sherman','Hansford','Ochiltree','Lipscomb','Moore','Hartley','Hutchinson','Hemphill','Bailey','Lamb','Cochran','Hockley',
-                        'Yoakum','Terry','Gaines','El Paso','Hudspeth','Bowie','Morris','Cass','Camp','Upshur','Marion','Harrison','Gregg','Panola','Shelby',
-                        'San Augustine','Sabine','Newston','Jasper','Tyler','Polk','Trinity','San Jacinto','Liberty','Hardin','Orange','Jefferson']
-
-    ## import TX counties shapefile
-
-    my_universal_path = Path("US_COUNTY_SHPFILE/US_county_cont.shp")
-
-    # read in a shapefile of US lower 48 counties, MUST SELECT the .shp!
-    us_county = gpd.read_file(my_universal_path)
-
-    us_county.head()
+    thread = threading.Thread(target=warm, name='bess-isc-prewarm', daemon=True)
+    add_script_run_ctx(thread)
+    thread.start()
+    return thread
 
-    # plotting maps: https://geopandas.org/en/stable/docs/user_guide/mapping.html
-    ## us_county.plot()
+if os.environ.get('BESS_ISC_PREWARM', '1') != '0':
+    prewarm()
 
-    # plot just the boundaries
-    ## us_county.boundary.plot(color="black")
+## Charts are only built for the panels picked here.
 
-    # get the limits of the gdf
-    ## us_county.total_bounds
-
-    # get the coordinate reference system (CRS)
-    ## us_county.crs
-
-    # can aggregate geometry on a column: https://geopandas.org/en/stable/docs/user_guide/aggregation_with_dissolve.html
-    us_states = us_county.dissolve(
-        by="STATE_NAME", aggfunc="sum"
-    )  # aggfunc: first (default), last, min, max, etc. BE CAREFULL!! Some columns don't make sense to sum, like names
-
-
-    # you can make a df from a gdf
-    us_df = pd.DataFrame(us_states)
-
-    ## downselect to TX counties
-    list(us_county)
-
-    tx_county = us_county[us_county["STATE_NAME"] == "Texas"]
-
-    ## tx_county.plot()
-
-    ## tx_county.boundary.plot()
-
-    tx = tx_county.dissolve(by="STATE_NAME", aggfunc="sum")
-
-    ercot_zones = tx_county[tx_county['NAME'].isin(hou_hub_counties + north_hub_counties + pan_hub_counties + south_hub_counties + west_hub_counties)]
-
-    non_ercot_zones = tx_county[tx_county['NAME'].isin(non_ercot_counties)]
-
-    ercot_zones['hub zone'] = np.nan
-    ercot_zones.loc[ercot_zones['NAME'].isin(hou_hub_counties), 'hub zone'] = 'HOU'
-    ercot_zones.loc[ercot_zones['NAME'].isin(north_hub_counties), 'hub zone'] = 'NORTH'
-    ercot_zones.loc[ercot_zones['NAME'].isin(pan_hub_counties), 'hub zone'] = 'PAN'
-    ercot_zones.loc[ercot_zones['NAME'].isin(south_hub_counties), 'hub zone'] = 'SOUTH'
-    ercot_zones.loc[ercot_zones['NAME'].isin(west_hub_counties), 'hub zone'] = 'WEST'
-
-    hub_polygons = ercot_zones.dissolve(by='hub zone',aggfunc='sum')
-
-    hub_polygons = gpd.overlay(hub_polygons,non_ercot_zones,how='difference')
-
-    hub_polygons.index = ['HOU','NORTH','PAN','SOUTH','WEST']
-
-    fig, ax = plt.subplots(figsize=(8, 8))
-    hub_polygons.plot(column=hub_polygons.index, legend=True, ax=ax)
-    ax.set_title("ERCOT Hub Zones", fontsize=16)
-    hubs_map = fig
-
-    hub_polygons_df = pd.DataFrame(hub_polygons)
-    df.index = hub_polygons_df.index
-    hub_polygons_df = hub_polygons_df.merge(df, left_index=True, right_index=True)
-    hub_polygons_df = hub_polygons_df.drop(columns=['OBJECTID','NAME','STATE_NAME','STATE_FIPS','CNTY_FIPS','FIPS','SQMI','Shape_Leng','Shape_Area'])
-    hub_polygons_df = gpd.GeoDataFrame(hub_polygons_df)
-
-    return ref_prices, bar_ref_prices, test_year, revenues_df, total_revenues_df, max_hub_zone, hub_zone_descending, neg_hzs, strike_price, hubs_map ## hub_polygons_df
+CHARTS = ['Hub zone map', 'Reference prices', 'Reference price bars', 'Test year']
+charts = st.multiselect('Charts to show:', CHARTS, default=CHARTS)
+map_metric = st.selectbox('Color hub zones by:', ['Index Storage Credits', 'Test year Reference Price'])
+diagnostics = st.toggle('Show diagnostics (stage timings, memory, cache)')
+
+startup = startup_metrics()
+startup.setdefault('cold_start_ms', (time.perf_counter() - script_start) * 1000)
 
 if st.button('Run'):
-    ref_prices, bar_ref_prices, test_year, revenues_df, total_revenues_df, max_hub_zone, hub_zone_descending, neg_hzs, strike_price, hubs_map = RP_tables(duration, capacity)
-
-    col1, col2, col3 = st.columns(3)
-
-    st.write(f'August 2023 is an outlier. Thus, August 2023 reference price is adjusted to equal the average of the 2022 and 2024 August RPs.')
-    
-    with col1:
-        st.pyplot(hubs_map, use_container_width=True)
-    
-    with col2:
-        st.pyplot(ref_prices, use_container_width=True)
-    
-    with col3:
-        st.pyplot(bar_ref_prices, use_container_width=True)
-
-    st.write(f'Below is the test year Reference Prices, calculated as the average of the 2022-2024 Reference Prices.')
-
-    st.pyplot(test_year, use_container_width=True)
-
-    st.dataframe(revenues_df.style.format('${:,.2f}'))
-
-    st.write(f'Below are the revenues for a {capacity} MW battery with a {duration}-hr duration.')
+    click_start = time.perf_counter()
+    from bess_isc import figures
+    with instrument.trace() as spans:
+        with instrument.span('run', duration=duration, capacity=capacity, mode=mode):
+            core, revenues_df, total_revenues_df, max_hub_zone, hub_zone_descending, neg_hzs, strike_price = RP_tables(duration, capacity, mode, efficiency, outlier_rule)
+
+        adjusted = outliers.describe(core['outliers'], list(core['RP_dfs']), pipeline.HUB_ZONES)
+        if adjusted:
+            st.write(f'Outliers ({outlier_rule}): {adjusted}. Their reference prices are adjusted to equal the average of the same month in the other years.')
+        else:
+            st.write(f'No outliers adjusted ({outlier_rule}): the test year averages the reference prices as they are.')
+
+        top_charts = [chart for chart in CHARTS[:3] if chart in charts]
+        for col, chart in zip(st.columns(3), top_charts):
+            with col, instrument.span('figures', chart=chart):
+                if chart == 'Hub zone map':
+                    from streamlit_folium import st_folium
+                    features = hub_zone_features()
+                    codes = [feature['properties']['hub zone'] for feature in features['features']]
+                    if map_metric == 'Index Storage Credits':
+                        zone_values, caption, fmt = total_revenues_df.loc['Index Storage Credits (Incentives Needed)'].values, 'Index Storage Credits ($)', '${:,.0f}'
+                    else:
+                        zone_values, caption, fmt = core['RP_df_test_year'].mean().values, 'Test year Reference Price ($/MWh)', '${:,.2f}'
+                    hub_map = figures.hub_zone_choropleth(features, dict(zip(codes, zone_values)), dict(zip(codes, pipeline.HUB_ZONES)), caption, fmt)
+                    st_folium(hub_map, height=360, use_container_width=True, returned_objects=[], key='hub_zone_map')
+                elif chart == 'Reference prices':
+                    st.altair_chart(figures.reference_price_chart(core), use_container_width=True)
+                else:
+                    st.altair_chart(figures.bar_reference_price_chart(core), use_container_width=True)
+
+        st.write(f'Below is the test year Reference Prices, calculated as the average of the {test_years_label} Reference Prices.')
+
+        if 'Test year' in charts:
+            with instrument.span('figures', chart='Test year'):
+                st.altair_chart(figures.test_year_chart(core), use_container_width=True)
+
+        st.dataframe(revenues_df.style.format('${:,.2f}', na_rep='n/a'))
+
+        st.write(f'Below are the revenues for a {capacity} MW battery with a {duration}-hr duration.')
     
-    st.write(f'For a {capacity} MW with a {duration}-hr duration, the estimated strike price (CONE) is ${round(strike_price,2)}/MWh.')
-
-    st.dataframe(total_revenues_df.style.format('${:,.2f}'))
-
-    st.write(f'The hub zone with the maximum reference revenues is: {max_hub_zone}')
-
-    if len(neg_hzs) == 5:
-        st.write(f'ERCOT generates sufficient revenues across all hub zones. No incentives are needed for {capacity} MW batteries with {duration}-hr duration.')
-    elif 0 < len(neg_hzs) < 5:
-        st.write(f'The following hub zones have sufficient reference prices at this strike price. No Index Storage Credits are needed: {neg_hzs}. The rest need incentives.')
+        st.write(f'For a {capacity} MW with a {duration}-hr duration, the estimated strike price (CONE) is ${round(strike_price,2)}/MWh.')
+
+        st.dataframe(total_revenues_df.style.format('${:,.2f}', na_rep='n/a'))
+
+        missing = [hz for hz, revenue in zip(pipeline.HUB_ZONES, total_revenues_df.iloc[0]) if pd.isna(revenue)]
+        if missing:
+            st.write(f'No test year revenues or ISCs for {missing}: their reference prices are missing in some test year months.')
+        if max_hub_zone is not None:
+            st.write(f'The hub zone with the maximum reference revenues is: {max_hub_zone}')
+
+        if len(neg_hzs) == 5:
+            st.write(f'ERCOT generates sufficient revenues across all hub zones. No incentives are needed for {capacity} MW batteries with {duration}-hr duration.')
+        elif 0 < len(neg_hzs) < 5:
+            st.write(f'The following hub zones have sufficient reference prices at this strike price. No Index Storage Credits are needed: {neg_hzs}. The rest need incentives.')
+        elif hub_zone_descending:
+            st.write(f'All hub zones have Reference Revenues below Strike Price revenues. Incentives may be needed. Hub zones with estimated ISCs ranked from highest to lowest: {hub_zone_descending}')
+
+        if has_rt:
+            with st.expander('DAM vs real-time (15-minute) Reference Prices and ISCs'):
+                st.dataframe(dam_rt_comparison(duration, capacity, store.dataset_fingerprint(), outlier_rule).style.format('{:,.2f}', na_rep='n/a'))
+
+        if mode == pipeline.ALLOCATION_MODE:
+            with st.expander('Test year revenues by ancillary service product', expanded=True):
+                st.dataframe(as_breakdown(duration, capacity, store.dataset_fingerprint(), efficiency, outlier_rule).style.format('${:,.0f}'))
+
+        with st.expander('Test year Reference Prices by settlement point'):
+            by_point = point_prices(duration, store.dataset_fingerprint(), mode, efficiency, outlier_rule)
+            test_year = by_point[by_point['year'] == 'Test Year'].pivot(index='month', columns='settlement_point', values='reference_price')
+            st.dataframe(test_year.reindex(store.MONTHS).style.format('${:,.2f}'))
+
+    startup.setdefault('first_click_ms', (time.perf_counter() - click_start) * 1000)
+    startup.setdefault('first_click_before_prewarm', 'prewarm_ms' not in startup)
+
+    if diagnostics:
+        with st.expander('Diagnostics', expanded=True):
+            stats = result_cache().stats()
+            st.caption('Startup: ' + ', '.join(f"{name.replace('_', ' ')} {value:,.0f}" if isinstance(value, float) else f"{name.replace('_', ' ')} {value}"
+                                               for name, value in startup.items()))
+            st.caption(f"Result cache: {stats['hits']} hits, {stats['disk_hits']} disk hits, {stats['misses']} misses, {stats['coalesced']} coalesced, {stats['entries']} entries ({stats['bytes'] / 1e6:.1f} of {stats['max_bytes'] / 1e6:.0f} MB)")
+            st.dataframe(pd.DataFrame(spans, columns=['stage','depth','elapsed_ms','rows','mem_delta_kb','year','duration','capacity','chart']).dropna(axis=1, how='all'))
+            recent_spans = instrument.recent()
+            st.download_button('Recent spans (JSON lines)', instrument.to_jsonl(recent_spans), 'spans.jsonl')
+            st.download_button('Recent stage metrics (Prometheus)', instrument.to_prometheus(recent_spans), 'metrics.prom')
+
+## CONE sensitivity: ISCs for every duration under ranges of battery cost assumptions. Reference
+## revenues come from the cached reference price cores, so moving these sliders only redoes the
+## strike price broadcast in sensitivity.py.
+
+if st.toggle('CONE sensitivity (cost curve and payback ranges)'):
+    from bess_isc import figures, sensitivity
+    col1, col2, col3 = st.columns(3)
+    slopes = col1.slider('Capital cost slope ($/kW per hour of duration):', 100.0, 400.0, (200.0, 280.0), 10.0)
+    intercepts = col2.slider('Capital cost intercept ($/kW):', 100.0, 600.0, (300.0, 450.0), 25.0)
+    paybacks = col3.slider('Payback period (years):', 5, 30, (10, 20), 1)
+    heatmap_parameter = st.selectbox('Heatmap rows:', sensitivity.COST_PARAMETERS, index=2, format_func=figures.ISC_AXIS_TITLES.get)
+
+    fingerprint = store.dataset_fingerprint()
+    with instrument.span('sensitivity', capacity=capacity) as s:
+        cores = {d: RP_core(d, fingerprint, mode, efficiency, outlier_rule) for d in range(1, 21)}
+        surface = sensitivity.isc_surface(cores, sensitivity.value_grid(*slopes, 10.0), sensitivity.value_grid(*intercepts, 25.0),
+                                          sensitivity.value_grid(*paybacks, 1), [capacity])
+        s['rows'] = len(surface)
+
+    st.write(f'Index Storage Credits for {capacity} MW batteries over {len(surface) // len(pipeline.HUB_ZONES):,} duration and cost combinations. '
+             f'The heatmap holds the other cost assumptions at the values closest to the NREL 2024 curve.')
+    st.altair_chart(figures.isc_heatmap(sensitivity.surface_slice(surface, heatmap_parameter), heatmap_parameter))
+    st.dataframe(surface, hide_index=True)
+    st.download_button('ISC surface (CSV)', surface.to_csv(index=False), 'cone_sensitivity.csv')
+
+## ISC uncertainty: block-bootstrapped test years around the 3-year test year. The per-period pool
+## is cached per duration and data; drawing samples is cheap enough to redo on every change.
+
+@st.cache_resource(max_entries=8)
+def bootstrap_pool(duration, fingerprint, mode, efficiency, outlier_rule):
+    from bess_isc import bootstrap
+    return bootstrap.period_pool(duration, load_store(fingerprint), mode, efficiency, outlier_rule=outlier_rule)
+
+if st.toggle('ISC uncertainty (bootstrapped test years)', disabled=mode not in pipeline.ARBITRAGE_MODES[:2]) and mode in pipeline.ARBITRAGE_MODES[:2]:
+    from bess_isc import bootstrap, figures
+    col1, col2 = st.columns(2)
+    n_samples = col1.select_slider('Synthetic test years:', [500, 1000, 2000, 5000, 10000], 2000)
+    seed = col2.number_input('Seed:', 0, 2**31 - 1, 0)
+
+    with instrument.span('bootstrap_app', duration=duration, capacity=capacity, rows=n_samples):
+        fingerprint = store.dataset_fingerprint()
+        samples = bootstrap.bootstrap(duration, capacity, n_samples, int(seed), pool=bootstrap_pool(duration, fingerprint, mode, efficiency, outlier_rule))
+        total_revenues_df = RP_tables(duration, capacity, mode, efficiency, outlier_rule)[2]
+        bands = bootstrap.percentile_bands(samples, total_revenues_df=total_revenues_df)
+
+    st.write(f'Index Storage Credits of {n_samples:,} synthetic test years for a {capacity} MW, {duration}-hr battery, '
+             f'resampling {"weeks" if duration > 8 else "7-day blocks of days"} within each month of {test_years_label} (outlier months left out). '
+             f'Whiskers are the 5th-95th percentiles, boxes the 25th-75th; red is the 3-year test year.')
+    st.altair_chart(figures.isc_band_chart(bands), use_container_width=True)
+    st.dataframe(bands.style.format('${:,.0f}'))
+
+## Test year windows: the test year over other spans of years, from prefix sums over the cached
+## core's adjusted reference prices (bess_isc/windows.py), so no window recomputes REAP.
+
+if st.toggle('Test year windows (rolling and custom spans of years)'):
+    from bess_isc import figures, windows
+    fingerprint = store.dataset_fingerprint()
+    window_spec = st.text_input('Windows:', 'trailing:1,trailing:2,trailing:3',
+                                help="Comma separated: a span such as '2022-2024', a single year such as '2023', or 'trailing:N' for every window of N consecutive years.")
+    try:
+        test_year_windows = windows.parse_windows(window_spec, store.years(load_store(fingerprint)))
+    except ValueError as e:
+        st.error(str(e))
     else:
-        st.write(f'All hub zones have Reference Revenues below Strike Price revenues. Incentives may be needed. Hub zones with estimated ISCs ranked from highest to lowest: {hub_zone_descending}')
\ No newline at end of file
+        with instrument.span('windows', duration=duration, capacity=capacity, rows=len(test_year_windows)):
+            window_iscs = windows.window_iscs(RP_core(duration, fingerprint, mode, efficiency, outlier_rule), test_year_windows, capacity)
+        st.write(f'Index Storage Credits of a {capacity} MW, {duration}-hr battery with the test year averaged over each window '
+                 f'(outlier months adjusted as above).')
+        st.altair_chart(figures.window_isc_chart(window_iscs), use_container_width=True)
+        st.dataframe(window_iscs.pivot(index='window', columns='hub_zone', values='isc').loc[[label for label, _, _ in test_year_windows]]
+                     .style.format('${:,.0f}'))
@@ -0,0 +1 @@
+## Reference price and Index Storage Credit (ISC) tools for batteries in ERCOT.
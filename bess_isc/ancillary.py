@@ -0,0 +1,154 @@
+## Hourly allocation of a battery between energy arbitrage and the ancillary service products.
+##
+##   python -m bess_isc.ancillary --duration 4 --capacity 100
+##
+## Instead of adding the flat monthly Reference Capacity Price to the REAP, every hour of a day (or
+## of an ISO week within a month, above 8 hours) goes to one use of the battery's MW:
+##
+##   - each AS product pays its hourly DAM capacity price per MW, derated for batteries shorter
+##     than the product's qualifying duration (NSPIN 4 hours, ECRS 2, the others 1), and an hour
+##     not used for arbitrage earns the best of them;
+##   - the REAP pairs (j-th highest with j-th lowest hour, j < duration and never sharing an hour)
+##     go to arbitrage only where the pair's spread beats the two hours' best AS offers.
+##
+## State of charge is not coupled to AS awards and every hour goes wholly to one use. The
+## allocation is a few sorts and gathers over (settlement points, periods, hours), so a month of
+## every point and duration takes milliseconds. Per-MW revenues per period, for arbitrage and for
+## each product, are averaged per month and kept next to the store as a monthly table (year x
+## month x point x duration x use); the reference price of the allocation is that revenue per MWh
+## of energy capacity, which the usual revenue layer scales to any capacity.
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from bess_isc import instrument, outliers, pipeline, reap, store
+
+PRODUCTS = store.CAP_PRODUCTS
+USES = ['Energy arbitrage'] + PRODUCTS
+QUALIFYING_HOURS = {'REGDN': 1, 'REGUP': 1, 'RRS': 1, 'NSPIN': 4, 'ECRS': 2}
+
+def derate(duration, products=PRODUCTS):
+    return np.array([min(1.0, duration / QUALIFYING_HOURS[product]) for product in products])
+
+## energy is a (series, periods, hours) cube of energy prices and capacity a (products, periods,
+## hours) cube of capacity prices on the same layout, NaN padded. Returns the per-MW revenue of
+## every period, (series, periods, uses), arbitrage first.
+
+def period_allocation(energy, capacity, duration):
+    offers = np.nan_to_num(capacity * derate(duration)[:, None, None], nan=0.0)
+    best = offers.max(axis=0)
+    choice = offers.argmax(axis=0)
+
+    count = (~np.isnan(energy)).sum(axis=-1)
+    order = np.argsort(energy, axis=-1)
+    pairs = np.arange(min(duration, energy.shape[-1] // 2))
+    low = order[..., pairs]
+    high = np.take_along_axis(order, np.clip(count[..., None] - 1 - pairs, 0, None), axis=-1)
+    spread = np.take_along_axis(energy, high, axis=-1) - np.take_along_axis(energy, low, axis=-1)
+    opportunity = np.take_along_axis(np.broadcast_to(best, energy.shape), high, axis=-1) + \
+                  np.take_along_axis(np.broadcast_to(best, energy.shape), low, axis=-1)
+    arbitrage = (pairs < count[..., None] // 2) & (spread > opportunity)
+
+    ## hours of the pairs that went to arbitrage; the other hours earn their best AS offer
+    used_low, used_high = np.zeros(energy.shape, dtype=bool), np.zeros(energy.shape, dtype=bool)
+    np.put_along_axis(used_low, low, arbitrage, axis=-1)
+    np.put_along_axis(used_high, high, arbitrage, axis=-1)
+    free = ~(used_low | used_high) & ~np.isnan(energy)
+
+    out = np.empty(energy.shape[:2] + (len(USES),))
+    out[..., 0] = np.where(arbitrage, spread, 0.0).sum(axis=-1)
+    for q in range(len(PRODUCTS)):
+        out[..., q + 1] = np.where(free & (choice == q), best, 0.0).sum(axis=-1)
+    return out
+
+## One month of every series: (series, uses) mean per-MW revenue per period.
+
+def monthly_allocation(hours, prices, cap_hours, cap_prices, duration):
+    if len(cap_hours) != len(hours) or (cap_hours != hours).any():
+        raise ValueError('capacity and energy prices do not line up hour by hour')
+    layout = reap.period_layout(hours, reap.default_period(duration))
+    revenue = period_allocation(reap.period_cube(prices, layout), reap.period_cube(cap_prices, layout), duration)
+    return revenue.mean(axis=1)
+
+## The (year x point x month x duration x use) table of mean per-MW revenues per period, for every
+## settlement point in the store; a month is recomputed when either its DAM or its capacity
+## partition changed (see store.monthly_table). Months without capacity prices are NaN.
+
+def build_as_table(manifest, max_duration=reap.MAX_DURATION, store_dir=store.STORE_DIR, rebuild=True):
+    points = store.settlement_points(manifest)
+
+    def compute(year, month):
+        present = [point for point in points if point in manifest['partitions'][store.partition_id('dam', year, month)]['points']]
+        hours, prices = store.load_hub_matrix(manifest, year, present, store_dir, months=[month])
+        cap_hours, cap_prices = store.load_cap_matrix(manifest, year, store_dir=store_dir, months=[month])
+        cell = np.full((len(points), max_duration, len(USES)), np.nan)
+        rows = [points.index(point) for point in present]
+        for duration in range(1, max_duration + 1):
+            cell[rows, duration - 1] = monthly_allocation(hours, prices, cap_hours, cap_prices, duration)
+        return cell
+
+    table = store.monthly_table('as_table', manifest, ['dam', 'cap'], (len(points), max_duration, len(USES)), compute,
+                                key={'points': points, 'max_duration': max_duration, 'products': PRODUCTS,
+                                     'qualifying_hours': QUALIFYING_HOURS},
+                                stage='ancillary', store_dir=store_dir, rebuild=rebuild)
+    return np.moveaxis(table, 1, 2)
+
+def load_as_table(manifest, points=store.HUBS, max_duration=reap.MAX_DURATION, store_dir=store.STORE_DIR):
+    with instrument.span('as_table'):
+        table = build_as_table(manifest, max_duration, store_dir, rebuild=False)
+        all_points = store.settlement_points(manifest)
+        return np.ascontiguousarray(table[:, [all_points.index(point) for point in points]])
+
+## Arbitrage table of the allocation, (year, point, month, duration) like reap.load_reap_table:
+## the total per-MW revenue of a period per MWh of energy capacity. It already holds the capacity
+## revenues, so the reference prices of this mode add no RCP on top.
+
+def allocation_table(manifest, points=store.HUBS):
+    table = load_as_table(manifest, points)
+    return table.sum(axis=-1) / np.arange(1, table.shape[3] + 1)
+
+## Test year revenues per hub zone (or settlement point) and use, tidy, for a battery of the given
+## duration and capacity. With a reference_prices core the outlier months of its rule are replaced
+## use by use, as the reference prices are, and its test years are averaged.
+
+def revenue_breakdown(duration, capacity, manifest=None, core=None, points=store.HUBS, names=pipeline.HUB_ZONES):
+    manifest = manifest or store.ensure_store()
+    years = store.years(manifest)
+    test_years = core['test_years'] if core is not None else pipeline.TEST_YEARS
+    per_period = load_as_table(manifest, points)[:, :, :, duration - 1]
+    if core is not None:
+        per_period = np.stack([outliers.adjust(per_period[..., u], core['outliers']) for u in range(len(USES))], axis=-1)
+    test_year = per_period[[years.index(year) for year in test_years]].mean(axis=0)
+    revenues = test_year * capacity * pipeline.periods_per_month(duration)[None, :, None]
+    index = pd.MultiIndex.from_product([names, pipeline.MONTHS, USES], names=['hub_zone', 'month', 'use'])
+    return pd.DataFrame({'revenue': revenues.ravel()}, index=index).reset_index().assign(duration_h=duration, capacity_mw=capacity)[
+        ['duration_h', 'capacity_mw', 'hub_zone', 'month', 'use', 'revenue']]
+
+## Annual revenues, (hub zone x use), from a breakdown.
+
+def annual_revenues(breakdown):
+    return breakdown.pivot_table(index='hub_zone', columns='use', values='revenue', aggfunc='sum', sort=False)[USES]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Annual test year revenues of an hour-by-hour energy / ancillary service allocation per hub zone.')
+    parser.add_argument('--duration', type=int, default=4)
+    parser.add_argument('--capacity', type=float, default=100)
+    pipeline.add_model_arguments(parser, modes=None, efficiency=False)
+    parser.add_argument('--out', help='also write the monthly breakdown to this .csv or .parquet path')
+    args = parser.parse_args(argv)
+    pipeline.check_durations(parser, [args.duration])
+
+    manifest = store.ensure_store()
+    core = pipeline.reference_prices(args.duration, manifest, mode=pipeline.ALLOCATION_MODE, outlier_rule=args.outliers)
+    breakdown = revenue_breakdown(args.duration, args.capacity, manifest, core)
+    annual = annual_revenues(breakdown)
+    annual['Total'] = annual.sum(axis=1)
+    with pd.option_context('display.width', 160):
+        print(annual.to_string(float_format=lambda x: f'{x:,.0f}'))
+    if args.out:
+        pipeline.write_table(breakdown, args.out)
+
+if __name__ == '__main__':
+    main()
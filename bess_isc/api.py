@@ -0,0 +1,217 @@
+## Local HTTP API for reference prices, revenues and Index Storage Credits.
+##
+##   python -m bess_isc.api --port 8765 --workers 8
+##
+##   GET /reference-prices?duration=4&hubs=Houston,West&years=2022,2024
+##   GET /revenues?duration=4&capacity=100
+##   GET /isc?duration=4&capacity=100&mode=Optimal+dispatch&efficiency=0.9&outliers=zscore:3
+##   GET /health, /stats
+##
+## duration is required; capacity (MW, default 100), hubs (hub zone names, default all), years
+## (the years averaged into the test year, default 2022-2024), mode, efficiency and outliers are
+## optional. Every table comes back tidy, as compact JSON ({"columns": [...], "data": [[...]]},
+## plus the request parameters) or, with format=arrow or an Accept of
+## application/vnd.apache.arrow.stream, as an Arrow IPC stream (needs pyarrow).
+##
+## Requests are served by a fixed pool of threads that share one process: the memory-mapped price
+## store, the arbitrage tables and the RCPs are loaded once per data fingerprint and every worker
+## reads the same arrays. Results go through a cache.ResultCache, which also coalesces in-flight
+## duplicates, so identical requests from several dashboards at once cost one computation.
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from bess_isc import cache, dispatch, instrument, outliers, pipeline, reap, rt, store, sweep
+
+ARROW_TYPE = 'application/vnd.apache.arrow.stream'
+DEFAULT_CAPACITY = 100
+
+_results = cache.from_env()
+
+## Store, arbitrage tables and RCPs of the current data, shared by every worker thread; a new
+## fingerprint (a new drop of data) gives new entries.
+
+def shared_inputs(mode, efficiency):
+    fingerprint = store.dataset_fingerprint()
+    manifest = _results.get_or_compute(('store', fingerprint), store.ensure_store)
+    reap_table = _results.get_or_compute(('arbitrage', fingerprint, mode, efficiency),
+                                         lambda: pipeline.arbitrage_table(manifest, mode, efficiency))
+    rcps = _results.get_or_compute(('rcps', fingerprint), lambda: pipeline.reference_capacity_prices(manifest))
+    return fingerprint, manifest, reap_table, rcps
+
+def core_and_tables(params):
+    fingerprint, manifest, reap_table, rcps = shared_inputs(params['mode'], params['efficiency'])
+    core_key = (fingerprint, params['duration'], params['mode'], params['efficiency'], params['outliers'], tuple(params['years']))
+    core = _results.get_or_compute(('core',) + core_key, lambda: pipeline.reference_prices(
+        params['duration'], manifest, reap_table, rcps, mode=params['mode'], efficiency=params['efficiency'],
+        outlier_rule=params['outliers'], test_years=params['years']))
+    tables = _results.get_or_compute(('tables', params['capacity']) + core_key,
+                                     lambda: pipeline.revenue_tables(core, params['capacity']))
+    return core, tables
+
+## One tidy frame per endpoint, filtered to the requested hub zones.
+
+def reference_prices_frame(params):
+    core, _ = core_and_tables(params)
+    return pipeline.tidy_reference_prices(core, 'hub_zone')
+
+def revenues_frame(params):
+    core, (revenues_df, *_) = core_and_tables(params)
+    df = revenues_df.rename(columns=lambda col: col.replace(' Monthly Reference Revenue ($)', '')).rename_axis('month').reset_index()
+    return df.melt(id_vars='month', var_name='hub_zone', value_name='monthly_reference_revenue').assign(
+        duration_h=params['duration'], capacity_mw=params['capacity'])[
+        ['duration_h', 'capacity_mw', 'month', 'hub_zone', 'monthly_reference_revenue']]
+
+def isc_frame(params):
+    core, (_, total_revenues_df, *_) = core_and_tables(params)
+    return pd.DataFrame(sweep.isc_rows(total_revenues_df, params['duration'], params['capacity'], float(core['strike_price'])))
+
+ENDPOINTS = {'/reference-prices': reference_prices_frame, '/revenues': revenues_frame, '/isc': isc_frame}
+
+## Query string -> validated parameters; ValueError becomes a 400.
+
+def parse_params(query):
+    query = {name: values[-1] for name, values in parse_qs(query).items()}
+    if 'duration' not in query:
+        raise ValueError('duration is required')
+    params = {'duration': int(query['duration']),
+              'capacity': float(query.get('capacity', DEFAULT_CAPACITY)),
+              'mode': query.get('mode', 'REAP'),
+              'efficiency': float(query.get('efficiency', dispatch.EFFICIENCY)),
+              'outliers': query.get('outliers', outliers.DEFAULT_RULE),
+              'years': [int(year) for year in query['years'].split(',')] if query.get('years') else list(pipeline.TEST_YEARS),
+              'hubs': query['hubs'].split(',') if query.get('hubs') else list(pipeline.HUB_ZONES),
+              'format': query.get('format')}
+    if not 1 <= params['duration'] <= reap.MAX_DURATION:
+        raise ValueError(f'duration must be between 1 and {reap.MAX_DURATION} hours')
+    if params['mode'] not in pipeline.ARBITRAGE_MODES:
+        raise ValueError(f'mode must be one of {", ".join(pipeline.ARBITRAGE_MODES)}')
+    if params['mode'] == 'Real-time REAP' and not rt.rt_sources():
+        raise ValueError(f'Real-time REAP needs RTM 15-minute prices in ercot_data/{store.RT_DIR}/, and none have been dropped there')
+    if params['mode'] != 'Optimal dispatch':
+        params['efficiency'] = dispatch.EFFICIENCY
+    outliers.parse_rule(params['outliers'])
+    unknown = [hub for hub in params['hubs'] if hub not in pipeline.HUB_ZONES]
+    if unknown:
+        raise ValueError(f'unknown hub zones {unknown}; expected {", ".join(pipeline.HUB_ZONES)}')
+    return params
+
+def to_json(df, params):
+    meta = {name: value for name, value in params.items() if name != 'format'}
+    return json.dumps({**meta, **json.loads(df.to_json(orient='split', index=False))}, separators=(',', ':')).encode()
+
+def to_arrow(df, params):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           b'bess_isc': json.dumps({name: value for name, value in params.items() if name != 'format'}).encode()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = 'bess-isc'
+    protocol_version = 'HTTP/1.1'
+
+    def send(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def error(self, status, message):
+        self.send(status, json.dumps({'error': message}).encode())
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/health':
+            return self.send(200, b'{"status":"ok"}')
+        if url.path == '/stats':
+            return self.send(200, json.dumps(_results.stats()).encode())
+        if url.path not in ENDPOINTS:
+            return self.error(404, f'unknown endpoint {url.path}; expected one of {", ".join(ENDPOINTS)}')
+
+        with instrument.span('api', endpoint=url.path) as s:
+            try:
+                params = parse_params(url.query)
+                df = ENDPOINTS[url.path](params)
+            except ValueError as e:
+                return self.error(400, str(e))
+            except Exception as e:
+                self.log_error('%s failed: %r', self.path, e)
+                return self.error(500, repr(e))
+            df = df[df['hub_zone'].isin(params['hubs'])].reset_index(drop=True)
+            s['rows'] = len(df)
+
+            if params['format'] == 'arrow' or (params['format'] is None and ARROW_TYPE in self.headers.get('Accept', '')):
+                try:
+                    return self.send(200, to_arrow(df, params), ARROW_TYPE)
+                except ImportError:
+                    return self.error(406, 'Arrow output needs pyarrow installed')
+            return self.send(200, to_json(df, params))
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+## HTTPServer that hands each connection to a fixed pool of worker threads.
+
+class PooledHTTPServer(HTTPServer):
+
+    def __init__(self, address, handler, workers=8, verbose=False):
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix='bess-isc-api')
+        self.verbose = verbose
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+def serve(host='127.0.0.1', port=8765, workers=8, warm=True, verbose=False):
+    server = PooledHTTPServer((host, port), Handler, workers, verbose)
+    if warm:
+        start = time.perf_counter()
+        shared_inputs('REAP', dispatch.EFFICIENCY)
+        print(f'price store warm in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+    print(f'serving on http://{host}:{server.server_address[1]} with {workers} workers', file=sys.stderr)
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve reference prices, revenues and ISCs as JSON or Arrow over local HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=8, help='request worker threads (default 8)')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+
+    server = serve(args.host, args.port, args.workers, verbose=args.verbose)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+## Benchmark and regression suite for the reference price pipeline.
+##
+##   python -m bess_isc.bench                      time every stage on the bundled 2022-2024 data
+##   python -m bess_isc.bench --synthetic-years 10 also run the array stages on synthetic years
+##   python -m bess_isc.bench --update-golden      rewrite benchmarks/golden/reference_snapshots.csv
+##   python -m bess_isc.bench --startup            also measure app cold start and first-click latency
+##
+## Each stage is timed over --repeat runs (best wall time reported) and then run once more under
+## tracemalloc for its peak traced memory and the number of Python memory blocks it left allocated.
+## The RP_df_* tables (per year, 2023 outlier adjusted, test year) and total_revenues_df for every
+## benchmarked duration are compared with the golden snapshot; any drift beyond --rtol fails the run.
+## The batch sweep is also checked against the app's path (reference_prices + revenue_tables) in
+## every arbitrage mode, so a CLI that drops a mode argument fails the run as well.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bess_isc import dispatch, geometry, outliers, pipeline, reap, rt, store, sweep
+
+DURATIONS = [1, 4, 8, 12, 20]
+CAPACITY = 100
+GOLDEN_FILE = Path(__file__).resolve().parent.parent / 'benchmarks' / 'golden' / 'reference_snapshots.csv'
+
+def measure(results, dataset, stage, duration, fn, repeat, rows=None):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    fn()
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+
+    results.append({'dataset': dataset, 'stage': stage, 'duration_h': duration, 'rows': rows,
+                    'wall_ms': best * 1000, 'peak_kb': peak / 1024, 'blocks': blocks})
+    return value
+
+## Stages of RP_tables on the bundled data.
+
+def bench_bundled(results, durations, repeat):
+    manifest = measure(results, 'bundled', 'load', None, store.ensure_store, repeat)
+    years = store.years(manifest)
+    hubs = measure(results, 'bundled', 'hub_split', None,
+                   lambda: {year: store.load_hub_matrix(manifest, year) for year in years}, repeat)
+    n_rows = sum(prices.size for _, prices in hubs.values())
+    rcps = measure(results, 'bundled', 'rcp', None, lambda: pipeline.reference_capacity_prices(manifest, rebuild=True), repeat)
+    table = measure(results, 'bundled', 'reap_table', None,
+                    lambda: np.stack([reap.reap_all_durations(*hubs[year]) for year in years]), repeat, n_rows)
+    measure(results, 'bundled', 'dispatch_table', None,
+            lambda: np.stack([dispatch.optimal_all_durations(*hubs[year]) for year in years]), repeat, n_rows)
+
+    cores = {}
+    for duration in durations:
+        measure(results, 'bundled', 'reap', duration,
+                lambda: [reap.reap_monthly(*hubs[year], duration) for year in years], repeat, n_rows)
+        core = measure(results, 'bundled', 'reference_prices', duration,
+                       lambda: pipeline.reference_prices(duration, manifest, table, rcps), repeat)
+        RP = np.stack([df.values.T for df in core['RP_dfs'].values()])
+        measure(results, 'bundled', 'outliers', duration,
+                lambda: outliers.adjust(RP, outliers.detect(RP, years, core['outlier_rule'])), repeat, RP.size)
+        measure(results, 'bundled', 'revenue', duration, lambda: pipeline.revenue_tables(core, CAPACITY), repeat)
+        cores[duration] = core
+
+    measure(results, 'bundled', 'map', None, geometry.build_hub_zones, repeat)
+    return cores
+
+## Synthetic hub and capacity prices: a daily price shape, lognormal noise and rare scarcity spikes.
+
+def synthetic_year(year, rng, n_points=len(pipeline.HUBS)):
+    hours = np.arange(np.datetime64(f'{year}-01-01T00'), np.datetime64(f'{year + 1}-01-01T00'), dtype='datetime64[h]')
+    hour_of_day = (hours - hours.astype('datetime64[D]')).astype(int)
+    shape = 30 + 25 * np.exp(-((hour_of_day - 18) ** 2) / 8)
+    prices = shape * rng.lognormal(0, 0.35, (n_points, len(hours)))
+    spikes = rng.random((n_points, len(hours))) < 0.002
+    prices[spikes] += rng.pareto(1.5, spikes.sum()) * 500
+    cap = pd.DataFrame(rng.gamma(2, 4, (len(hours), 4)), columns=pipeline.RCP_PRODUCTS,
+                       index=pd.DatetimeIndex(hours.astype('datetime64[D]'), name='Delivery Date'))
+    return hours, prices, cap
+
+def bench_synthetic(results, n_years, durations, repeat, seed=0):
+    rng = np.random.default_rng(seed)
+    data = [synthetic_year(2000 + i, rng) for i in range(n_years)]
+    n_rows = sum(prices.size for _, prices, _ in data)
+    dataset = f'synthetic_{n_years}y'
+    measure(results, dataset, 'rcp', None, lambda: [pipeline.RCP(cap) for _, _, cap in data], repeat)
+    measure(results, dataset, 'reap_table', None,
+            lambda: [reap.reap_all_durations(hours, prices) for hours, prices, _ in data], repeat, n_rows)
+    for duration in durations:
+        measure(results, dataset, 'reap', duration,
+                lambda: [reap.reap_monthly(hours, prices, duration) for hours, prices, _ in data], repeat, n_rows)
+
+## App startup: each scenario runs app.py in a fresh interpreter under Streamlit's AppTest and
+## times the first script run (imports included) and then the first Run click with the default
+## sliders, clicking straight away or once the background pre-warm has finished, and with the
+## pre-warm turned off for comparison.
+
+APP_FILE = Path(__file__).resolve().parent.parent / 'app.py'
+STARTUP_SCRIPT = """
+import json, sys, threading, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=600)
+start = time.perf_counter()
+at.run()
+cold_start = time.perf_counter() - start
+if sys.argv[2] == 'after_prewarm':
+    for thread in threading.enumerate():
+        if thread.name == 'bess-isc-prewarm':
+            thread.join()
+start = time.perf_counter()
+at.button[0].click().run()
+print(json.dumps({'cold_start': cold_start, 'first_click': time.perf_counter() - start, 'exception': bool(at.exception)}))
+"""
+
+def bench_startup(results):
+    for scenario, prewarm in (('no_prewarm', '0'), ('click_immediately', '1'), ('after_prewarm', '1')):
+        env = {**os.environ, 'BESS_ISC_PREWARM': prewarm}
+        out = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, str(APP_FILE), scenario],
+                             env=env, capture_output=True, text=True, check=True)
+        timings = json.loads(out.stdout.strip().splitlines()[-1])
+        if timings['exception']:
+            raise RuntimeError(f'app raised during the {scenario} startup run')
+        for stage in ('cold_start', 'first_click'):
+            results.append({'dataset': f'app_{scenario}', 'stage': stage, 'duration_h': 4, 'rows': None,
+                            'wall_ms': timings[stage] * 1000, 'peak_kb': None, 'blocks': None})
+
+## Golden snapshots: tidy (duration, table, row, column, value) rows.
+
+def snapshot(cores, capacity=CAPACITY):
+    rows = []
+    for duration, core in cores.items():
+        tables = {f'RP_df_{year}': df for year, df in core['RP_dfs'].items()}
+        tables['RP_df_2023_aug_adjusted'] = core['RP_dfs_adjusted'][2023]
+        tables['RP_df_test_year'] = core['RP_df_test_year']
+        tables['total_revenues_df'] = pipeline.revenue_tables(core, capacity)[1]
+        for name, df in tables.items():
+            for row, values in df.iterrows():
+                for column, value in values.items():
+                    rows.append({'duration_h': duration, 'table': name, 'row': row, 'column': column, 'value': value})
+    return pd.DataFrame(rows)
+
+def compare_golden(current, rtol, path=GOLDEN_FILE):
+    golden = pd.read_csv(path)
+    keys = ['duration_h', 'table', 'row', 'column']
+    merged = golden.merge(current, on=keys, how='outer', suffixes=('_golden', '_current'), indicator=True)
+    merged = merged[merged['duration_h'].isin(current['duration_h'].unique())]
+    missing = merged[merged['_merge'] != 'both']
+    both = merged[merged['_merge'] == 'both']
+    drift = both[~np.isclose(both['value_current'], both['value_golden'], rtol=rtol, atol=0)]
+    return missing, drift
+
+## Sweep rows against revenue_tables of the same core, per mode: [(mode, rows that differ)].
+
+def check_sweep(duration=4, capacity=CAPACITY, rtol=1e-9):
+    failures = []
+    for mode in pipeline.ARBITRAGE_MODES:
+        if mode == 'Real-time REAP' and not rt.rt_sources():
+            continue
+        rows = sweep.sweep([duration], [capacity], workers=1, mode=mode).set_index('hub_zone')
+        core = pipeline.reference_prices(duration, mode=mode)
+        expected = pipeline.revenue_tables(core, capacity)[1]
+        expected.columns = [col.replace(' Hub Zone', '') for col in expected.columns]
+        bad = [hz for hz in pipeline.HUB_ZONES
+               if not np.allclose(rows.loc[hz, ['annual_reference_revenue', 'annual_strike_revenue', 'isc']].values.astype(float),
+                                  expected[hz].values, rtol=rtol, atol=0)]
+        if bad:
+            failures.append((mode, bad))
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the reference price pipeline and check it against golden snapshots.')
+    parser.add_argument('--durations', default=','.join(map(str, DURATIONS)), help='comma separated hours (default 1,4,8,12,20)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage; the best is reported (default 3)')
+    parser.add_argument('--synthetic-years', type=int, default=0, help='also benchmark this many synthetic years')
+    parser.add_argument('--rtol', type=float, default=1e-9, help='relative tolerance against the golden snapshot')
+    parser.add_argument('--update-golden', action='store_true', help='rewrite the golden snapshot from this run')
+    parser.add_argument('--startup', action='store_true', help='also measure app cold start and first-click latency')
+    parser.add_argument('--json', help='also write the timings as JSON to this path')
+    args = parser.parse_args(argv)
+    durations = [int(d) for d in args.durations.split(',')]
+
+    results = []
+    cores = bench_bundled(results, durations, args.repeat)
+    if args.synthetic_years:
+        bench_synthetic(results, args.synthetic_years, durations, args.repeat)
+    if args.startup:
+        bench_startup(results)
+
+    timings = pd.DataFrame(results).astype({'duration_h': 'Int64', 'rows': 'Int64'})
+    with pd.option_context('display.max_rows', None, 'display.width', 120):
+        print(timings.to_string(index=False, float_format=lambda x: f'{x:,.2f}'))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=1, default=str))
+
+    current = snapshot(cores)
+    if args.update_golden:
+        GOLDEN_FILE.parent.mkdir(parents=True, exist_ok=True)
+        current.to_csv(GOLDEN_FILE, index=False, float_format='%.17g')
+        print(f'golden snapshot written: {GOLDEN_FILE} ({len(current)} values)')
+        return 0
+
+    missing, drift = compare_golden(current, args.rtol)
+    if len(missing) or len(drift):
+        print(f'REGRESSION: {len(drift)} values drifted beyond rtol={args.rtol}, {len(missing)} missing', file=sys.stderr)
+        print(drift.head(20).to_string(index=False), file=sys.stderr)
+        return 1
+    print(f'golden snapshot OK ({len(current)} values, rtol={args.rtol})')
+
+    failures = check_sweep(rtol=args.rtol)
+    if failures:
+        print(f'REGRESSION: sweep disagrees with revenue_tables for {failures}', file=sys.stderr)
+        return 1
+    print('sweep matches revenue_tables in every mode')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
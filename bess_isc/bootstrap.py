@@ -0,0 +1,170 @@
+## Bootstrap test years: the spread of the Index Storage Credits around the 3-year test year.
+##
+##   python -m bess_isc.bootstrap --duration 4 --capacity 100 --samples 10000 --seed 0
+##
+## The REAP of a day (or of an ISO week within a month, above 8 hours) depends only on that
+## period's prices, so the historical years are reduced once to one arbitrage value and one
+## average capacity price per period. A synthetic test year draws, for every calendar month, as
+## many periods as a month has from that month's pool across the test years, in blocks of
+## consecutive periods (circular within the pool) so that multi-day price regimes are kept
+## together. Its monthly reference price is the mean RCP plus the mean arbitrage value of the
+## drawn periods, and its ISCs follow from the usual revenue layer.
+##
+## Samples are generated in fixed-size batches, each from its own child of one SeedSequence, so a
+## run is reproducible for a seed whatever the number of worker processes. Each batch is a handful
+## of numpy gathers over (samples, hub zones, periods).
+
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bess_isc import dispatch, instrument, outliers, pipeline, reap, store
+
+## consecutive periods per block: a week of days, single weeks
+BLOCK = {'day': 7, 'week': 1}
+BATCH_SIZE = 500
+PERCENTILES = [5, 25, 50, 75, 95]
+
+## Per calendar month, the pooled period values of the test years: 'values' (series, periods),
+## 'rcp' (periods,) and 'draws', the number of periods in a typical such month. Months the outlier
+## rule flags in any hub zone are left out of the pool, as the test year replaces them, unless the
+## rule flags that month in every test year: then the pool keeps all of them as they are.
+
+def period_pool(duration, manifest=None, mode='REAP', efficiency=dispatch.EFFICIENCY, years=pipeline.TEST_YEARS, points=store.HUBS,
+                outlier_rule=outliers.DEFAULT_RULE):
+    manifest = manifest or store.ensure_store()
+    period = reap.default_period(duration)
+    core = pipeline.reference_prices(duration, manifest, mode=mode, efficiency=efficiency, outlier_rule=outlier_rule)
+    store_years = list(core['RP_dfs'])
+    flagged = {(store_years[y], m + 1) for y, m in np.argwhere(core['outliers'].any(axis=1))}
+    flagged = {(year, month) for year, month in flagged if not all((other, month) in flagged for other in years)}
+    values, rcps, months, counts = [], [], [], []
+    with instrument.span('bootstrap_pool', duration=duration) as s:
+        for year in years:
+            hours, prices = store.load_hub_matrix(manifest, year, points)
+            layout = reap.period_layout(hours, period)
+            cube = reap.period_cube(prices, layout)
+            if mode == 'REAP':
+                values.append(reap.period_reap(cube, duration))
+            elif mode == 'Optimal dispatch':
+                values.append(dispatch.optimal_period_value(cube, [duration], efficiency)[..., 0])
+            else:
+                raise ValueError(f'bootstrap supports REAP and Optimal dispatch, not {mode!r}')
+
+            ## average capacity price of every period, matched on the same period keys
+            cap = store.load_cap_prices(manifest, year)
+            cap_price = pd.Series(cap[pipeline.RCP_PRODUCTS].mean(axis=1).values,
+                                  index=reap.period_keys(cap.index.values, period))
+            period_key = reap.period_keys(hours, period)[np.flatnonzero(np.r_[True, np.diff(layout[0]) != 0])]
+            rcps.append(cap_price.groupby(level=0).mean().reindex(period_key).values)
+
+            period_month = layout[3]
+            excluded = [month for flagged_year, month in flagged if flagged_year == year]
+            months.append(np.where(np.isin(period_month, excluded), 0, period_month))
+            counts.append(np.bincount(period_month, minlength=13)[1:])
+
+        values, rcps, months = np.concatenate(values, axis=1), np.concatenate(rcps), np.concatenate(months)
+        s['rows'] = values.size
+    draws = np.rint(np.mean(counts, axis=0)).astype(int)
+    return [{'values': values[:, months == month], 'rcp': rcps[months == month], 'draws': draws[month - 1]}
+            for month in range(1, 13)]
+
+## Monthly reference prices of n synthetic test years: (n, series, 12).
+
+def sample_reference_prices(pool, n, rng, block):
+    out = np.empty((n, pool[0]['values'].shape[0], 12))
+    for month, cell in enumerate(pool):
+        size, draws = len(cell['rcp']), cell['draws']
+        starts = rng.integers(0, size, (n, -(-draws // block)))
+        drawn = ((starts[..., None] + np.arange(block)) % size).reshape(n, -1)[:, :draws]
+        out[:, :, month] = cell['rcp'][drawn].mean(axis=-1)[:, None] + cell['values'][:, drawn].mean(axis=-1).T
+    return out
+
+## Annual reference revenues and ISCs of every sample, (n, series) each, as in pipeline.revenue_tables.
+
+def sample_isc(RP, duration, capacity):
+    energy = capacity * duration
+    periods = pipeline.periods_per_month(duration)
+    revenues = (RP * energy * periods).sum(axis=-1)
+    strike_revenues = sum(pipeline.strike_price(duration) * energy * periods)
+    return revenues, strike_revenues - revenues
+
+_shared = {}
+
+def _init(pool, duration, capacity, block):
+    _shared.update(pool=pool, duration=duration, capacity=capacity, block=block)
+
+def run_batch(seed, n):
+    rng = np.random.default_rng(seed)
+    RP = sample_reference_prices(_shared['pool'], n, rng, _shared['block'])
+    return sample_isc(RP, _shared['duration'], _shared['capacity'])
+
+## Tidy samples: one row per (sample, hub zone) with the annual reference revenue and the ISC.
+
+def bootstrap(duration, capacity, n_samples=2000, seed=0, block=None, workers=1, pool=None,
+              manifest=None, mode='REAP', efficiency=dispatch.EFFICIENCY, outlier_rule=outliers.DEFAULT_RULE, batch_size=BATCH_SIZE):
+    pool = pool or period_pool(duration, manifest, mode, efficiency, outlier_rule=outlier_rule)
+    block = block or BLOCK[reap.default_period(duration)]
+    sizes = [min(batch_size, n_samples - start) for start in range(0, n_samples, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    shared = (pool, duration, capacity, block)
+
+    with instrument.span('bootstrap', duration=duration, capacity=capacity, rows=n_samples):
+        workers = min(workers or os.cpu_count() or 1, len(sizes))
+        if workers <= 1:
+            _init(*shared)
+            results = [run_batch(batch_seed, n) for batch_seed, n in zip(seeds, sizes)]
+        else:
+            method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method),
+                                     initializer=_init, initargs=shared) as executor:
+                results = list(executor.map(run_batch, seeds, sizes))
+
+    revenues = np.concatenate([batch[0] for batch in results])
+    isc = np.concatenate([batch[1] for batch in results])
+    return pd.DataFrame({'sample': np.repeat(np.arange(n_samples), len(pipeline.HUB_ZONES)),
+                         'hub_zone': np.tile(pipeline.HUB_ZONES, n_samples),
+                         'annual_reference_revenue': revenues.ravel(),
+                         'isc': isc.ravel()})
+
+## Percentile bands of the ISC per hub zone, next to the point estimate of the 3-year test year
+## when its total_revenues_df is given.
+
+def percentile_bands(samples, percentiles=PERCENTILES, total_revenues_df=None):
+    bands = samples.groupby('hub_zone', sort=False)['isc'].quantile(np.asarray(percentiles) / 100).unstack()
+    bands.columns = [f'p{p:g}' for p in percentiles]
+    bands.insert(0, 'mean', samples.groupby('hub_zone', sort=False)['isc'].mean())
+    if total_revenues_df is not None:
+        bands.insert(0, 'test_year', total_revenues_df.loc['Index Storage Credits (Incentives Needed)',
+                                                           [f'{hz} Hub Zone' for hz in bands.index]].values)
+    return bands.rename_axis('hub_zone')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bootstrap synthetic test years and report ISC percentile bands per hub zone.')
+    parser.add_argument('--duration', type=int, default=4)
+    parser.add_argument('--capacity', type=float, default=100)
+    parser.add_argument('--samples', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--block', type=int, help='consecutive periods per draw (default 7 days, or 1 week above 8 hours)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    pipeline.add_model_arguments(parser, pipeline.ARBITRAGE_MODES[:2])
+    parser.add_argument('--out', help='also write every sample to this .csv or .parquet path')
+    args = parser.parse_args(argv)
+    pipeline.check_durations(parser, [args.duration])
+
+    manifest = store.ensure_store()
+    samples = bootstrap(args.duration, args.capacity, args.samples, args.seed, args.block, args.workers,
+                        manifest=manifest, mode=args.mode, efficiency=args.efficiency, outlier_rule=args.outliers)
+    core = pipeline.reference_prices(args.duration, manifest, mode=args.mode, efficiency=args.efficiency, outlier_rule=args.outliers)
+    bands = percentile_bands(samples, total_revenues_df=pipeline.revenue_tables(core, args.capacity)[1])
+    with pd.option_context('display.width', 120):
+        print(bands.to_string(float_format=lambda x: f'{x:,.0f}'))
+    if args.out:
+        pipeline.write_table(samples, args.out)
+
+if __name__ == '__main__':
+    main()
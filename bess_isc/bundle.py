@@ -0,0 +1,114 @@
+## Static results bundle: every slider position of the app, precomputed, with the hub zone map.
+##
+##   python -m bess_isc.bundle --out isc_bundle.json.gz
+##
+## The app's sliders span durations 1-20 hours and capacities 0-1000 MW in steps of 10. Reference
+## prices and strike prices depend on duration alone and revenues are linear in capacity, so the
+## bundle carries, per duration, the reference prices of every year (as is and outlier adjusted),
+## the test year, the strike price and the monthly revenues of a 1 MW battery, and, over the whole
+## duration x capacity grid, the annual reference revenues, strike revenues and ISCs of every hub
+## zone. With the simplified hub zone GeoJSON (see geometry.web_features) that is everything the
+## app shows for one mode and outlier rule; a static page can index it without any server.
+##
+## Arrays are nested lists in the order of their 'dims' under 'axes'; money is rounded to cents,
+## prices to 1e-4 $/MWh, and missing values are null. A path ending in .gz is gzip-compressed.
+
+import argparse
+import gzip
+import json
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from bess_isc import dispatch, geometry, instrument, outliers, pipeline, reap, sensitivity, store, sweep
+
+BUNDLE_VERSION = 1
+CAPACITIES = list(range(0, 1001, 10))
+
+def _values(array, decimals):
+    array = np.asarray(array, dtype=float)
+    return np.where(np.isfinite(array), np.round(array, decimals), None).tolist()
+
+def build_bundle(durations=range(1, reap.MAX_DURATION + 1), capacities=CAPACITIES, mode='REAP', efficiency=dispatch.EFFICIENCY,
+                 outlier_rule=outliers.DEFAULT_RULE, with_geometry=True):
+    durations, capacities = list(durations), list(capacities)
+    manifest, reap_table, rcps = sweep.load_shared(mode, efficiency)
+    years = store.years(manifest)
+
+    with instrument.span('bundle', rows=len(durations) * len(capacities) * len(pipeline.HUB_ZONES)):
+        cores = sensitivity.reference_cores(durations, manifest, reap_table, rcps, mode, efficiency, outlier_rule)
+        RP = np.stack([[core['RP_dfs'][year].values.T for year in years] for core in cores.values()])
+        RP_adjusted = np.stack([[core['RP_dfs_adjusted'][year].values.T for year in years] for core in cores.values()])
+        test_year = np.stack([core['RP_df_test_year'].values.T for core in cores.values()])
+        periods = np.stack([pipeline.periods_per_month(duration) for duration in durations])
+        monthly_per_mw = test_year * (np.asarray(durations)[:, None] * periods)[:, None, :]
+
+        ## (duration, capacity, hub zone) grid
+        strike = np.array([float(core['strike_price']) for core in cores.values()])
+        strike_per_mw = strike * np.asarray(durations) * periods.sum(axis=1)
+        reference_per_mw = sensitivity.reference_revenues(cores).T
+        capacity = np.asarray(capacities, dtype=float)[None, :, None]
+        annual_reference = reference_per_mw[:, None, :] * capacity
+        annual_strike = np.broadcast_to(strike_per_mw[:, None, None] * capacity, annual_reference.shape)
+
+    bundle = {'version': BUNDLE_VERSION,
+              'generated': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+              'data_fingerprint': store.dataset_fingerprint(),
+              'mode': mode,
+              'efficiency': efficiency,
+              'outlier_rule': outlier_rule,
+              'outliers': [{'year': int(year), 'month': month, 'hub_zone': pipeline.HUB_ZONES[h]}
+                           for year, month, h in outliers.flagged(next(iter(cores.values()))['outliers'], years)],
+              'test_years': list(next(iter(cores.values()))['test_years']),
+              'axes': {'duration_h': durations, 'capacity_mw': capacities, 'year': years,
+                       'hub_zone': pipeline.HUB_ZONES, 'hub_zone_code': geometry.HUB_ZONE_CODES, 'month': pipeline.MONTHS},
+              'dims': {'reference_price': ['duration_h', 'year', 'hub_zone', 'month'],
+                       'reference_price_adjusted': ['duration_h', 'year', 'hub_zone', 'month'],
+                       'test_year_reference_price': ['duration_h', 'hub_zone', 'month'],
+                       'strike_price': ['duration_h'],
+                       'monthly_reference_revenue_per_mw': ['duration_h', 'hub_zone', 'month'],
+                       'annual_reference_revenue': ['duration_h', 'capacity_mw', 'hub_zone'],
+                       'annual_strike_revenue': ['duration_h', 'capacity_mw', 'hub_zone'],
+                       'isc': ['duration_h', 'capacity_mw', 'hub_zone']},
+              'reference_price': _values(RP, 4),
+              'reference_price_adjusted': _values(RP_adjusted, 4),
+              'test_year_reference_price': _values(test_year, 4),
+              'strike_price': _values(strike, 4),
+              'monthly_reference_revenue_per_mw': _values(monthly_per_mw, 2),
+              'annual_reference_revenue': _values(annual_reference, 2),
+              'annual_strike_revenue': _values(annual_strike, 2),
+              'isc': _values(annual_strike - annual_reference, 2)}
+    if with_geometry:
+        bundle['hub_zones'] = geometry.web_features()
+    return bundle
+
+def write_bundle(bundle, out):
+    body = json.dumps(bundle, separators=(',', ':'), allow_nan=False).encode()
+    if str(out).endswith('.gz'):
+        body = gzip.compress(body, compresslevel=9, mtime=0)
+    with open(out, 'wb') as f:
+        f.write(body)
+    return len(body)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute every duration x capacity slider position into one static JSON bundle.')
+    parser.add_argument('--durations', default=f'1-{reap.MAX_DURATION}', help="hours (default 1-20)")
+    parser.add_argument('--capacities', default='0-1000:10', help="MW (default 0-1000:10, the app's slider)")
+    pipeline.add_model_arguments(parser)
+    parser.add_argument('--no-geometry', action='store_true', help='leave out the hub zone GeoJSON')
+    parser.add_argument('--out', default='isc_bundle.json.gz', help='.json or .json.gz output path')
+    args = parser.parse_args(argv)
+
+    durations = sweep.parse_grid(args.durations)
+    pipeline.check_durations(parser, durations)
+
+    start = time.perf_counter()
+    bundle = build_bundle(durations, sweep.parse_grid(args.capacities), args.mode, args.efficiency, args.outliers, not args.no_geometry)
+    size = write_bundle(bundle, args.out)
+    print(f'{len(durations) * len(bundle["axes"]["capacity_mw"])} slider positions, {size / 1024:.0f} kB -> {args.out} '
+          f'in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+## Result cache shared by every session of the app.
+##
+## Entries are keyed on the request inputs plus a fingerprint of the data files, kept in memory
+## under a byte budget with least-recently-used eviction, and optionally written through to a
+## directory so popular configurations survive a restart. Values must be picklable (DataFrames,
+## scalars and tuples of them all are); the pickled size is what counts against the budget.
+##
+## get_or_compute coalesces concurrent misses: the first caller of a key computes it and every
+## other caller that arrives while it is running waits for that result instead of recomputing.
+## In the stats such a caller is counted as coalesced, not as a miss: misses are the computations.
+
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+class ResultCache:
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def _disk_path(self, key):
+        return self.disk_dir / (hashlib.sha256(repr(key).encode()).hexdigest() + '.pkl')
+
+    def _insert(self, key, value, size):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.evictions += 1
+
+    ## hits and disk hits are counted here, misses by the callers
+    def _lookup(self, key, default):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+        if self.disk_dir and self._disk_path(key).exists():
+            payload = self._disk_path(key).read_bytes()
+            value = pickle.loads(payload)
+            with self._lock:
+                self._insert(key, value, len(payload))
+                self.disk_hits += 1
+            return value
+        return default
+
+    def get(self, key, default=None):
+        missing = object()
+        value = self._lookup(key, missing)
+        if value is not missing:
+            return value
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def put(self, key, value):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._insert(key, value, len(payload))
+        if self.disk_dir:
+            path = self._disk_path(key)
+            tmp = path.with_suffix('.tmp')
+            tmp.write_bytes(payload)
+            os.replace(tmp, path)
+        return value
+
+    def get_or_compute(self, key, compute):
+        missing = object()
+        value = self._lookup(key, missing)
+        if value is not missing:
+            return value
+
+        with self._lock:
+            ## finished by another caller between the lookup above and here
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            value = self.put(key, compute())
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'coalesced': self.coalesced, 'evictions': self.evictions, 'inflight': len(self._inflight)}
+
+## Process-wide cache configured from the environment:
+##   BESS_ISC_CACHE_MB   in-memory budget (default 256)
+##   BESS_ISC_CACHE_DIR  enables the on-disk tier
+
+def from_env():
+    max_bytes = int(float(os.environ.get('BESS_ISC_CACHE_MB', DEFAULT_MAX_BYTES / 1024 / 1024)) * 1024 * 1024)
+    return ResultCache(max_bytes, os.environ.get('BESS_ISC_CACHE_DIR'))
@@ -0,0 +1,85 @@
+## Optimal state-of-charge dispatch, the alternative to the REAP heuristic.
+##
+## REAP pairs the k highest and k lowest hours of a day (or week) regardless of order and with no
+## losses. Here a battery of 1 MW and `duration` MWh starts each period empty and is dispatched
+## hour by hour to maximise arbitrage revenue: it can charge, discharge or idle at full power,
+## cannot discharge energy it has not stored, and sells only `efficiency` of every MWh it stored
+## (round-trip losses are taken on discharge). With power and energy limits in whole MW / MWh the
+## LP over an hourly period has an integral optimum, so a dynamic program over the states of
+## charge 0..duration MWh is exact. It runs backwards over the hours of a period for every series,
+## period and duration at once, so the cost is one numpy step per hour of the longest period.
+##
+## The period value is the optimal revenue per MWh of energy capacity, the same unit as a REAP,
+## so monthly values feed reference_prices and the ISC tables unchanged.
+
+import numpy as np
+
+from bess_isc import instrument, reap, store
+
+EFFICIENCY = 0.85
+
+## cube is (series, periods, hours) NaN padded; returns (series, periods, len(durations)).
+## Padding hours are idle.
+
+def optimal_period_value(cube, durations, efficiency=EFFICIENCY):
+    durations = np.asarray(durations)
+    allowed = np.arange(durations.max() + 1) <= durations[:, None]
+    value = np.where(allowed, 0.0, -np.inf) + np.zeros(cube.shape[:2] + allowed.shape)
+    charge = np.full_like(value, -np.inf)
+    discharge = np.full_like(value, -np.inf)
+    for hour in reversed(range(cube.shape[-1])):
+        price = cube[..., hour, None, None]
+        charge[..., :-1] = value[..., 1:] - price
+        discharge[..., 1:] = value[..., :-1] + efficiency * price
+        best = np.where(allowed, np.maximum(value, np.maximum(charge, discharge)), -np.inf)
+        value = np.where(np.isnan(price), value, best)
+    return value[..., 0] / durations
+
+## Monthly optimal dispatch value for every duration 1..max_duration, laid out like
+## reap.reap_all_durations: (series, 12, max_duration), daily periods for k <= 8 and weekly above.
+
+def optimal_all_durations(hours, prices, max_duration=reap.MAX_DURATION, efficiency=EFFICIENCY):
+    prices = np.atleast_2d(np.asarray(prices, dtype=np.float64))
+    out = np.full((prices.shape[0], 12, max_duration), np.nan)
+    for period, durations in (('day', range(1, min(reap.DAILY_MAX_DURATION, max_duration) + 1)),
+                              ('week', range(reap.DAILY_MAX_DURATION + 1, max_duration + 1))):
+        if len(durations) == 0:
+            continue
+        layout = reap.period_layout(hours, period)
+        values = optimal_period_value(reap.period_cube(prices, layout), durations, efficiency)
+        for i, duration in enumerate(durations):
+            out[:, :, duration - 1] = reap.monthly_mean(values[..., i], layout[3])
+    return out
+
+def optimal_monthly(hours, prices, duration, efficiency=EFFICIENCY):
+    layout = reap.period_layout(hours, reap.default_period(duration))
+    values = optimal_period_value(reap.period_cube(prices, layout), [duration], efficiency)[..., 0]
+    monthly = reap.monthly_mean(values, layout[3])
+    return monthly if np.ndim(prices) > 1 else monthly[0]
+
+## Monthly table over every settlement point, one per efficiency (in whole percent), kept next to
+## the store like the REAP table and refreshed a month at a time.
+
+def table_name(efficiency):
+    return f'dispatch_table_{round(efficiency * 100)}'
+
+def build_dispatch_table(manifest, efficiency=EFFICIENCY, max_duration=reap.MAX_DURATION, store_dir=store.STORE_DIR, rebuild=True):
+    points = store.settlement_points(manifest)
+
+    def compute(year, month):
+        present = [point for point in points if point in manifest['partitions'][store.partition_id('dam', year, month)]['points']]
+        hours, prices = store.load_hub_matrix(manifest, year, present, store_dir, months=[month])
+        cell = np.full((len(points), max_duration), np.nan)
+        cell[[points.index(point) for point in present]] = optimal_all_durations(hours, prices, max_duration, efficiency)[:, month - 1, :]
+        return cell
+
+    table = store.monthly_table(table_name(efficiency), manifest, 'dam', (len(points), max_duration), compute,
+                                key={'points': points, 'max_duration': max_duration, 'efficiency': efficiency},
+                                stage='dispatch', store_dir=store_dir, rebuild=rebuild)
+    return np.moveaxis(table, 1, 2)
+
+def load_dispatch_table(manifest, efficiency=EFFICIENCY, points=store.HUBS, max_duration=reap.MAX_DURATION, store_dir=store.STORE_DIR):
+    with instrument.span('dispatch_table'):
+        table = build_dispatch_table(manifest, efficiency, max_duration, store_dir, rebuild=False)
+        all_points = store.settlement_points(manifest)
+        return np.ascontiguousarray(table[:, [all_points.index(point) for point in points]])
@@ -0,0 +1,140 @@
+## Chart builders for the app, kept apart from the computation in pipeline.py.
+##
+## The reference price charts are Vega-Lite (Altair) specs: only the small monthly tables go to the
+## browser, which draws them, so the server renders no pixels for them. The hub zone map is a
+## Leaflet choropleth over pre-simplified GeoJSON, also drawn in the browser.
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+from bess_isc import pipeline, store
+
+MONTHS = store.MONTHS
+
+## Bars are capped like the original matplotlib charts so August 2023 does not flatten the rest.
+BAR_Y_MAX = 1000
+
+## long format: one row per (year, month, hub zone)
+
+def long_prices(RP_dfs):
+    frames = []
+    for year, RP_df in RP_dfs.items():
+        df = RP_df.rename(columns=lambda col: col.replace(' Reference Price', ''))
+        df = df.rename_axis('Month').reset_index().melt(id_vars='Month', var_name='Hub Zone', value_name='Reference Price ($/MWh)')
+        frames.append(df.assign(Year=str(year)))
+    return pd.concat(frames, ignore_index=True)
+
+def reference_price_chart(core):
+    duration = core['duration']
+    return alt.Chart(long_prices(core['RP_dfs'])).mark_line(point=True).encode(
+        x=alt.X('Month:N', sort=MONTHS),
+        y=alt.Y('Reference Price ($/MWh):Q', title='$/MWh'),
+        color='Hub Zone:N',
+        tooltip=['Year:N', 'Month:N', 'Hub Zone:N', alt.Tooltip('Reference Price ($/MWh):Q', format=',.2f')],
+    ).properties(height=160).facet(
+        row=alt.Row('Year:N', title=f'Reference Prices by Hub Zone for {duration}-hr batteries'))
+
+def _grouped_bars(data, height):
+    return alt.Chart(data).mark_bar(clip=True).encode(
+        x=alt.X('Month:N', sort=MONTHS),
+        xOffset='Hub Zone:N',
+        y=alt.Y('Reference Price ($/MWh):Q', scale=alt.Scale(domain=[0, BAR_Y_MAX], clamp=True)),
+        color=alt.Color('Hub Zone:N', title='Hub Zones'),
+        tooltip=['Month:N', 'Hub Zone:N', alt.Tooltip('Reference Price ($/MWh):Q', format=',.2f')],
+    ).properties(height=height)
+
+## Every year after the outlier adjustment, adjusted years labelled with their months.
+
+def bar_reference_price_chart(core):
+    duration = core['duration']
+    data = long_prices(core['RP_dfs_adjusted'])
+    data['Year'] = data['Year'].replace({str(year): label for year, label in pipeline.adjusted_years(core).items()})
+    return _grouped_bars(data, 160).facet(
+        row=alt.Row('Year:N', title=f'Prices by Hub Zone Across Months {duration}-hr Batteries'))
+
+def test_year_chart(core):
+    duration = core['duration']
+    data = long_prices({'Test Year': core['RP_df_test_year']})
+    bars = _grouped_bars(data, 320).encode(y=alt.Y('Reference Price ($/MWh):Q'))
+    strike = alt.Chart(pd.DataFrame({'Strike Price': [core['strike_price']]})).mark_rule(
+        color='red', strokeDash=[6, 4], strokeWidth=1.5).encode(y=alt.Y('Strike Price:Q', title='Reference Price ($/MWh)'), tooltip=[alt.Tooltip('Strike Price:Q', format=',.2f')])
+    return (bars + strike).properties(
+        title=f"Test Year (Average of {', '.join(map(str, core['test_years']))}) Prices by Hub Zone Across Months {duration}-hr Batteries")
+
+## Interactive hub zone choropleth (folium / Leaflet). features is the cached compact GeoJSON from
+## geometry.web_features(); only the per-zone values change with the sliders, so each call just
+## attaches them to the feature properties and reuses the geometry as is. Zones without a value
+## (NaN: a missing RT hub, a partial year) are drawn grey with an 'n/a' tooltip.
+
+MAP_CENTER = [31.0, -99.5]
+MAP_COLORS = ['#2c7bb6', '#ffffbf', '#d7191c']
+MAP_MISSING_COLOR = '#cccccc'
+
+def hub_zone_choropleth(features, values, names, caption, fmt='{:,.2f}'):
+    import folium
+    from branca.colormap import LinearColormap
+
+    finite = np.array([value for value in values.values() if np.isfinite(value)], dtype=float)
+    vmin, vmax = (finite.min(), finite.max()) if len(finite) else (0.0, 1.0)
+    colormap = LinearColormap(MAP_COLORS, vmin=vmin, vmax=vmax if vmax > vmin else vmin + 1, caption=caption)
+
+    def properties(code):
+        value = values[code]
+        if not np.isfinite(value):
+            return {'name': names[code], 'value': 'n/a', 'fill': MAP_MISSING_COLOR}
+        return {'name': names[code], 'value': fmt.format(value), 'fill': colormap(value)}
+
+    collection = {'type': 'FeatureCollection',
+                  'features': [{**feature, 'properties': {**feature['properties'], **properties(feature['properties']['hub zone'])}}
+                               for feature in features['features']]}
+
+    m = folium.Map(location=MAP_CENTER, zoom_start=5, tiles='cartodbpositron')
+    folium.GeoJson(collection, name=caption,
+                   style_function=lambda feature: {'fillColor': feature['properties']['fill'], 'color': '#444444',
+                                                   'weight': 1, 'fillOpacity': 0.75},
+                   tooltip=folium.GeoJsonTooltip(['name', 'value'], aliases=['Hub zone', caption])).add_to(m)
+    colormap.add_to(m)
+    return m
+
+## CONE sensitivity heatmap: ISC over duration and one cost parameter, one panel per hub zone.
+## Diverging colours centred on zero, so zones that need no credit stand out.
+
+ISC_AXIS_TITLES = {'capex_slope': 'Capex slope ($/kW-h)', 'capex_intercept': 'Capex intercept ($/kW)', 'payback_years': 'Payback (years)'}
+
+def isc_heatmap(surface, parameter='payback_years'):
+    return alt.Chart(surface).mark_rect().encode(
+        x=alt.X('duration_h:O', title='Duration (h)'),
+        y=alt.Y(f'{parameter}:O', title=ISC_AXIS_TITLES[parameter], sort='descending'),
+        color=alt.Color('isc:Q', title='ISC ($)', scale=alt.Scale(scheme='redblue', domainMid=0, reverse=True)),
+        tooltip=['hub_zone:N', 'duration_h:O', alt.Tooltip(f'{parameter}:Q', format=',.2f'),
+                 alt.Tooltip('strike_price_per_mwh:Q', format=',.2f'), alt.Tooltip('isc:Q', format='$,.0f')],
+    ).properties(width=180, height=180).facet(
+        facet=alt.Facet('hub_zone:N', title='Index Storage Credits by hub zone'), columns=5)
+
+## Bootstrap ISC bands per hub zone: p5-p95 whiskers, p25-p75 box, median tick and the 3-year test
+## year as a red point.
+
+def isc_band_chart(bands):
+    data = bands.reset_index()
+    base = alt.Chart(data).encode(y=alt.Y('hub_zone:N', title=None))
+    whisker = base.mark_rule().encode(x=alt.X('p5:Q', title='Index Storage Credit ($)'), x2='p95:Q')
+    box = base.mark_bar(size=14, opacity=0.5).encode(x='p25:Q', x2='p75:Q',
+                                                     tooltip=['hub_zone:N'] + [alt.Tooltip(f'{col}:Q', format='$,.0f') for col in bands.columns])
+    median = base.mark_tick(color='black', thickness=2, size=14).encode(x='p50:Q')
+    layers = [whisker, box, median]
+    if 'test_year' in bands:
+        layers.append(base.mark_point(color='red', filled=True).encode(x='test_year:Q'))
+    return alt.layer(*layers).properties(height=200)
+
+## ISCs per test year window (see windows.py), windows in the order given, one bar per hub zone.
+
+def window_isc_chart(window_iscs):
+    return alt.Chart(window_iscs).mark_bar().encode(
+        x=alt.X('window:N', sort=list(dict.fromkeys(window_iscs['window'])), title='Test year window'),
+        xOffset='hub_zone:N',
+        y=alt.Y('isc:Q', title='Index Storage Credit ($)'),
+        color=alt.Color('hub_zone:N', title='Hub Zones'),
+        tooltip=['window:N', 'hub_zone:N', alt.Tooltip('test_year_reference_price:Q', format=',.2f'),
+                 alt.Tooltip('isc:Q', format='$,.0f')],
+    ).properties(height=320)
@@ -0,0 +1,161 @@
+## ERCOT hub zone geometry.
+##
+## Hub zones are dissolved from Texas counties (hand-maintained county lists below) and the
+## non-ERCOT counties are cut out. None of this depends on the sliders, so the polygons are built
+## once, simplified to a display tolerance and written to ercot_data/store/hub_zones.geojson
+## together with a sha256 of the shapefile and county lists. The app only reads that file.
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+
+from bess_isc import instrument, store
+
+SHAPEFILE = Path(__file__).resolve().parent.parent / 'US_COUNTY_SHPFILE' / 'US_county_cont.shp'
+HUB_ZONES_FILE = store.STORE_DIR / 'hub_zones.geojson'
+
+## degrees (EPSG:4326); ~100 m, well below what the maps can show
+DISPLAY_TOLERANCE = 0.001
+
+## The interactive map gets its own copy: ~1 km simplification and coordinates snapped to ~10 m,
+## which keeps the five hub zones to a few tens of kB of GeoJSON in the browser.
+HUB_ZONES_WEB_FILE = store.STORE_DIR / 'hub_zones_web.geojson'
+WEB_TOLERANCE = 0.01
+WEB_PRECISION = 0.0001
+
+HUB_ZONE_CODES = ['HOU','NORTH','PAN','SOUTH','WEST']
+NON_ERCOT = 'NON_ERCOT'
+
+hou_hub_counties = ['Montgomery','Waller','Harris','Fort Bend','Brazoria','Galveston','Chambers']
+
+north_hub_counties = [
+    'Montague','Cooke','Grayson','Fannin','Lamar','Red River',
+    'Jack','Wise','Denton','Collin','Hunt','Hopkins','Delta','Franklin','Titus',
+    'Stephens','Palo Pinto','Parker','Tarrant','Dallas','Rockwall','Rains','Wood',
+    'Eastland','Erath','Hood','Somervell','Johnson','Ellis','Kaufman','Van Zandt','Smith',
+    'Brown','Comanche','Bosque','Hill','Navarro','Henderson','Smith','Rusk',
+    'San Saba', 'Mills','Hamilton','McLennan','Limestone','Freestone','Anderson','Cherokee',
+    'Nacogdoches','San Augustine','Angelina','Houston','Grimes','Madison','Brazos',
+    'Lampasas','Bell','Coryell','Falls','Robertson','Leon']
+
+pan_hub_counties = [
+    "Dallam", "Hartley", "Oldham", "Deaf Smith", "Parmer", "Bailey", "Cochran",
+    "Hockley", "Sherman", "Hansford", "Ochiltree", "Lipscomb", "Roberts",
+    "Hemphill", "Wheeler", "Gray", "Carson", "Hutchinson", "Moore", "Potter",
+    "Armstrong", "Randall", "Donley", "Collingsworth", "Briscoe", "Castro",
+    "Swisher", "Floyd", "Motley", "Childress", "Hall", "Hale", "Lamb",
+    "Lubbock", "Crosby", "Dickens"
+]
+
+south_hub_counties = [
+    "Maverick", "Zavala", "Frio", "Atascosa", "Karnes", "DeWitt", "Lavaca",
+    "Gonzales",'Milam', "Guadalupe",'Lee', "Comal", "Kendall", "Bandera", "Medina", "Bexar",
+    "Wilson",'Austin','Kerr','Wharton', "Goliad", 'Bastrop',"Victoria", "Calhoun", "Refugio", "Aransas",
+    "San Patricio", 'Gillespie','Jackson','Caldwell',"Bee",'Llano', 'Hays','Travis','Burnet',"Live Oak", "McMullen", "La Salle", "Dimmit", "Webb",
+    "Duval",'Fayette', "McCulloch", "Jim Wells",'Colorado','Blanco', "Nueces", "Kleberg", "Kenedy", "Brooks", "Starr",
+    "Hidalgo",'Williamson','Washington','Burleson',"Willacy", "Cameron", "Zapata", "Jim Hogg", "Matagorda", "Mason"
+]
+
+west_hub_counties = [
+    "El Paso",'Wichita', "Cottle",'Hardeman','Wilbarger','Young',"Hudspeth", "Culberson", "Reeves", "Loving", "Winkler", "Ward",
+    "Crane", "Upton", "Reagan","Knox",'King', "Irion", "Jeff Davis", "Pecos", "Terrell",
+    "Crockett","Archer", "Schleicher", "Sutton", "Kimble", "Menard", "Presidio",
+    "Brewster", "Val Verde", "Edwards", "Real", "Kinney", "Uvalde", "Andrews",
+    "Martin", "Howard", "Mitchell", "Nolan", "Taylor", "Callahan",
+    "Baylor",'Tom Green',"Coleman", "Runnels", "Concho",
+    "Midland", "Glasscock", "Sterling", "Coke", "Ector", "Gaines",
+    "Dawson", "Borden", "Scurry", "Fisher", "Jones", "Shackelford", "Yoakum",
+    "Terry",'Foard','Clay', "Lynn", "Garza", "Kent", "Stonewall", "Haskell", "Throckmorton",
+]
+
+## Locate non-ercot counties: https://www.ercot.com/news/mediakit/maps
+
+non_ercot_counties = ['Dallam','Sherman','Hansford','Ochiltree','Lipscomb','Moore','Hartley','Hutchinson','Hemphill','Bailey','Lamb','Cochran','Hockley',
+                    'Yoakum','Terry','Gaines','El Paso','Hudspeth','Bowie','Morris','Cass','Camp','Upshur','Marion','Harrison','Gregg','Panola','Shelby',
+                    'San Augustine','Sabine','Newston','Jasper','Tyler','Polk','Trinity','San Jacinto','Liberty','Hardin','Orange','Jefferson']
+
+HUB_COUNTIES = {'HOU': hou_hub_counties, 'NORTH': north_hub_counties, 'PAN': pan_hub_counties,
+                'SOUTH': south_hub_counties, 'WEST': west_hub_counties}
+
+## The artifact is stale if the shapefile, the county lists, the tolerance or the precision change.
+
+def source_sha256(shapefile=SHAPEFILE, tolerance=DISPLAY_TOLERANCE, precision=None):
+    h = hashlib.sha256()
+    for suffix in ('.shp', '.shx', '.dbf', '.prj'):
+        h.update(bytes.fromhex(store.file_sha256(Path(shapefile).with_suffix(suffix))))
+    h.update(json.dumps([HUB_COUNTIES, non_ercot_counties, tolerance] + ([precision] if precision else [])).encode())
+    return h.hexdigest()
+
+## Hub zone polygons (indexed HOU..WEST) followed by a single NON_ERCOT polygon,
+## with a 'hub zone' column and geometry only.
+
+def build_hub_zones(shapefile=SHAPEFILE, tolerance=DISPLAY_TOLERANCE, precision=None):
+    us_county = gpd.read_file(shapefile)
+    tx_county = us_county[us_county['STATE_NAME'] == 'Texas']
+
+    hub_zone = tx_county['NAME'].map({county: hz for hz, counties in HUB_COUNTIES.items() for county in counties})
+    ercot_zones = tx_county.assign(**{'hub zone': hub_zone})[hub_zone.notna()]
+    non_ercot_zones = tx_county[tx_county['NAME'].isin(non_ercot_counties)]
+
+    hub_polygons = ercot_zones[['hub zone', 'geometry']].dissolve(by='hub zone', as_index=False)
+    hub_polygons = gpd.overlay(hub_polygons, non_ercot_zones[['geometry']], how='difference')
+    non_ercot = non_ercot_zones[['geometry']].dissolve().assign(**{'hub zone': NON_ERCOT})
+
+    zones = gpd.GeoDataFrame(pd.concat([hub_polygons, non_ercot[['hub zone', 'geometry']]], ignore_index=True), crs=tx_county.crs)
+    zones['geometry'] = zones.geometry.simplify(tolerance, preserve_topology=True)
+    if precision:
+        zones['geometry'] = zones.geometry.set_precision(precision)
+    return zones.set_index('hub zone', drop=False).rename_axis(None).loc[HUB_ZONE_CODES + [NON_ERCOT]]
+
+def write_hub_zones(zones, sha256, path=HUB_ZONES_FILE):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    collection = json.loads(zones.to_json(drop_id=True))
+    collection['source_sha256'] = sha256
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(collection, separators=(',', ':')))
+    os.replace(tmp, path)
+
+def read_hub_zones(path=HUB_ZONES_FILE):
+    collection = json.loads(Path(path).read_text())
+    zones = gpd.GeoDataFrame.from_features(collection['features'], crs='EPSG:4326')
+    return zones.set_index('hub zone', drop=False).rename_axis(None), collection.get('source_sha256')
+
+## All hub zones plus NON_ERCOT, rebuilt from the shapefile only when the hash changes.
+
+def load_hub_zones(shapefile=SHAPEFILE, path=HUB_ZONES_FILE, tolerance=DISPLAY_TOLERANCE, precision=None):
+    with instrument.span('geometry') as s:
+        sha256 = source_sha256(shapefile, tolerance, precision)
+        if Path(path).exists():
+            zones, cached_sha256 = read_hub_zones(path)
+            if cached_sha256 == sha256:
+                s['rows'] = len(zones)
+                return zones
+        s['rebuilt'] = True
+        zones = build_hub_zones(shapefile, tolerance, precision)
+        write_hub_zones(zones, sha256, path)
+        s['rows'] = len(zones)
+        return zones
+
+## The five ERCOT hub zones only, in HUB_ZONE_CODES order.
+
+def hub_polygons(zones=None):
+    zones = load_hub_zones() if zones is None else zones
+    return zones.loc[HUB_ZONE_CODES]
+
+## GeoJSON FeatureCollection (a dict) of the five hub zones for the interactive map, each feature
+## carrying its 'hub zone' code; the slider-dependent values are added per run by the caller.
+
+def web_features(shapefile=SHAPEFILE, path=HUB_ZONES_WEB_FILE):
+    zones = load_hub_zones(shapefile, path, WEB_TOLERANCE, WEB_PRECISION)
+    return json.loads(zones.loc[HUB_ZONE_CODES, ['hub zone', 'geometry']].to_json(drop_id=True))
+
+if __name__ == '__main__':
+    zones = load_hub_zones()
+    print(f'{HUB_ZONES_FILE}: {len(zones)} zones, {HUB_ZONES_FILE.stat().st_size / 1024:.0f} kB')
+    features = web_features()
+    print(f'{HUB_ZONES_WEB_FILE}: {len(features["features"])} zones, {len(json.dumps(features, separators=(",", ":"))) / 1024:.0f} kB')
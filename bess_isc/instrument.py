@@ -0,0 +1,148 @@
+## Lightweight hot-path instrumentation for the reference price pipeline.
+##
+## Stages are wrapped in spans:
+##
+##   with instrument.span('rcp', rows=n) as s:
+##       ...
+##       s['rows'] = n          # rows can also be filled in once they are known
+##
+## A span records its wall time, the rows it processed and the change in process resident memory.
+## Finished spans go to a bounded process-wide buffer and to whatever trace() is active in the
+## current context, so one app run (one Streamlit script thread) can show just its own spans.
+## Spans cost a perf_counter and a /proc read, so they stay on in production.
+##
+##   python -m bess_isc.instrument --duration 4 --capacity 100 --format prom
+##
+## runs the pipeline once headless, bypassing the on-disk caches, and prints its spans as JSON
+## lines or Prometheus text.
+
+import argparse
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+BUFFER_SIZE = 10000
+
+_lock = threading.Lock()
+_recent = deque(maxlen=BUFFER_SIZE)
+_trace = contextvars.ContextVar('bess_isc_trace', default=None)
+_depth = contextvars.ContextVar('bess_isc_span_depth', default=0)
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+@contextmanager
+def span(name, rows=None, **attrs):
+    record = {'stage': name, 'rows': rows, **attrs}
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    rss = _rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        elapsed = time.perf_counter() - start
+        _depth.reset(token)
+        end_rss = _rss_bytes()
+        record.update(depth=depth, elapsed_ms=elapsed * 1000, ts=time.time(),
+                      mem_delta_kb=(end_rss - rss) / 1024 if rss is not None and end_rss is not None else None)
+        with _lock:
+            _recent.append(record)
+        spans = _trace.get()
+        if spans is not None:
+            spans.append(record)
+
+## Collect the spans finished inside the block (in this thread / context) into a list.
+
+@contextmanager
+def trace():
+    spans = []
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+def recent(n=None):
+    with _lock:
+        spans = list(_recent)
+    return spans[-n:] if n else spans
+
+def to_jsonl(spans):
+    return ''.join(json.dumps(record, default=str) + '\n' for record in spans)
+
+## Prometheus text exposition: per-stage count and sums of seconds, rows and memory delta.
+
+def to_prometheus(spans, prefix='bess_isc_stage'):
+    totals = {}
+    for record in spans:
+        stage = totals.setdefault(record['stage'], {'count': 0, 'seconds': 0.0, 'rows': 0, 'mem': 0.0})
+        stage['count'] += 1
+        stage['seconds'] += record['elapsed_ms'] / 1000
+        stage['rows'] += record.get('rows') or 0
+        stage['mem'] += (record.get('mem_delta_kb') or 0) * 1024
+    lines = [f'# HELP {prefix}_seconds Wall time spent in each pipeline stage.',
+             f'# TYPE {prefix}_seconds summary']
+    for name, stage in totals.items():
+        lines.append(f'{prefix}_seconds_sum{{stage="{name}"}} {stage["seconds"]:.6f}')
+        lines.append(f'{prefix}_seconds_count{{stage="{name}"}} {stage["count"]}')
+    lines += [f'# HELP {prefix}_rows_total Rows processed by each pipeline stage.', f'# TYPE {prefix}_rows_total counter']
+    lines += [f'{prefix}_rows_total{{stage="{name}"}} {stage["rows"]}' for name, stage in totals.items()]
+    lines += [f'# HELP {prefix}_memory_delta_bytes_total Change in resident memory across each stage.',
+              f'# TYPE {prefix}_memory_delta_bytes_total counter']
+    lines += [f'{prefix}_memory_delta_bytes_total{{stage="{name}"}} {stage["mem"]:.0f}' for name, stage in totals.items()]
+    return '\n'.join(lines) + '\n'
+
+## One uncached end-to-end run: store check, REAP table build, RCP, reference prices, revenue
+## tables, hub zone geometry and the figures the app would draw.
+
+def headless_run(duration, capacity):
+    from bess_isc import figures, geometry, pipeline, reap, store
+
+    with trace() as spans:
+        with span('run', duration=duration, capacity=capacity):
+            manifest = store.ensure_store()
+            reap.build_reap_table(manifest)
+            reap_table = reap.load_reap_table(manifest, pipeline.HUBS)
+            rcps = pipeline.reference_capacity_prices(manifest, rebuild=True)
+            core = pipeline.reference_prices(duration, manifest, reap_table, rcps)
+            pipeline.revenue_tables(core, capacity)
+            with span('geometry'):
+                features = geometry.web_features()
+            with span('figures'):
+                codes = [feature['properties']['hub zone'] for feature in features['features']]
+                values = dict(zip(codes, core['RP_df_test_year'].mean().values))
+                figures.hub_zone_choropleth(features, values, dict(zip(codes, pipeline.HUB_ZONES)), 'Reference Price').get_root().render()
+                for chart in (figures.reference_price_chart, figures.bar_reference_price_chart, figures.test_year_chart):
+                    chart(core).to_dict()
+    return spans
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the reference price pipeline once and export its stage spans.')
+    parser.add_argument('--duration', type=int, default=4)
+    parser.add_argument('--capacity', type=float, default=100)
+    parser.add_argument('--format', choices=['jsonl', 'prom'], default='jsonl')
+    parser.add_argument('--out', help='write here instead of stdout')
+    args = parser.parse_args(argv)
+
+    spans = headless_run(args.duration, args.capacity)
+    text = to_prometheus(spans) if args.format == 'prom' else to_jsonl(spans)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+if __name__ == '__main__':
+    ## run through the imported module so these spans share state with the ones in store, reap, ...
+    from bess_isc import instrument
+    instrument.main()
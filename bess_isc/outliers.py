@@ -0,0 +1,85 @@
+## Outlier stage over the (year x hub zone x month) reference price array.
+##
+## A rule flags cells and every flagged cell is replaced by the mean of the same hub zone and month
+## in the other years that are not flagged themselves. Rules are short strings, so they can come
+## from the app, a CLI flag or the BESS_ISC_OUTLIERS environment variable:
+##
+##   manual:2023-Aug        the listed year-months (comma separated, Aug or 08), in every hub zone
+##   zscore:3               cells more than 3 standard deviations from their hub zone's mean
+##   iqr:3                  cells more than 3 IQRs beyond their hub zone's quartiles
+##   none                   no adjustment
+##
+## The z-score and IQR statistics are taken per hub zone over all of its (year, month) cells; with
+## only three years a per-month statistic could never exceed sqrt(2) standard deviations. On the
+## bundled 2022-2024 data zscore:3 flags August 2023 alone, the original hand adjustment, at every
+## duration and mode; iqr:3 also flags July 2022 in one to two hub zones at some durations of REAP
+## (2 hours) and of Optimal dispatch (most of them).
+
+import os
+
+import numpy as np
+
+from bess_isc import store
+
+RULES = ['manual', 'zscore', 'iqr', 'none']
+DEFAULT_THRESHOLD = {'zscore': 3.0, 'iqr': 3.0}
+DEFAULT_RULE = os.environ.get('BESS_ISC_OUTLIERS', 'manual:2023-Aug')
+
+## 'zscore:2.5' -> ('zscore', 2.5); 'manual:2023-Aug,2024-01' -> ('manual', [(2023, 8), (2024, 1)])
+
+def parse_rule(rule):
+    name, _, arg = rule.strip().partition(':')
+    if name not in RULES:
+        raise ValueError(f'unknown outlier rule {rule!r}; expected one of {", ".join(RULES)}')
+    if name == 'manual':
+        cells = []
+        for cell in filter(None, arg.split(',')):
+            year, _, month = cell.strip().partition('-')
+            if not year.isdigit() or not (month.isdigit() and 1 <= int(month) <= 12 or month.title() in store.MONTHS):
+                raise ValueError(f'manual outlier month {cell.strip()!r} is not a year-month such as 2023-Aug or 2023-08')
+            cells.append((int(year), int(month) if month.isdigit() else store.MONTHS.index(month.title()) + 1))
+        return name, cells
+    if name == 'none':
+        return name, None
+    return name, float(arg) if arg else DEFAULT_THRESHOLD[name]
+
+## Boolean mask, same shape as RP (years, hub zones, 12).
+
+def detect(RP, years, rule=DEFAULT_RULE):
+    name, arg = parse_rule(rule)
+    mask = np.zeros(RP.shape, dtype=bool)
+    if name == 'manual':
+        for year, month in arg:
+            if year not in years:
+                raise ValueError(f'manual outlier year {year} is not in the store ({years[0]}-{years[-1]})')
+            mask[list(years).index(year), :, month - 1] = True
+    elif name == 'zscore':
+        mean = np.nanmean(RP, axis=(0, 2), keepdims=True)
+        std = np.nanstd(RP, axis=(0, 2), keepdims=True)
+        mask = np.abs(RP - mean) > arg * std
+    elif name == 'iqr':
+        q1, q3 = np.nanpercentile(RP, [25, 75], axis=(0, 2), keepdims=True)
+        mask = (RP < q1 - arg * (q3 - q1)) | (RP > q3 + arg * (q3 - q1))
+    return mask
+
+## Flagged cells -> mean of the unflagged, finite other years; cells with no such year stay as they are.
+
+def adjust(RP, mask):
+    valid = ~mask & np.isfinite(RP)
+    count = valid.sum(axis=0)
+    replacement = np.where(valid, RP, 0.0).sum(axis=0) / np.where(count, count, 1)
+    return np.where(mask & (count > 0), replacement, RP)
+
+## Flagged cells as (year, month, hub zone index) rows, for reporting.
+
+def flagged(mask, years):
+    return [(years[y], store.MONTHS[m], h) for y, h, m in np.argwhere(mask)]
+
+## One line for the app: 'Aug 2023 (all hub zones), Feb 2021 (Houston, North)'.
+
+def describe(mask, years, names):
+    parts = []
+    for y, m in sorted({(y, m) for y, _, m in np.argwhere(mask)}):
+        hubs = [names[h] for h in np.flatnonzero(mask[y, :, m])]
+        parts.append(f'{store.MONTHS[m]} {years[y]} ({"all hub zones" if len(hubs) == len(names) else ", ".join(hubs)})')
+    return ', '.join(parts)
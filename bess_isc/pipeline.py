@@ -0,0 +1,277 @@
+## Reference price pipeline behind RP_tables, split in two layers:
+##
+##   reference_prices(duration)   capacity-independent core: monthly reference prices per hub zone
+##                                for each year, the outlier adjustment (see outliers.py), the test
+##                                year and the strike price in $/MWh. This is the expensive part and
+##                                is cached.
+##   revenue_tables(core, ...)    linear in capacity: monthly reference revenues, annual strike
+##                                revenues and Index Storage Credits. Cheap enough to redo on
+##                                every move of the capacity slider.
+
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from bess_isc import dispatch, instrument, outliers, reap, rt, store
+
+MONTHS = store.MONTHS
+HUBS = store.HUBS
+HUB_ZONES = ['Houston','North','Panhandle','South','West']
+
+## The years averaged into the test year; every year in the store gets its own reference prices.
+TEST_YEARS = [2022, 2023, 2024]
+
+DAYS_PER_MONTH = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+WEEKS_PER_MONTH = 4.5
+
+## CONE: NREL 2024 battery system cost y = 240.8x + 379.16 ($/kW, x = duration in hours),
+## paid back over 15 years. Capacity cancels out of the per-MWh strike price. Both broadcast over
+## numpy arrays of durations and cost assumptions (see sensitivity.py).
+
+CAPEX_SLOPE = 240.8
+CAPEX_INTERCEPT = 379.16
+PAYBACK_YEARS = 15
+
+def capital_cost(duration, slope=CAPEX_SLOPE, intercept=CAPEX_INTERCEPT):
+    return slope * duration + intercept
+
+def strike_price(duration, slope=CAPEX_SLOPE, intercept=CAPEX_INTERCEPT, payback_years=PAYBACK_YEARS):
+    if np.any(np.asarray(duration) <= 0):
+        raise ValueError('the strike price needs a duration of more than 0 hours')
+    if np.any(np.asarray(payback_years) <= 0):
+        raise ValueError('the strike price needs a payback period of more than 0 years')
+    annual_revenues_needed_per_mw = capital_cost(duration, slope, intercept) * 1000 / payback_years
+    periods_per_year = np.where(np.asarray(duration) <= reap.DAILY_MAX_DURATION, 365, 52)
+    return annual_revenues_needed_per_mw/(periods_per_year*duration)
+
+## Days per month for daily REAP durations, 4.5 weeks per month for weekly ones.
+
+def periods_per_month(duration):
+    if duration <= reap.DAILY_MAX_DURATION:
+        return np.array(DAYS_PER_MONTH, dtype=float)
+    return np.full(12, WEEKS_PER_MONTH)
+
+## The flat Reference Capacity Price: the four original products averaged equally, hour by hour,
+## then over the month. ECRS is priced hour by hour in ancillary.py instead.
+
+RCP_PRODUCTS = ['REGDN','REGUP','RRS','NSPIN']
+
+def RCP(df):
+    monthly_rcp = []
+    for month in df.index.month.unique():
+        df_month = pd.DataFrame(df[df.index.month==month])
+        df_month['avg price'] = df_month[RCP_PRODUCTS].mean(axis=1)
+        monthly_avg_rcp = np.mean(df_month['avg price'])
+        monthly_rcp.append(monthly_avg_rcp)
+    return monthly_rcp
+
+## One year of reference prices (points x 12) as a table: one column per hub zone (or per
+## settlement point, for node-level prices), one row per month.
+
+def reference_price_df(RP_rows, names=HUB_ZONES):
+    RP_df = pd.DataFrame({f'{hz} Reference Price': RP_row for hz, RP_row in zip(names, RP_rows)})
+    RP_df.index = MONTHS
+    return RP_df
+
+## Arbitrage revenue per MWh of energy capacity by (year, point, month, duration): the REAP
+## heuristic, optimal state-of-charge dispatch at a round-trip efficiency (see dispatch.py), the
+## REAP of real-time 15-minute prices (see rt.py), or an hour-by-hour allocation between energy
+## arbitrage and the ancillary service products (see ancillary.py), which prices capacity itself.
+
+ALLOCATION_MODE = 'Hourly AS allocation'
+ARBITRAGE_MODES = ['REAP', 'Optimal dispatch', 'Real-time REAP', ALLOCATION_MODE]
+
+def arbitrage_table(manifest, mode='REAP', efficiency=dispatch.EFFICIENCY, points=HUBS):
+    if mode == 'REAP':
+        return reap.load_reap_table(manifest, points)
+    if mode == 'Optimal dispatch':
+        return dispatch.load_dispatch_table(manifest, efficiency, points)
+    if mode == 'Real-time REAP':
+        return rt.load_rt_table(manifest, points)
+    if mode == ALLOCATION_MODE:
+        from bess_isc import ancillary
+        return ancillary.allocation_table(manifest, points)
+    raise ValueError(f'unknown arbitrage mode {mode!r}')
+
+## Monthly Reference Capacity Prices per year; independent of both duration and capacity.
+## Kept as a monthly table next to the store so only months with new data are recomputed;
+## months without capacity prices are NaN.
+
+def reference_capacity_prices(manifest, store_dir=store.STORE_DIR, rebuild=False):
+    def compute(year, month):
+        return RCP(store.load_cap_prices(manifest, year, store_dir, months=[month]))[0]
+
+    table = store.monthly_table('rcp_table', manifest, 'cap', (), compute, stage='rcp',
+                                store_dir=store_dir, rebuild=rebuild)
+    return {year: list(table[i]) for i, year in enumerate(store.years(manifest))}
+
+## Reference prices of the hub zones, or of any settlement points: points picks the arbitrage table
+## rows (reap_table, if given, must hold exactly those rows) and names labels the columns. The
+## (year x point x month) array goes through the outlier stage as a whole; RP_dfs are the raw
+## prices and RP_dfs_adjusted the ones the test year averages over test_years (default TEST_YEARS).
+
+def reference_prices(duration, manifest=None, reap_table=None, rcps=None, points=HUBS, names=HUB_ZONES,
+                     mode='REAP', efficiency=dispatch.EFFICIENCY, outlier_rule=outliers.DEFAULT_RULE, test_years=None):
+    if not 1 <= duration <= reap.MAX_DURATION:
+        raise ValueError(f'duration must be between 1 and {reap.MAX_DURATION} hours, not {duration}')
+    manifest = manifest or store.ensure_store()
+    test_years = list(test_years or TEST_YEARS)
+    if reap_table is None:
+        reap_table = arbitrage_table(manifest, mode, efficiency, points)
+    if rcps is None:
+        rcps = reference_capacity_prices(manifest)
+    years = store.years(manifest)
+    if not set(test_years) <= set(years):
+        raise ValueError(f'test years {sorted(set(test_years) - set(years))} are not in the store ({years[0]}-{years[-1]})')
+
+    if mode == ALLOCATION_MODE:
+        rcps = {year: np.zeros(12) for year in years}
+
+    with instrument.span('reference_prices', duration=duration, rows=len(years) * len(points) * 12):
+        ## Reference price = Reference Capacity Price + REAP
+        RP = np.stack([np.asarray(rcps[year])[None, :] + reap_table[i, :, :, duration - 1] for i, year in enumerate(years)])
+
+        with instrument.span('outliers', rule=outlier_rule) as s:
+            mask = outliers.detect(RP, years, outlier_rule)
+            RP_adjusted = outliers.adjust(RP, mask)
+            s['rows'] = int(mask.sum())
+
+        RP_dfs = {year: reference_price_df(RP[i], names) for i, year in enumerate(years)}
+        RP_dfs_adjusted = {year: reference_price_df(RP_adjusted[i], names) for i, year in enumerate(years)}
+
+        ## Test year for reference prices
+        RP_df_test_year = pd.DataFrame({col: np.mean([RP_dfs_adjusted[year][col] for year in test_years], axis=0)
+                                        for col in RP_dfs[years[0]].columns})
+        RP_df_test_year.index = MONTHS
+
+    return {'duration': duration,
+            'mode': mode,
+            'RP_dfs': RP_dfs,
+            'RP_dfs_adjusted': RP_dfs_adjusted,
+            'outlier_rule': outlier_rule,
+            'outliers': mask,
+            'test_years': test_years,
+            'RP_df_test_year': RP_df_test_year,
+            'strike_price': strike_price(duration)}
+
+## Years with adjusted months, labelled for tables and charts: {2023: '2023 (Aug adjusted)'}.
+
+def adjusted_years(core):
+    years = list(core['RP_dfs'])
+    return {years[y]: f"{years[y]} ({', '.join(MONTHS[m] for m in np.flatnonzero(core['outliers'][y].any(axis=0)))} adjusted)"
+            for y in np.flatnonzero(core['outliers'].any(axis=(1, 2)))}
+
+## Node-level reference prices for every settlement point in the store (hubs, hub averages and
+## load zones), as one tidy frame: year (or 'Test Year'), month, settlement point, reference price.
+
+def point_reference_prices(duration, manifest=None, reap_table=None, rcps=None, mode='REAP', efficiency=dispatch.EFFICIENCY,
+                           outlier_rule=outliers.DEFAULT_RULE):
+    manifest = manifest or store.ensure_store()
+    points = store.settlement_points(manifest)
+    core = reference_prices(duration, manifest, reap_table, rcps, points, points, mode, efficiency, outlier_rule)
+    return tidy_reference_prices(core)
+
+## A core's reference prices as one tidy frame: each year as is, the years with outlier
+## adjustments again as adjusted, and the test year.
+
+def tidy_reference_prices(core, column='settlement_point'):
+    frames = {**core['RP_dfs'], **{label: core['RP_dfs_adjusted'][year] for year, label in adjusted_years(core).items()},
+              'Test Year': core['RP_df_test_year']}
+    return pd.concat([RP_df.rename(columns=lambda col: col.replace(' Reference Price', '')).rename_axis('month')
+                      .reset_index().melt(id_vars='month', var_name=column, value_name='reference_price')
+                      .assign(year=str(year), duration_h=core['duration'])
+                      for year, RP_df in frames.items()], ignore_index=True)[
+        ['duration_h', 'year', 'month', column, 'reference_price']]
+
+## DAM against real-time reference prices and ISCs per hub zone for one battery. Both use the DAM
+## Reference Capacity Prices; only the arbitrage part differs.
+
+def dam_rt_comparison(duration, capacity, manifest=None, rcps=None, outlier_rule=outliers.DEFAULT_RULE):
+    manifest = manifest or store.ensure_store()
+    rcps = rcps if rcps is not None else reference_capacity_prices(manifest)
+    rows = {}
+    for label, mode in (('DAM', 'REAP'), ('RT', 'Real-time REAP')):
+        core = reference_prices(duration, manifest, rcps=rcps, mode=mode, outlier_rule=outlier_rule)
+        total_revenues_df = revenue_tables(core, capacity)[1]
+        rows[f'{label} Test Year Reference Price ($/MWh)'] = core['RP_df_test_year'].mean().values
+        rows[f'{label} Annual Reference Revenues ($)'] = total_revenues_df.iloc[0].values
+        rows[f'{label} Index Storage Credits ($)'] = total_revenues_df.iloc[2].values
+    comparison = pd.DataFrame(rows, index=HUB_ZONES)
+    comparison['RT - DAM Index Storage Credits ($)'] = comparison['RT Index Storage Credits ($)'] - comparison['DAM Index Storage Credits ($)']
+    return comparison
+
+## Revenue and ISC layer: everything here scales linearly with capacity.
+
+def revenue_tables(core, capacity):
+    with instrument.span('revenue', duration=core['duration'], capacity=capacity, rows=12 * len(HUB_ZONES)):
+        return _revenue_tables(core, capacity)
+
+def _revenue_tables(core, capacity):
+    duration = core['duration']
+    energy = capacity * duration
+    periods = periods_per_month(duration)
+
+    revenues_df = pd.DataFrame({f'{hz} Monthly Reference Revenue ($)': core['RP_df_test_year'][f'{hz} Reference Price'].values * energy * periods
+                                for hz in HUB_ZONES})
+    revenues_df.index = MONTHS
+
+    strike_revenues = sum(core['strike_price'] * energy * periods)
+
+    ## a hub zone missing any test year month (e.g. real-time prices not covering the test years)
+    ## has no annual revenues or ISC rather than the revenues of the months it has
+    annual_revenues = revenues_df.sum(min_count=len(MONTHS)).values
+    total_revenues_df = pd.DataFrame({f'{hz} Hub Zone': [annual, strike_revenues, strike_revenues - annual]
+                                      for hz, annual in zip(HUB_ZONES, annual_revenues)})
+    total_revenues_df.index = ['Annual Reference Revenues ($)','Annual Strike Price Revenues ($)','Index Storage Credits (Incentives Needed)']
+
+    neg_hzs = [hz for hz, isc in zip(HUB_ZONES, total_revenues_df.iloc[2]) if isc < 0]
+    max_hub_zone = total_revenues_df.iloc[0].idxmax() if total_revenues_df.iloc[0].notna().any() else None
+    hub_zone_descending = total_revenues_df.iloc[2].dropna().sort_values(ascending=False).index.to_list()
+
+    return revenues_df, total_revenues_df, max_hub_zone, hub_zone_descending, neg_hzs
+
+## Shared by the command line tools: the arbitrage mode, round-trip efficiency and outlier rule
+## arguments, the duration range check and the .csv / .parquet writer.
+
+def outlier_rule(rule):
+    try:
+        outliers.parse_rule(rule)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return rule
+
+def add_model_arguments(parser, modes=ARBITRAGE_MODES, efficiency=True):
+    if modes:
+        parser.add_argument('--mode', choices=modes, default='REAP', help='arbitrage revenue model (default REAP)')
+    if efficiency:
+        parser.add_argument('--efficiency', type=float, default=dispatch.EFFICIENCY, help='round-trip efficiency for optimal dispatch')
+    parser.add_argument('--outliers', type=outlier_rule, default=outliers.DEFAULT_RULE, help="outlier rule, e.g. 'manual:2023-Aug', 'zscore:3', 'iqr:3' or 'none'")
+
+def check_durations(parser, durations):
+    if min(durations) < 1 or max(durations) > reap.MAX_DURATION:
+        parser.error(f'duration{"s" if len(durations) > 1 else ""} must be between 1 and {reap.MAX_DURATION} hours')
+
+def write_table(df, out):
+    if str(out).endswith('.parquet'):
+        df.to_parquet(out, index=False)
+    else:
+        df.to_csv(out, index=False)
+
+## python -m bess_isc.pipeline --duration 4 --out reference_prices_by_point.csv
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export monthly reference prices for every settlement point.')
+    parser.add_argument('--duration', type=int, default=4)
+    add_model_arguments(parser)
+    parser.add_argument('--out', default='reference_prices_by_point.csv', help='.csv or .parquet output path')
+    args = parser.parse_args(argv)
+    check_durations(parser, [args.duration])
+
+    df = point_reference_prices(args.duration, mode=args.mode, efficiency=args.efficiency, outlier_rule=args.outliers)
+    write_table(df, args.out)
+    print(f"{df['settlement_point'].nunique()} settlement points, {len(df)} rows -> {args.out}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
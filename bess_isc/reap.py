@@ -0,0 +1,145 @@
+## Batched Reference Energy Arbitrage Price (REAP) engine.
+##
+## The hourly prices of a hub-year are laid out as a (periods x hours) array, one row per day
+## (or per ISO week within a month for batteries longer than 8 hours), padded with NaN for
+## short days, DST days and partial weeks. The top-k and bottom-k hours of every row come
+## from np.partition, so all twelve monthly REAPs of any number of series come out of one call.
+## Results match the original per-day pandas loop: the k highs (descending) are paired with the
+## k lows (ascending), each period is the mean of those spreads and each month is the mean
+## of its periods.
+
+import numpy as np
+import pandas as pd
+
+from bess_isc import instrument, store
+
+DAILY_MAX_DURATION = 8
+
+def default_period(duration):
+    return 'day' if duration <= DAILY_MAX_DURATION else 'week'
+
+## Period keys follow the original grouping: calendar day, or ISO week number within a month.
+## Rows must be in chronological order; a period is a run of equal keys.
+
+def period_keys(times, period):
+    dates = np.asarray(times).astype('datetime64[D]')
+    if period == 'day':
+        return dates.astype(np.int64)
+    if period == 'week':
+        unique_dates, inverse = np.unique(dates, return_inverse=True)
+        week = pd.DatetimeIndex(unique_dates).isocalendar().week.to_numpy(np.int64)[inverse]
+        return dates.astype('datetime64[M]').astype(np.int64) * 100 + week
+    raise ValueError(f'unknown period {period!r}')
+
+def period_layout(hours, period):
+    month = np.asarray(hours).astype('datetime64[M]')
+    key = period_keys(hours, period)
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    lengths = np.diff(np.r_[starts, len(key)])
+    period_id = np.repeat(np.arange(len(starts)), lengths)
+    position = np.arange(len(key)) - starts[period_id]
+    period_month = (month[starts].astype(np.int64) % 12) + 1
+    return period_id, position, lengths, period_month
+
+## prices is (hours,) or (series, hours); returns a (periods x max length) padded cube.
+
+def period_cube(prices, layout):
+    period_id, position, lengths, _ = layout
+    prices = np.atleast_2d(np.asarray(prices, dtype=np.float64))
+    cube = np.full((prices.shape[0], len(lengths), lengths.max()), np.nan)
+    cube[:, period_id, position] = prices
+    return cube
+
+## Sorted k highest (descending) and k lowest (ascending) values of every row.
+## NaN padding sorts last in both, so rows shorter than k end in NaN.
+
+def top_bottom(cube, k):
+    k = min(k, cube.shape[-1])
+    low = np.sort(np.partition(cube, k - 1, axis=-1)[..., :k], axis=-1)
+    high = -np.sort(np.partition(-cube, k - 1, axis=-1)[..., :k], axis=-1)
+    return high, low
+
+def period_reap(cube, duration):
+    if duration < 1:
+        raise ValueError('duration must be at least 1 hour')
+    high, low = top_bottom(cube, duration)
+    spread = high - low
+    if np.isnan(spread).any():
+        return np.nanmean(spread, axis=-1)
+    return np.mean(spread, axis=-1)
+
+## Means are taken one 1-D row at a time so the summation order, and therefore every bit of
+## the result, is the same as np.mean over the original per-month list of period REAPs.
+
+def monthly_mean(values, period_month):
+    values = np.atleast_2d(values)
+    out = np.full((values.shape[0], 12), np.nan)
+    for month in range(1, 13):
+        selected = np.flatnonzero(period_month == month)
+        if len(selected):
+            for row in range(values.shape[0]):
+                out[row, month - 1] = np.mean(values[row, selected])
+    return out
+
+## Monthly REAP (Jan..Dec) for one series (hours,) -> (12,) or many series (S, hours) -> (S, 12).
+
+def reap_monthly(hours, prices, duration, period=None):
+    layout = period_layout(hours, period or default_period(duration))
+    monthly = monthly_mean(period_reap(period_cube(prices, layout), duration), layout[3])
+    return monthly if np.ndim(prices) > 1 else monthly[0]
+
+## REAP for every duration 1..max_duration at once.
+## Each day and week is sorted a single time; the running sums of the paired high-low spreads
+## then give the period REAP for every k, and the monthly means follow as above.
+## Returns (series, 12, max_duration), daily periods for k <= 8 and weekly periods above.
+
+MAX_DURATION = 20
+
+def reap_all_durations(hours, prices, max_duration=MAX_DURATION):
+    prices = np.atleast_2d(np.asarray(prices, dtype=np.float64))
+    out = np.full((prices.shape[0], 12, max_duration), np.nan)
+    for period, durations in (('day', range(1, min(DAILY_MAX_DURATION, max_duration) + 1)),
+                              ('week', range(DAILY_MAX_DURATION + 1, max_duration + 1))):
+        if len(durations) == 0:
+            continue
+        layout = period_layout(hours, period)
+        cube = period_cube(prices, layout)
+        k = min(durations[-1], cube.shape[-1])
+        ordered = np.sort(cube, axis=-1)
+        count = (~np.isnan(cube)).sum(axis=-1)
+        top = np.clip(count[..., None] - 1 - np.arange(k), 0, None)
+        high = np.take_along_axis(ordered, top, axis=-1)
+        spread = np.where(np.arange(k) < count[..., None], high - ordered[..., :k], 0.0)
+        running = np.cumsum(spread, axis=-1) / np.minimum(np.arange(1, k + 1), count[..., None])
+        for duration in durations:
+            out[:, :, duration - 1] = monthly_mean(running[..., min(duration, k) - 1], layout[3])
+    return out
+
+## The (year x settlement point x month x duration) table covers every settlement point in the
+## store and is kept next to it as a monthly table (see store.monthly_table): each month's REAPs
+## come from that month's hours alone, since days and ISO-week-within-month periods never cross a
+## month, so only months whose sources changed are recomputed. Points missing from a month are NaN.
+## Years are those of the store, in order.
+
+def build_reap_table(manifest, max_duration=MAX_DURATION, store_dir=store.STORE_DIR, rebuild=True):
+    points = store.settlement_points(manifest)
+
+    def compute(year, month):
+        present = [point for point in points if point in manifest['partitions'][store.partition_id('dam', year, month)]['points']]
+        hours, prices = store.load_hub_matrix(manifest, year, present, store_dir, months=[month])
+        cell = np.full((len(points), max_duration), np.nan)
+        cell[[points.index(point) for point in present]] = reap_all_durations(hours, prices, max_duration)[:, month - 1, :]
+        return cell
+
+    table = store.monthly_table('reap_table', manifest, 'dam', (len(points), max_duration), compute,
+                                key={'points': points, 'max_duration': max_duration},
+                                stage='reap', store_dir=store_dir, rebuild=rebuild)
+    return np.moveaxis(table, 1, 2)
+
+## The table rows for the given settlement points (default the five hubs), as (year, point, month, duration).
+
+def load_reap_table(manifest, points=store.HUBS, max_duration=MAX_DURATION, store_dir=store.STORE_DIR):
+    with instrument.span('reap_table'):
+        table = build_reap_table(manifest, max_duration, store_dir, rebuild=False)
+        all_points = store.settlement_points(manifest)
+        return np.ascontiguousarray(table[:, [all_points.index(point) for point in points]])
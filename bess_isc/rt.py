@@ -0,0 +1,247 @@
+## Real-time market (RTM) 15-minute settlement point prices, streamed.
+##
+## RTM drops go in ercot_data/rt/ as RTM_Hub_Prices_{year}.xlsx / .csv (NP6-785) or daily
+## RTM_Hub_Prices_{yyyymmdd}.csv extracts for years without an annual file, with ERCOT's columns
+## (Delivery Date, Delivery Hour, Delivery Interval, Settlement Point Name, Settlement Point Price).
+## They are about four times the rows of the DAM per point, so they are never loaded whole: each
+## file is read in chunks (openpyxl read-only rows for xlsx) and every chunk is folded into running
+## per (settlement point, period) extremes: the top and bottom k interval prices of every day and
+## every ISO week within a month, with the interval count and the first interval. Those are all a
+## REAP needs, so memory is bounded by the number of periods, not the number of rows.
+##
+## A battery of d hours runs for 4d intervals, so the RT REAP of a period is the mean of its 4d
+## highest-minus-lowest interval spreads, the DAM formula at interval resolution. The extremes
+## are kept under ercot_data/store/rt/; new files are folded into them, and a changed or removed
+## file restarts the fold.
+##
+##   python -m bess_isc.rt                                  fold any new RTM files into the state
+##   python -m bess_isc.rt --compare --duration 4 --capacity 100
+
+import argparse
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bess_isc import instrument, reap, store
+
+RT_DIR = store.DATA_DIR / store.RT_DIR
+RT_STORE_DIR = store.STORE_DIR / 'rt'
+RT_VERSION = 1
+INTERVALS_PER_HOUR = 4
+CHUNK_ROWS = 250_000
+PERIODS = ('day', 'week')
+
+RT_FILE = re.compile(r'RTM_Hub_Prices_(\d{4})(\d{4})?\.(csv|xlsx)')
+
+## RTM files in date order; an annual file replaces the daily extracts of its year.
+
+def rt_sources(rt_dir=RT_DIR):
+    rt_dir = Path(rt_dir)
+    if not rt_dir.is_dir():
+        return []
+    files = [(path, RT_FILE.fullmatch(path.name)) for path in sorted(rt_dir.iterdir())]
+    files = [(path, match) for path, match in files if match]
+    annual = {match[1] for _, match in files if not match[2]}
+    return [path for path, match in files if not match[2] or match[1] not in annual]
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    path = Path(path)
+    if path.suffix == '.csv':
+        yield from pd.read_csv(path, chunksize=chunk_rows, dtype={'Delivery Date': str, 'Hour Ending': str})
+        return
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == chunk_rows:
+                    yield pd.DataFrame(batch, columns=header)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+## Interval beginning of every row. Hourly DAM-style rows ('Hour Ending' '01:00'..'24:00') are one
+## interval per hour, so the same fold also runs over hourly data.
+
+def interval_keys(df, intervals_per_hour=INTERVALS_PER_HOUR):
+    dates = df['Delivery Date']
+    if isinstance(dates.iloc[0], str):
+        dates = pd.to_datetime(dates, format='%m/%d/%Y')
+    dates = pd.to_datetime(dates).values.astype('datetime64[D]').astype('datetime64[m]')
+    if 'Delivery Hour' in df:
+        hour = df['Delivery Hour'].astype(int).values
+        interval = df['Delivery Interval'].astype(int).values
+    else:
+        hour = df['Hour Ending'].astype(str).str.slice(0, 2).astype(int).values
+        interval = np.ones(len(df), dtype=int)
+    minutes = (hour - 1) * 60 + (interval - 1) * (60 // intervals_per_hour)
+    return dates + minutes.astype('timedelta64[m]')
+
+def point_names(df):
+    return (df['Settlement Point Name'] if 'Settlement Point Name' in df else df['Settlement Point']).astype(str).values
+
+## Running extremes of one period kind: parallel arrays with one row per (point, period).
+
+def empty_extremes(k):
+    return {'point': np.empty(0, np.int64), 'key': np.empty(0, np.int64), 'first': np.empty(0, 'datetime64[m]'),
+            'count': np.empty(0, np.int64), 'top': np.empty((0, k)), 'bottom': np.empty((0, k))}
+
+def _pad(values, k):
+    return np.pad(values, ((0, 0), (0, k - values.shape[1])), constant_values=np.nan)
+
+def fold(extremes, codes, times, prices, period):
+    k = extremes['top'].shape[1]
+    keys = reap.period_keys(times, period)
+    order = np.lexsort((keys, codes))
+    codes, keys, times, prices = codes[order], keys[order], times[order], prices[order]
+
+    starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (keys[1:] != keys[:-1])])
+    lengths = np.diff(np.r_[starts, len(codes)])
+    group = np.repeat(np.arange(len(starts)), lengths)
+    cube = np.full((len(starts), lengths.max()), np.nan)
+    cube[group, np.arange(len(codes)) - starts[group]] = prices
+    top, bottom = (_pad(values, k) for values in reap.top_bottom(cube, k))
+
+    index = {pair: row for row, pair in enumerate(zip(extremes['point'].tolist(), extremes['key'].tolist()))}
+    pairs = list(zip(codes[starts].tolist(), keys[starts].tolist()))
+    new = [i for i, pair in enumerate(pairs) if pair not in index]
+    if new:
+        fresh = empty_extremes(k)
+        fresh.update(point=codes[starts][new], key=keys[starts][new], first=times[starts][new],
+                     count=np.zeros(len(new), np.int64), top=np.full((len(new), k), np.nan), bottom=np.full((len(new), k), np.nan))
+        extremes = {name: np.concatenate([extremes[name], fresh[name]]) for name in extremes}
+        index.update({pairs[i]: len(index) + j for j, i in enumerate(new)})
+
+    rows = np.array([index[pair] for pair in pairs])
+    extremes['top'][rows] = reap.top_bottom(np.concatenate([extremes['top'][rows], top], axis=1), k)[0]
+    extremes['bottom'][rows] = reap.top_bottom(np.concatenate([extremes['bottom'][rows], bottom], axis=1), k)[1]
+    extremes['count'][rows] += lengths
+    extremes['first'][rows] = np.minimum(extremes['first'][rows], np.minimum.reduceat(times, starts))
+    return extremes
+
+## Monthly REAP (year -> (points, 12, durations)) from the extremes, the way
+## reap.reap_all_durations averages sorted spreads: pairs beyond a period's count add nothing.
+
+def monthly_reap(extremes, durations, n_points, intervals_per_hour=INTERVALS_PER_HOUR):
+    k = extremes['top'].shape[1]
+    count = extremes['count'][:, None]
+    spread = np.where(np.arange(k) < count, extremes['top'] - extremes['bottom'], 0.0)
+    running = np.cumsum(spread, axis=-1) / np.minimum(np.arange(1, k + 1), count)
+    values = running[:, [min(duration * intervals_per_hour, k) - 1 for duration in durations]]
+
+    order = np.lexsort((extremes['first'], extremes['point']))
+    year = extremes['first'].astype('datetime64[Y]').astype(int) + 1970
+    month = extremes['first'].astype('datetime64[M]').astype(int) % 12 + 1
+    out = {}
+    for y in np.unique(year):
+        table = out.setdefault(int(y), np.full((n_points, 12, len(durations)), np.nan))
+        for point in range(n_points):
+            rows = order[(extremes['point'][order] == point) & (year[order] == y)]
+            if len(rows):
+                table[point] = reap.monthly_mean(values[rows].T, month[rows]).T
+    return out
+
+## Fold any RTM files not yet in the state under store_dir and return (meta, extremes by period).
+
+def read_state(store_dir, max_duration, intervals_per_hour):
+    store_dir = Path(store_dir)
+    meta_path = store_dir / 'rt_state.json'
+    if meta_path.exists():
+        meta = json.loads(meta_path.read_text())
+        if meta.get('version') == RT_VERSION and meta['max_duration'] == max_duration and meta['intervals_per_hour'] == intervals_per_hour:
+            with np.load(store_dir / 'rt_state.npz') as saved:
+                return meta, {period: {name: saved[f'{period}_{name}'] for name in empty_extremes(0)} for period in PERIODS}
+    return None, None
+
+def write_state(meta, extremes, store_dir):
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    tmp = store_dir / 'rt_state.tmp.npz'
+    np.savez(tmp, **{f'{period}_{name}': values for period in PERIODS for name, values in extremes[period].items()})
+    os.replace(tmp, store_dir / 'rt_state.npz')
+    tmp = store_dir / 'rt_state.tmp'
+    tmp.write_text(json.dumps(meta, indent=1))
+    os.replace(tmp, store_dir / 'rt_state.json')
+
+def ensure_rt(rt_dir=RT_DIR, store_dir=RT_STORE_DIR, max_duration=reap.MAX_DURATION,
+              intervals_per_hour=INTERVALS_PER_HOUR, chunk_rows=CHUNK_ROWS):
+    with instrument.span('rt_load') as s:
+        meta, extremes = read_state(store_dir, max_duration, intervals_per_hour)
+        known = meta['sources'] if meta else {}
+        sources = {path.name: store.source_entry(path, known.get(path.name)) for path in rt_sources(rt_dir)}
+        if meta is None or any(sources.get(name, {}).get('sha256') != entry['sha256'] for name, entry in known.items()):
+            meta = {'version': RT_VERSION, 'max_duration': max_duration, 'intervals_per_hour': intervals_per_hour,
+                    'points': [], 'sources': {}}
+            k = {'day': min(reap.DAILY_MAX_DURATION, max_duration) * intervals_per_hour, 'week': max_duration * intervals_per_hour}
+            extremes = {period: empty_extremes(k[period]) for period in PERIODS}
+            known = {}
+
+        new = [path for path in rt_sources(rt_dir) if path.name not in known]
+        rows = 0
+        for path in new:
+            for chunk in read_chunks(path, chunk_rows):
+                with instrument.span('rt_chunk', rows=len(chunk), source=path.name):
+                    names, inverse = np.unique(point_names(chunk), return_inverse=True)
+                    meta['points'] += [name for name in names if name not in meta['points']]
+                    codes = np.array([meta['points'].index(name) for name in names])[inverse]
+                    times = interval_keys(chunk, intervals_per_hour)
+                    prices = chunk['Settlement Point Price'].values.astype(np.float64)
+                    for period in PERIODS:
+                        extremes[period] = fold(extremes[period], codes, times, prices, period)
+                rows += len(chunk)
+        if new or sources != meta['sources']:
+            meta['sources'] = sources
+            write_state(meta, extremes, store_dir)
+        s['rows'] = rows
+    return meta, extremes
+
+## RT REAP table laid out like the REAP table, (year, point, month, duration) over the years of the
+## DAM store so it drops into pipeline.reference_prices; years or points without RT data are NaN.
+
+def load_rt_table(manifest, points=store.HUBS, max_duration=reap.MAX_DURATION, rt_dir=RT_DIR, store_dir=RT_STORE_DIR,
+                  intervals_per_hour=INTERVALS_PER_HOUR):
+    meta, extremes = ensure_rt(rt_dir, store_dir, max_duration, intervals_per_hour)
+    with instrument.span('rt_table'):
+        n_points = len(meta['points'])
+        daily = range(1, min(reap.DAILY_MAX_DURATION, max_duration) + 1)
+        weekly = range(reap.DAILY_MAX_DURATION + 1, max_duration + 1)
+        by_year = monthly_reap(extremes['day'], daily, n_points, intervals_per_hour)
+        if len(weekly):
+            for year, table in monthly_reap(extremes['week'], weekly, n_points, intervals_per_hour).items():
+                by_year[year] = np.concatenate([by_year.get(year, np.full((n_points, 12, len(daily)), np.nan)), table], axis=-1)
+
+        table = np.full((len(store.years(manifest)), len(points), 12, max_duration), np.nan)
+        for i, year in enumerate(store.years(manifest)):
+            for j, point in enumerate(points):
+                if year in by_year and point in meta['points']:
+                    table[i, j] = by_year[year][meta['points'].index(point)]
+        return table
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fold real-time 15-minute prices into running REAP state and compare with the DAM.')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--compare', action='store_true', help='print DAM vs RT reference prices and ISCs')
+    parser.add_argument('--duration', type=int, default=4)
+    parser.add_argument('--capacity', type=float, default=100)
+    args = parser.parse_args(argv)
+
+    meta, extremes = ensure_rt(chunk_rows=args.chunk_rows)
+    print(f"{len(meta['sources'])} RTM files, {len(meta['points'])} settlement points, "
+          f"{len(extremes['day']['count'])} point-days, {int(extremes['day']['count'].sum())} intervals", file=sys.stderr)
+    if args.compare:
+        from bess_isc import pipeline
+        print(pipeline.dam_rt_comparison(args.duration, args.capacity).to_string(float_format=lambda x: f'{x:,.2f}'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+## CONE sensitivity: Index Storage Credits under other battery cost curves and payback periods.
+##
+##   python -m bess_isc.sensitivity --slopes 200-280:20 --intercepts 300-450:50 --paybacks 10-20:5 \
+##       --capacities 100 --out cone_sensitivity.csv --heatmap cone_sensitivity.html
+##
+## Reference revenues do not depend on the cost assumptions, so they are computed once per
+## duration (per MW, from the cached arbitrage table) and every variant is a broadcast of the
+## strike price formula against them:
+##
+##   isc[hub, duration, slope, intercept, payback, capacity]
+##       = capacity * (strike revenues per MW[duration, slope, intercept, payback] - reference revenues per MW[hub, duration])
+##
+## which is one numpy expression however many variants there are.
+
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from bess_isc import dispatch, outliers, pipeline, reap, sweep
+
+COST_PARAMETERS = ['capex_slope', 'capex_intercept', 'payback_years']
+DEFAULTS = {'capex_slope': pipeline.CAPEX_SLOPE, 'capex_intercept': pipeline.CAPEX_INTERCEPT,
+            'payback_years': pipeline.PAYBACK_YEARS}
+
+## Annual test year reference revenues of a 1 MW battery, (hub zone, duration), from the
+## reference_prices core of every duration.
+
+def reference_revenues(cores):
+    return np.stack([(core['RP_df_test_year'].values * duration * pipeline.periods_per_month(duration)[:, None]).sum(axis=0)
+                     for duration, core in cores.items()], axis=1)
+
+def reference_cores(durations, manifest=None, reap_table=None, rcps=None, mode='REAP', efficiency=dispatch.EFFICIENCY,
+                    outlier_rule=outliers.DEFAULT_RULE):
+    if manifest is None:
+        manifest, reap_table, rcps = sweep.load_shared(mode, efficiency)
+    return {duration: pipeline.reference_prices(duration, manifest, reap_table, rcps, mode=mode, efficiency=efficiency, outlier_rule=outlier_rule)
+            for duration in durations}
+
+## Strike price, strike revenues, reference revenues and ISCs over the whole grid, all broadcastable
+## to (hub zone, duration, slope, intercept, payback, capacity).
+
+def isc_array(revenues, durations, slopes, intercepts, paybacks, capacities):
+    duration, slope, intercept, payback, capacity = np.ix_(np.asarray(durations, dtype=float), np.asarray(slopes, dtype=float),
+                                                           np.asarray(intercepts, dtype=float), np.asarray(paybacks, dtype=float),
+                                                           np.asarray(capacities, dtype=float))
+    periods_per_year = np.where(duration <= reap.DAILY_MAX_DURATION, sum(pipeline.DAYS_PER_MONTH), 12 * pipeline.WEEKS_PER_MONTH)
+    strike = pipeline.strike_price(duration, slope, intercept, payback)
+    strike_revenues = strike * duration * periods_per_year * capacity
+    reference = np.asarray(revenues)[:, :, None, None, None, None] * capacity
+    return strike, strike_revenues, reference, strike_revenues - reference
+
+## Tidy surface, one row per (hub zone, duration, slope, intercept, payback, capacity), with the
+## same revenue columns as the sweep.
+
+def isc_surface(cores, slopes=(pipeline.CAPEX_SLOPE,), intercepts=(pipeline.CAPEX_INTERCEPT,),
+                paybacks=(pipeline.PAYBACK_YEARS,), capacities=(100,)):
+    durations = list(cores)
+    revenues = reference_revenues(cores)
+    strike, strike_revenues, reference, isc = isc_array(revenues, durations, slopes, intercepts, paybacks, capacities)
+    index = pd.MultiIndex.from_product([pipeline.HUB_ZONES, durations, slopes, intercepts, paybacks, capacities],
+                                       names=['hub_zone', 'duration_h'] + COST_PARAMETERS + ['capacity_mw'])
+    return pd.DataFrame({'strike_price_per_mwh': np.broadcast_to(strike, isc.shape).ravel(),
+                         'annual_reference_revenue': np.broadcast_to(reference, isc.shape).ravel(),
+                         'annual_strike_revenue': np.broadcast_to(strike_revenues, isc.shape).ravel(),
+                         'isc': isc.ravel()}, index=index).reset_index()
+
+## The surface over duration and one cost parameter, the other two held at the grid values closest
+## to the NREL defaults; this is what the heatmap shows.
+
+def surface_slice(surface, parameter, capacity=None):
+    keep = surface['capacity_mw'] == (surface['capacity_mw'].iloc[0] if capacity is None else capacity)
+    for other in COST_PARAMETERS:
+        if other != parameter:
+            values = surface[other].unique()
+            keep &= surface[other] == values[np.abs(values - DEFAULTS[other]).argmin()]
+    return surface[keep]
+
+## start..stop inclusive
+
+def value_grid(start, stop, step):
+    return np.arange(start, stop + step / 2, step).round(10).tolist()
+
+## '200-280:20' -> 200, 220, ..., 280; '379.16' -> [379.16]; '10,15,20' -> [10, 15, 20]
+
+def parse_values(text):
+    values = []
+    for part in text.split(','):
+        span, _, step = part.partition(':')
+        start, _, stop = span.partition('-')
+        if stop:
+            values.extend(value_grid(float(start), float(stop), float(step or 1)))
+        else:
+            values.append(float(start))
+    return values
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Index Storage Credits over a grid of battery cost curves and payback periods.')
+    parser.add_argument('--durations', default=f'1-{reap.MAX_DURATION}', help="hours (default 1-20)")
+    parser.add_argument('--slopes', default=str(pipeline.CAPEX_SLOPE), help="capital cost slope in $/kW per hour, e.g. '200-280:20'")
+    parser.add_argument('--intercepts', default=str(pipeline.CAPEX_INTERCEPT), help="capital cost intercept in $/kW, e.g. '300-450:50'")
+    parser.add_argument('--paybacks', default=str(pipeline.PAYBACK_YEARS), help="payback years, e.g. '10-20:5'")
+    parser.add_argument('--capacities', default='100', help="MW, e.g. '50,100'")
+    pipeline.add_model_arguments(parser)
+    parser.add_argument('--out', default='cone_sensitivity.csv', help='.csv or .parquet output path')
+    parser.add_argument('--heatmap', help='also write an ISC heatmap (.html) over duration and --heatmap-parameter')
+    parser.add_argument('--heatmap-parameter', choices=COST_PARAMETERS, default='payback_years')
+    args = parser.parse_args(argv)
+
+    durations = sweep.parse_grid(args.durations)
+    pipeline.check_durations(parser, durations)
+    paybacks = parse_values(args.paybacks)
+    if min(paybacks) <= 0:
+        parser.error('payback periods must be more than 0 years')
+
+    cores = reference_cores(durations, mode=args.mode, efficiency=args.efficiency, outlier_rule=args.outliers)
+    surface = isc_surface(cores, parse_values(args.slopes), parse_values(args.intercepts),
+                          paybacks, parse_values(args.capacities))
+    pipeline.write_table(surface, args.out)
+    if args.heatmap:
+        from bess_isc import figures
+        figures.isc_heatmap(surface_slice(surface, args.heatmap_parameter), args.heatmap_parameter).save(args.heatmap)
+    variants = len(surface) // len(pipeline.HUB_ZONES)
+    print(f'{variants} variants, {len(surface)} rows -> {args.out}', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+## Site screening: which hub zone each candidate battery site falls in, with that hub zone's test
+## year reference price, annual reference revenues and Index Storage Credit for the site's battery.
+##
+##   python -m bess_isc.sites candidates.csv --duration 4 --capacity 100 --out screened.csv
+##
+## The hub zone polygons and the NON_ERCOT polygon come from the cached geometry artifact. An R-tree
+## (shapely's STRtree) over them answers the point-in-polygon test for the whole batch in one bulk
+## query, so a queue of 100k sites screens in a second or two. Sites outside every hub zone, in a
+## non-ERCOT county or outside Texas, are labelled non-ERCOT and get no revenues.
+
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from bess_isc import dispatch, geometry, instrument, outliers, pipeline
+
+NON_ERCOT = 'non-ERCOT'
+
+## Hub zone code (HOU..WEST, or geometry.NON_ERCOT) for every (lon, lat) in EPSG:4326.
+
+def hub_zone_codes(lon, lat, zones=None):
+    zones = geometry.load_hub_zones() if zones is None else zones
+    with instrument.span('site_lookup', rows=len(lon)):
+        points = shapely.points(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        tree = shapely.STRtree(zones.geometry.values)
+        site, zone = tree.query(points, predicate='intersects')
+
+        ## a site on a shared border matches both zones; the first in HUB_ZONE_CODES order wins
+        order = np.lexsort((zone, site))
+        site, zone = site[order], zone[order]
+        first = np.r_[True, site[1:] != site[:-1]] if len(site) else np.zeros(0, dtype=bool)
+
+        codes = np.full(len(points), geometry.NON_ERCOT, dtype=object)
+        codes[site[first]] = zones['hub zone'].values[zone[first]]
+        return codes
+
+## sites is a DataFrame with longitude / latitude columns (and optionally a capacity column in MW;
+## otherwise every site gets `capacity`). Revenues are linear in capacity, so they are computed
+## once per MW and scaled per site.
+
+def screen_sites(sites, duration, capacity=100, lon='longitude', lat='latitude', capacity_col=None,
+                 manifest=None, mode='REAP', efficiency=dispatch.EFFICIENCY, outlier_rule=outliers.DEFAULT_RULE, zones=None):
+    codes = hub_zone_codes(sites[lon].values, sites[lat].values, zones)
+    core = pipeline.reference_prices(duration, manifest, mode=mode, efficiency=efficiency, outlier_rule=outlier_rule)
+    per_mw = pipeline.revenue_tables(core, 1)[1]
+
+    ## index into HUB_ZONES order, -1 (the appended NaN) for non-ERCOT sites
+    zone = pd.Index(geometry.HUB_ZONE_CODES).get_indexer(codes)
+    def per_zone(values):
+        return np.append(np.asarray(values, dtype=float), np.nan)[zone]
+
+    mw = sites[capacity_col].to_numpy(dtype=float) if capacity_col else np.full(len(sites), float(capacity))
+    return sites.assign(hub_zone=np.append(pipeline.HUB_ZONES, NON_ERCOT)[zone],
+                        duration_h=duration,
+                        capacity_mw=mw,
+                        reference_price=per_zone(core['RP_df_test_year'].mean().values),
+                        annual_reference_revenue=per_zone(per_mw.loc['Annual Reference Revenues ($)'].values) * mw,
+                        index_storage_credit=per_zone(per_mw.loc['Index Storage Credits (Incentives Needed)'].values) * mw)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Assign candidate battery sites to ERCOT hub zones and attach their revenues and ISCs.')
+    parser.add_argument('sites', help='CSV with one row per site')
+    parser.add_argument('--lon', default='longitude', help='longitude column (default longitude)')
+    parser.add_argument('--lat', default='latitude', help='latitude column (default latitude)')
+    parser.add_argument('--duration', type=int, default=4)
+    parser.add_argument('--capacity', type=float, default=100, help='MW for every site, unless --capacity-col is given')
+    parser.add_argument('--capacity-col', help='per-site capacity column in MW')
+    pipeline.add_model_arguments(parser)
+    parser.add_argument('--out', default='sites_by_hub_zone.csv', help='.csv or .parquet output path')
+    args = parser.parse_args(argv)
+    pipeline.check_durations(parser, [args.duration])
+
+    sites = pd.read_csv(args.sites)
+    missing = [col for col in (args.lon, args.lat, args.capacity_col) if col and col not in sites.columns]
+    if missing:
+        parser.error(f'{args.sites} has no column(s) {", ".join(missing)}')
+
+    screened = screen_sites(sites, args.duration, args.capacity, args.lon, args.lat, args.capacity_col,
+                            mode=args.mode, efficiency=args.efficiency, outlier_rule=args.outliers)
+    pipeline.write_table(screened, args.out)
+    counts = screened['hub_zone'].value_counts()
+    print(', '.join(f'{hz}: {n}' for hz, n in counts.items()) + f' -> {args.out}', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+## Columnar price store for the ERCOT DAM hub and capacity price drops.
+##
+## The raw drops are ingested once into memory-mappable .npy files under ercot_data/store/ and
+## every run afterwards only slices the settlement points and months it needs. Two kinds of
+## drop are picked up from ercot_data/:
+##
+##   DAM_Hub_Prices_{year}.xlsx, DAM_CapPrices{year}.csv          annual files (NP4-180 / NP4-181)
+##   daily/DAM_Hub_Prices_{yyyymmdd}.csv, daily/DAM_CapPrices_{yyyymmdd}.csv
+##                                                               daily extracts with the same
+##                                                               columns, for years that have no
+##                                                               annual file yet
+##
+## The store is partitioned by (kind, year, month), which is also the unit of every downstream
+## aggregate (REAP and RCP are monthly), so a new day only re-ingests its own month:
+##   dam_{year}_{mm}_price.npy  float64 settlement point prices, sorted by settlement point then hour
+##   dam_{year}_{mm}_hour.npy   datetime64[h] hour keys (hour beginning) in the same order
+##   cap_{year}_{mm}_price.npy  float64 (hours x products) DAM capacity prices, one column per
+##                              CAP_PRODUCTS entry whatever the drop's header ('REGUP ' with its
+##                              trailing space, no ECRS before June 2023: NaN)
+##   cap_{year}_{mm}_hour.npy   datetime64[h] hour keys for the capacity prices
+## The repeated hour of a DST fall-back day shares its hour key with the hour before it; rows are
+## ordered by hour key and then Repeated Hour Flag, so hub and capacity prices of the same month
+## line up row for row.
+## manifest.json is the catalog of what is ingested: size, mtime and sha256 of every source file
+## (files whose size and mtime are unchanged are not re-hashed) and, per partition, the sources it
+## was built from, the settlement point categories with their offset ranges and the product names.
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bess_isc import instrument
+
+DATA_DIR = Path(__file__).resolve().parent.parent / 'ercot_data'
+STORE_DIR = DATA_DIR / 'store'
+STORE_VERSION = 3
+DAILY_DIR = 'daily'
+RT_DIR = 'rt'
+
+MONTHS = ['Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec']
+HUBS = ['HB_HOUSTON','HB_NORTH','HB_PAN','HB_SOUTH','HB_WEST']
+CAP_PRODUCTS = ['REGDN','REGUP','RRS','NSPIN','ECRS']
+
+KINDS = {'DAM_Hub_Prices': 'dam', 'DAM_CapPrices': 'cap'}
+ANNUAL_FILE = re.compile(r'(DAM_Hub_Prices)_(\d{4})\.xlsx|(DAM_CapPrices)(\d{4})\.csv')
+DAILY_FILE = re.compile(r'(DAM_Hub_Prices|DAM_CapPrices)_(\d{4})(\d{2})\d{2}\.csv')
+
+## {(kind, year, month): [source files]} for every drop under data_dir. An annual file covers all
+## twelve months of its year; daily extracts (in date order) fill the years it does not cover.
+
+def catalog(data_dir=DATA_DIR):
+    data_dir = Path(data_dir)
+    parts = {}
+    annual = set()
+    for path in sorted(data_dir.iterdir()):
+        match = ANNUAL_FILE.fullmatch(path.name)
+        if match:
+            kind, year = KINDS[match[1] or match[3]], int(match[2] or match[4])
+            annual.add((kind, year))
+            for month in range(1, 13):
+                parts[(kind, year, month)] = [path]
+    if (data_dir / DAILY_DIR).is_dir():
+        for path in sorted((data_dir / DAILY_DIR).iterdir()):
+            match = DAILY_FILE.fullmatch(path.name)
+            if match and (KINDS[match[1]], int(match[2])) not in annual:
+                parts.setdefault((KINDS[match[1]], int(match[2]), int(match[3])), []).append(path)
+    return parts
+
+def partition_id(kind, year, month):
+    return f'{kind}_{year}_{month:02d}'
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+## Cheap fingerprint of the raw drops under ercot_data/, ercot_data/daily/ and ercot_data/rt/ (names,
+## sizes and mtimes, not contents), for cache keys that must change as soon as a file is added or replaced.
+
+def dataset_fingerprint(data_dir=DATA_DIR):
+    h = hashlib.sha256()
+    for folder in (Path(data_dir), Path(data_dir) / DAILY_DIR, Path(data_dir) / RT_DIR):
+        if not folder.is_dir():
+            continue
+        for path in sorted(folder.iterdir()):
+            if path.is_file() and not path.name.startswith('.'):
+                stat = path.stat()
+                h.update(f'{path.relative_to(data_dir).as_posix()}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return h.hexdigest()[:16]
+
+## ERCOT files carry 'MM/DD/YYYY' delivery dates and '01:00'..'24:00' hour endings.
+## The hour key is the hour beginning; DST repeated hours share a key and keep file order.
+
+def hour_keys(df):
+    dates = pd.to_datetime(df['Delivery Date'], format='%m/%d/%Y').values.astype('datetime64[D]')
+    hour_ending = df['Hour Ending'].str.slice(0, 2).astype(int).values
+    return dates.astype('datetime64[h]') + (hour_ending - 1).astype('timedelta64[h]')
+
+def repeated_hours(df):
+    if 'Repeated Hour Flag' not in df:
+        return np.zeros(len(df), dtype=bool)
+    return (df['Repeated Hour Flag'].astype(str).str.strip() == 'Y').values
+
+def _save(path, array):
+    tmp = path.with_name(path.stem + '.tmp.npy')
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+## Month frames of one group of source files: an annual file is parsed once for all the months
+## asked for, daily extracts are concatenated (they all belong to one month).
+
+def read_months(paths, months):
+    if paths[0].suffix == '.xlsx':
+        sheets = pd.read_excel(paths[0], sheet_name=[MONTHS[month - 1] for month in months])
+        return {month: sheets[MONTHS[month - 1]] for month in months}
+    df = pd.concat([pd.read_csv(path, dtype={'Delivery Date': str, 'Hour Ending': str}) for path in paths],
+                   ignore_index=True)
+    month_of_row = df['Delivery Date'].str.slice(0, 2).astype(int)
+    return {month: df[month_of_row.values == month].reset_index(drop=True) for month in months}
+
+def write_dam(pid, dam, store_dir):
+    points = pd.Categorical(dam['Settlement Point'])
+    hours = hour_keys(dam)
+    order = np.lexsort((repeated_hours(dam), hours, points.codes))
+    offsets = np.searchsorted(points.codes[order], np.arange(len(points.categories) + 1))
+    _save(store_dir / f'{pid}_price.npy', dam['Settlement Point Price'].values.astype(np.float64)[order])
+    _save(store_dir / f'{pid}_hour.npy', hours[order])
+    return {'points': list(points.categories), 'offsets': offsets.tolist(), 'rows': len(dam)}
+
+## Product columns are normalised once here ('REGUP ' -> 'REGUP') and laid out as CAP_PRODUCTS,
+## followed by any product ERCOT adds later.
+
+def write_cap(pid, cap, store_dir):
+    cap = cap.rename(columns=lambda col: col.strip())
+    extra = [c for c in cap.columns if c not in CAP_PRODUCTS + ['Delivery Date','Hour Ending','Repeated Hour Flag']]
+    products = CAP_PRODUCTS + extra
+    hours = hour_keys(cap)
+    order = np.lexsort((repeated_hours(cap), hours))
+    _save(store_dir / f'{pid}_price.npy', cap.reindex(columns=products).values.astype(np.float64)[order])
+    _save(store_dir / f'{pid}_hour.npy', hours[order])
+    return {'products': products, 'rows': len(cap)}
+
+WRITERS = {'dam': write_dam, 'cap': write_cap}
+
+## (Re)build the given partitions, grouped so each source file is read once.
+
+def ingest(parts, sources, store_dir=STORE_DIR):
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    groups = {}
+    for (kind, year, month), paths in parts.items():
+        groups.setdefault((kind, tuple(paths)), []).append((year, month))
+    entries = {}
+    for (kind, paths), year_months in groups.items():
+        frames = read_months(list(paths), [month for _, month in year_months])
+        for year, month in year_months:
+            pid = partition_id(kind, year, month)
+            entries[pid] = WRITERS[kind](pid, frames[month], store_dir)
+            entries[pid]['sources'] = {name: sources[name]['sha256'] for name in map(source_name, paths)}
+    return entries
+
+def source_name(path):
+    path = Path(path)
+    return path.name if path.parent.name != DAILY_DIR else f'{DAILY_DIR}/{path.name}'
+
+## Size, mtime and sha256 of a source file; the hash is reused while size and mtime are unchanged.
+
+def source_entry(path, known=None):
+    stat = Path(path).stat()
+    if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+        return known
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_sha256(path)}
+
+def empty_manifest():
+    return {'version': STORE_VERSION, 'sources': {}, 'partitions': {}}
+
+def read_manifest(store_dir=STORE_DIR):
+    path = Path(store_dir) / 'manifest.json'
+    if not path.exists():
+        return empty_manifest()
+    manifest = json.loads(path.read_text())
+    if manifest.get('version') != STORE_VERSION:
+        return empty_manifest()
+    return manifest
+
+def write_manifest(manifest, store_dir=STORE_DIR):
+    path = Path(store_dir) / 'manifest.json'
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(manifest, indent=1))
+    os.replace(tmp, path)
+
+## Years with at least one ingested partition, in order.
+
+def years(manifest):
+    return sorted({int(pid.split('_')[1]) for pid in manifest['partitions']})
+
+## Bring the store in line with the catalog: ingest partitions that are new or whose sources
+## changed, drop partitions whose sources are gone, and return the manifest. A refresh after a
+## new daily extract reads and writes only that extract's month.
+
+def ensure_store(data_dir=DATA_DIR, store_dir=STORE_DIR):
+    store_dir = Path(store_dir)
+    with instrument.span('load') as s:
+        manifest = read_manifest(store_dir)
+        parts = catalog(data_dir)
+        sources = {}
+        for paths in parts.values():
+            for path in paths:
+                name = source_name(path)
+                if name not in sources:
+                    sources[name] = source_entry(path, manifest['sources'].get(name))
+
+        stale = {}
+        for key, paths in parts.items():
+            entry = manifest['partitions'].get(partition_id(*key))
+            if entry is None or entry['sources'] != {name: sources[name]['sha256'] for name in map(source_name, paths)}:
+                stale[key] = paths
+        current = {partition_id(*key) for key in parts}
+        removed = [pid for pid in manifest['partitions'] if pid not in current]
+
+        if stale:
+            with instrument.span('ingest', partitions=len(stale)) as ingest_span:
+                entries = ingest(stale, sources, store_dir)
+                ingest_span['rows'] = sum(entry['rows'] for entry in entries.values())
+            manifest['partitions'].update(entries)
+        for pid in removed:
+            del manifest['partitions'][pid]
+            for suffix in ('price', 'hour'):
+                (store_dir / f'{pid}_{suffix}.npy').unlink(missing_ok=True)
+        if stale or removed or sources != manifest['sources']:
+            manifest['sources'] = sources
+            manifest['partitions'] = dict(sorted(manifest['partitions'].items()))
+            write_manifest(manifest, store_dir)
+        s['rows'] = sum(entry['rows'] for entry in manifest['partitions'].values())
+    return manifest
+
+def _load(store_dir, name):
+    return np.load(Path(store_dir) / name, mmap_mode='r')
+
+## Hourly prices for the requested settlement points of one year (or some of its months),
+## sliced from the memory-mapped month partitions and concatenated in time order.
+
+def load_hub_prices(manifest, year, points=HUBS, store_dir=STORE_DIR, months=range(1, 13)):
+    pieces = {point: ([], []) for point in points}
+    for month in months:
+        pid = partition_id('dam', year, month)
+        entry = manifest['partitions'].get(pid)
+        if entry is None:
+            continue
+        price = _load(store_dir, f'{pid}_price.npy')
+        hour = _load(store_dir, f'{pid}_hour.npy')
+        for point in points:
+            if point not in entry['points']:
+                raise ValueError(f'no {point} prices in {pid}')
+            i = entry['points'].index(point)
+            start, stop = entry['offsets'][i], entry['offsets'][i + 1]
+            pieces[point][0].append(hour[start:stop])
+            pieces[point][1].append(price[start:stop])
+    return {point: (np.concatenate(hours) if hours else np.empty(0, 'datetime64[h]'),
+                    np.concatenate(prices) if prices else np.empty(0))
+            for point, (hours, prices) in pieces.items()}
+
+## Hour keys plus a (points x hours) price matrix; every settlement point of a month shares the
+## same hours, so each month partition is one gather of equal-length runs out of the memory map,
+## however many points are asked for. This is what lets REAP run over all of them in one batch.
+
+def load_hub_matrix(manifest, year, points=HUBS, store_dir=STORE_DIR, months=range(1, 13)):
+    with instrument.span('hub_split', year=year) as s:
+        hour_parts, price_parts = [], []
+        for month in months:
+            pid = partition_id('dam', year, month)
+            entry = manifest['partitions'].get(pid)
+            if entry is None:
+                continue
+            missing = [point for point in points if point not in entry['points']]
+            if missing:
+                raise ValueError(f'no {missing[0]} prices in {pid}')
+            offsets = np.asarray(entry['offsets'])
+            index = np.array([entry['points'].index(point) for point in points])
+            starts, lengths = offsets[index], offsets[index + 1] - offsets[index]
+            if (lengths != lengths[0]).any():
+                raise ValueError(f'settlement point hours do not line up in {pid}')
+            rows = starts[:, None] + np.arange(lengths[0])
+            hours = _load(store_dir, f'{pid}_hour.npy')[rows]
+            if (hours != hours[0]).any():
+                raise ValueError(f'settlement point hours do not line up in {pid}')
+            hour_parts.append(hours[0])
+            price_parts.append(_load(store_dir, f'{pid}_price.npy')[rows])
+        hours = np.concatenate(hour_parts) if hour_parts else np.empty(0, 'datetime64[h]')
+        prices = np.concatenate(price_parts, axis=1) if price_parts else np.empty((len(points), 0))
+        s['rows'] = prices.size
+        return hours, prices
+
+## Every settlement point in the store (hubs, hub averages, load zones, ...), in code order.
+
+def settlement_points(manifest):
+    return sorted({point for pid, entry in manifest['partitions'].items() if pid.startswith('dam_')
+                   for point in entry['points']})
+
+def load_cap_prices(manifest, year, store_dir=STORE_DIR, months=range(1, 13)):
+    frames = []
+    for month in months:
+        pid = partition_id('cap', year, month)
+        entry = manifest['partitions'].get(pid)
+        if entry is None:
+            continue
+        price = np.array(_load(store_dir, f'{pid}_price.npy'))
+        hour = np.array(_load(store_dir, f'{pid}_hour.npy'))
+        frames.append(pd.DataFrame(price, columns=entry['products'],
+                                   index=pd.DatetimeIndex(hour.astype('datetime64[D]'), name='Delivery Date')))
+    return pd.concat(frames) if len(frames) > 1 else frames[0]
+
+## Hourly capacity prices of a year as (products x hours), rows in CAP_PRODUCTS order (or the
+## given products), with their hour keys; NaN where a product was not traded.
+
+def load_cap_matrix(manifest, year, products=CAP_PRODUCTS, store_dir=STORE_DIR, months=range(1, 13)):
+    hour_parts, price_parts = [], []
+    for month in months:
+        pid = partition_id('cap', year, month)
+        entry = manifest['partitions'].get(pid)
+        if entry is None:
+            continue
+        columns = [entry['products'].index(product) for product in products]
+        hour_parts.append(_load(store_dir, f'{pid}_hour.npy'))
+        price_parts.append(_load(store_dir, f'{pid}_price.npy')[:, columns].T)
+    hours = np.concatenate(hour_parts) if hour_parts else np.empty(0, 'datetime64[h]')
+    prices = np.concatenate(price_parts, axis=1) if price_parts else np.empty((len(products), 0))
+    return hours, prices
+
+## Monthly aggregate tables (year x month x cell) kept next to the store, e.g. the REAP table.
+## A cell is recomputed only when the sources of its partition changed, so a refresh after a new
+## day of data costs one month of compute. key identifies everything else the cells depend on
+## (settlement points, durations); a different key, or rebuild=True, recomputes every cell.
+## kind may also be a list of kinds, for cells that need the partitions of several (all present).
+
+def monthly_table(name, manifest, kind, cell_shape, compute, key=None, stage=None, store_dir=STORE_DIR, rebuild=False):
+    kinds = [kind] if isinstance(kind, str) else list(kind)
+    store_dir = Path(store_dir)
+    table_years = years(manifest)
+    meta_path = store_dir / f'{name}.json'
+    old_meta = old_table = None
+    if not rebuild and meta_path.exists():
+        old_meta = json.loads(meta_path.read_text())
+        if old_meta.get('key') == key and (store_dir / f'{name}.npy').exists():
+            old_table = np.load(store_dir / f'{name}.npy')
+        if old_table is None or old_table.shape[2:] != tuple(cell_shape):
+            old_meta = old_table = None
+
+    table = np.full((len(table_years), 12, *cell_shape), np.nan)
+    sources = {}
+    computed = 0
+    for i, year in enumerate(table_years):
+        for month in range(1, 13):
+            entries = {pid: manifest['partitions'].get(pid) for pid in (partition_id(k, year, month) for k in kinds)}
+            if None in entries.values():
+                continue
+            sources.update({pid: entry['sources'] for pid, entry in entries.items()})
+            if old_meta is not None and all(old_meta['sources'].get(pid) == entry['sources'] for pid, entry in entries.items()):
+                table[i, month - 1] = old_table[old_meta['years'].index(year), month - 1]
+            else:
+                with instrument.span(stage or name, year=year, month=month, rows=sum(entry['rows'] for entry in entries.values())):
+                    table[i, month - 1] = compute(year, month)
+                computed += 1
+
+    meta = {'key': key, 'years': table_years, 'sources': sources}
+    if computed or meta != old_meta:
+        store_dir.mkdir(parents=True, exist_ok=True)
+        _save(store_dir / f'{name}.npy', table)
+        tmp = meta_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(meta, indent=1))
+        os.replace(tmp, meta_path)
+    return table
+
+if __name__ == '__main__':
+    before = read_manifest()['partitions']
+    manifest = ensure_store()
+    refreshed = [pid for pid, entry in manifest['partitions'].items() if before.get(pid) != entry]
+    print(f"{len(refreshed)} partitions ingested{': ' + ', '.join(refreshed) if refreshed else ''}")
+    for year in years(manifest):
+        dam = [entry for pid, entry in manifest['partitions'].items() if pid.startswith(f'dam_{year}_')]
+        points = sorted({point for entry in dam for point in entry['points']})
+        print(f"{year}: {len(dam)} months, {len(points)} settlement points, {sum(entry['rows'] for entry in dam)} rows")
@@ -0,0 +1,98 @@
+## Headless batch sweep of Index Storage Credits over a duration x capacity grid.
+##
+##   python -m bess_isc.sweep --durations 1-20 --capacities 10-1000:10 --out isc_sweep.csv
+##
+## The price store, REAP table and capacity prices are loaded once in the parent process and
+## handed to the worker pool as initializer arguments; with the fork start method the workers
+## share those arrays copy-on-write instead of receiving pickled copies. Each worker takes one
+## duration (the expensive, capacity-independent part) and then runs every capacity through the
+## linear revenue layer. Output is one tidy table, one row per (duration, capacity, hub zone).
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from bess_isc import dispatch, outliers, pipeline, store
+
+_shared = {}
+
+def _init(manifest, reap_table, rcps, outlier_rule=outliers.DEFAULT_RULE, mode='REAP', efficiency=dispatch.EFFICIENCY):
+    _shared.update(manifest=manifest, reap_table=reap_table, rcps=rcps, outlier_rule=outlier_rule, mode=mode, efficiency=efficiency)
+
+def load_shared(mode='REAP', efficiency=dispatch.EFFICIENCY):
+    manifest = store.ensure_store()
+    return manifest, pipeline.arbitrage_table(manifest, mode, efficiency), pipeline.reference_capacity_prices(manifest)
+
+## Tidy rows for one total_revenues_df.
+
+def isc_rows(total_revenues_df, duration, capacity, strike_price):
+    return [{'duration_h': duration,
+             'capacity_mw': capacity,
+             'hub_zone': hz,
+             'strike_price_per_mwh': strike_price,
+             'annual_reference_revenue': total_revenues_df[f'{hz} Hub Zone'].iloc[0],
+             'annual_strike_revenue': total_revenues_df[f'{hz} Hub Zone'].iloc[1],
+             'isc': total_revenues_df[f'{hz} Hub Zone'].iloc[2]}
+            for hz in pipeline.HUB_ZONES]
+
+def sweep_duration(duration, capacities):
+    core = pipeline.reference_prices(duration, _shared['manifest'], _shared['reap_table'], _shared['rcps'],
+                                     mode=_shared['mode'], efficiency=_shared['efficiency'], outlier_rule=_shared['outlier_rule'])
+    rows = []
+    for capacity in capacities:
+        total_revenues_df = pipeline.revenue_tables(core, capacity)[1]
+        rows.extend(isc_rows(total_revenues_df, duration, capacity, core['strike_price']))
+    return rows
+
+def sweep(durations, capacities, workers=None, mode='REAP', efficiency=dispatch.EFFICIENCY, outlier_rule=outliers.DEFAULT_RULE):
+    shared = (*load_shared(mode, efficiency), outlier_rule, mode, efficiency)
+    workers = min(workers or os.cpu_count() or 1, len(durations))
+    if workers <= 1:
+        _init(*shared)
+        results = [sweep_duration(duration, capacities) for duration in durations]
+    else:
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method),
+                                 initializer=_init, initargs=shared) as pool:
+            results = list(pool.map(sweep_duration, durations, [capacities] * len(durations)))
+    return pd.DataFrame([row for rows in results for row in rows])
+
+## '1-20' -> 1..20, '10-1000:10' -> 10, 20, ..., 1000, '4,8,12' -> [4, 8, 12]
+
+def parse_grid(text):
+    values = []
+    for part in text.split(','):
+        span, _, step = part.partition(':')
+        start, _, stop = span.partition('-')
+        if stop:
+            values.extend(range(int(start), int(stop) + 1, int(step or 1)))
+        else:
+            values.append(int(start))
+    return values
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sweep Index Storage Credits over a duration x capacity grid.')
+    parser.add_argument('--durations', default='1-20', help="hours, e.g. '1-20' or '2,4,8' (default 1-20)")
+    parser.add_argument('--capacities', default='10-1000:10', help="MW, e.g. '10-1000:10' or '50,100' (default 10-1000:10)")
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    pipeline.add_model_arguments(parser)
+    parser.add_argument('--out', default='isc_sweep.csv', help='.csv or .parquet output path')
+    args = parser.parse_args(argv)
+
+    durations = parse_grid(args.durations)
+    capacities = parse_grid(args.capacities)
+    pipeline.check_durations(parser, durations)
+
+    start = time.perf_counter()
+    df = sweep(durations, capacities, args.workers, args.mode, args.efficiency, args.outliers)
+    pipeline.write_table(df, args.out)
+    print(f'{len(durations) * len(capacities)} scenarios, {len(df)} rows -> {args.out} '
+          f'in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+## Test years over other windows of years: any span of years, or every trailing N-year window.
+##
+##   python -m bess_isc.windows --duration 4 --capacity 100 --windows 2022-2024,trailing:1,trailing:2
+##
+## The outlier adjustment uses every year in the store, so it does not depend on the window. Once
+## the adjusted (year x hub zone x month) reference prices are summed cumulatively over years,
+## the test year of any contiguous span is one subtraction and one division. Comparing dozens of
+## windows costs no REAP and no reference prices beyond the one core per duration. A year with a
+## missing month (NaN) drops out of that month's mean, as np.nanmean would.
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from bess_isc import pipeline, store
+
+## Cumulative sums and counts of the finite prices over years, with a leading zero row:
+## sums[j] - sums[i] covers the years i..j-1.
+
+def prefix_sums(RP):
+    finite = np.isfinite(RP)
+    zero = np.zeros((1,) + RP.shape[1:])
+    sums = np.concatenate([zero, np.cumsum(np.where(finite, RP, 0.0), axis=0)])
+    counts = np.concatenate([zero, np.cumsum(finite, axis=0)])
+    return sums, counts
+
+## Test years of the year index spans [starts, stops), (windows, hub zones, 12).
+
+def window_means(sums, counts, starts, stops):
+    total, n = sums[stops] - sums[starts], counts[stops] - counts[starts]
+    return np.divide(total, n, out=np.full(total.shape, np.nan), where=n > 0)
+
+## The adjusted reference prices of a reference_prices core as one (year, hub zone, 12) array.
+
+def adjusted_array(core):
+    return np.stack([RP_df.values.T for RP_df in core['RP_dfs_adjusted'].values()])
+
+## '2022-2024' (inclusive), '2023' and 'trailing:N' (every N-year window of consecutive years) ->
+## [(label, first year, last year)], in the order given and each span once.
+
+def parse_windows(text, years):
+    windows = []
+    for part in filter(None, (part.strip() for part in text.split(','))):
+        if part.startswith('trailing:'):
+            n = int(part.partition(':')[2])
+            if not 1 <= n <= len(years):
+                raise ValueError(f'trailing windows need 1 to {len(years)} years, not {n}')
+            windows.extend((f'{years[i - n + 1]}-{years[i]}' if n > 1 else str(years[i]), years[i - n + 1], years[i])
+                           for i in range(n - 1, len(years)))
+        else:
+            first, _, last = part.partition('-')
+            first, last = int(first), int(last or first)
+            if first not in years or last not in years or last < first:
+                raise ValueError(f'window {part!r} is not a span of store years ({years[0]}-{years[-1]})')
+            windows.append((f'{first}-{last}' if last > first else str(first), first, last))
+    return list(dict.fromkeys(windows))
+
+## Tidy ISCs per (window, hub zone) for one duration's core and a capacity, with the test year
+## reference price (annual mean) and the revenues behind each ISC.
+
+def window_iscs(core, windows, capacity):
+    years = list(core['RP_dfs_adjusted'])
+    sums, counts = prefix_sums(adjusted_array(core))
+    starts = np.array([years.index(first) for _, first, _ in windows], dtype=int)
+    stops = np.array([years.index(last) + 1 for _, _, last in windows], dtype=int)
+    test_years = window_means(sums, counts, starts, stops)
+
+    duration = core['duration']
+    energy = capacity * duration
+    periods = pipeline.periods_per_month(duration)
+    reference = (test_years * energy * periods).sum(axis=-1)
+    strike = sum(core['strike_price'] * energy * periods)
+    n_hubs = test_years.shape[1]
+    return pd.DataFrame({'window': np.repeat([label for label, _, _ in windows], n_hubs),
+                         'first_year': np.repeat([first for _, first, _ in windows], n_hubs),
+                         'last_year': np.repeat([last for _, _, last in windows], n_hubs),
+                         'duration_h': duration,
+                         'capacity_mw': capacity,
+                         'hub_zone': np.tile([col.replace(' Reference Price', '') for col in core['RP_df_test_year'].columns], len(windows)),
+                         'test_year_reference_price': test_years.mean(axis=-1).ravel(),
+                         'annual_reference_revenue': reference.ravel(),
+                         'annual_strike_revenue': strike,
+                         'isc': (strike - reference).ravel()})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Index Storage Credits with the test year taken over other windows of years.')
+    parser.add_argument('--duration', type=int, default=4)
+    parser.add_argument('--capacity', type=float, default=100)
+    parser.add_argument('--windows', default='trailing:1,trailing:2,trailing:3',
+                        help="comma separated '2022-2024', '2023' or 'trailing:N' (default trailing:1,trailing:2,trailing:3)")
+    pipeline.add_model_arguments(parser)
+    parser.add_argument('--out', help='also write the table to this .csv or .parquet path')
+    args = parser.parse_args(argv)
+    pipeline.check_durations(parser, [args.duration])
+
+    manifest = store.ensure_store()
+    try:
+        windows = parse_windows(args.windows, store.years(manifest))
+    except ValueError as e:
+        parser.error(str(e))
+    core = pipeline.reference_prices(args.duration, manifest, mode=args.mode, efficiency=args.efficiency, outlier_rule=args.outliers)
+    df = window_iscs(core, windows, args.capacity)
+    with pd.option_context('display.width', 120):
+        print(df.pivot(index='window', columns='hub_zone', values='isc').loc[list(dict.fromkeys(df['window']))]
+              .to_string(float_format=lambda x: f'{x:,.0f}'))
+    if args.out:
+        pipeline.write_table(df, args.out)
+
+if __name__ == '__main__':
+    main()